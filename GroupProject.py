@@ -1,13 +1,14 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.offline as py
-import plotly.graph_objs as go
-import plotly.express as px
+import os
+import time
+
 import streamlit as st
-import numpy as np
 
-color = sns.color_palette()
+import filters
+import instrument
+import risk
+import snapshot
+from charts import FIG3_BAND
+from figcache import filtered_chart, plotly_chart
 
 # Set the Streamlit app theme to 'wide'
 st.set_page_config(layout="wide")
@@ -24,286 +25,55 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-# Read the CSV file into a DataFrame
-df1 = pd.read_csv('healthcare-dataset-stroke-data.csv')
-df2 = pd.read_csv('Stroke data Malaysian.csv')
-df3 = pd.read_csv('aa.csv')
-
-# Chart 1
-
-# Filter out the "children" and "never_worked" categories from the 'work_type' attribute
-filtered_data = df1[(df1['work_type'] != 'children') & (df1['work_type'] != 'Never_worked')]
-
-# Group the filtered data by 'work_type' and 'residence_type' and calculate the sum of 'stroke' occurrences
-grouped_data = filtered_data.groupby(['work_type', 'Residence_type'])['stroke'].sum().unstack()
-
-# Sort the grouped data by stroke occurrences in descending order
-sorted_data = grouped_data.sum(axis=1).sort_values(ascending=False)
-
-# Reorder the rows in the grouped data based on the sorted data
-grouped_data = grouped_data.loc[sorted_data.index]
-
-# Define the colors for the chart
-rural_color = '#FC7676'
-urban_color = '#722F37'
-other_color_rural = 'lightgray'  # Grey color for rural bars
-other_color_urban = 'darkgrey'  # Grey color for urban bars
-
-# Find the maximum stroke cases for rural and urban areas
-max_rural_cases = grouped_data.loc[:, 'Rural'].max()
-max_urban_cases = grouped_data.loc[:, 'Urban'].max()
-
-# Create the chart bars
-bars = []
-for col in grouped_data.columns:
-    bar_color = [
-        rural_color if (x == max_rural_cases and col == 'Rural') else
-        urban_color if (x == max_urban_cases and col == 'Urban') else
-        other_color_rural if col == 'Rural' else
-        other_color_urban
-        for x in grouped_data[col]
-    ]
-
-    bars.append(go.Bar(
-        x=grouped_data.index,
-        y=grouped_data[col],
-        name=col,
-        marker=dict(color=bar_color)
-    ))
-
-fig1 = go.Figure(data=bars)
-
-fig1.update_layout(
-    paper_bgcolor='#262730',  # Set the background color of the chart
-    plot_bgcolor='rgba(0, 0, 0, 0)'  # Set the background color of the plot area to transparent
-)
-
-fig1.update_layout(
-    title={
-        'text': 'Which Residence Type has the Most Stroke Cases by Work Type?',
-        'font': {'size': 24},
-        'x': 0.5,
-        'y': 0.95,
-        'xanchor': 'center',
-        'yanchor': 'top'
-    },
-    xaxis_title='Work Type',
-    yaxis_title='Number of Stroke Cases',
-    legend=dict(title='Residence Type'),
-)
-
-# Chart 2
-
-# Filter the data for stroke occurrences
-stroke_data = df1[df1['stroke'] == 1]
-
-# Count the stroke occurrences by marital status
-marital_status_counts = stroke_data['ever_married'].value_counts()
-
-# Extract the values from the Series
-values = marital_status_counts.values
-
-# Define the colors for the pie slices
-colors = ['#FC7676', '#722F37']
-
-fig2 = go.Figure(data=[go.Pie(labels=None, values=marital_status_counts.values)])
-
-fig2.update_layout(
-    paper_bgcolor='#262730',  # Set the background color of the chart
-    plot_bgcolor='rgba(0, 0, 0, 0)'  # Set the background color of the plot area to transparent
-)
-
-fig2.update_layout(
-    title={
-        'text': 'Distribution of Stroke Cases by Marital Status',
-        'font': {'size': 24},
-        'x': 0.5,
-        'y': 0.95,
-        'xanchor': 'center',
-        'yanchor': 'top'
-    },
-)
-
-# Set the legend labels
-legend_labels = ['Married', 'Not Married']
-fig2.update_traces(
-    hoverinfo='label+percent',
-    textfont_size=12,
-    marker=dict(colors=colors),
-    labels=legend_labels,
-    automargin=True  # Use 'automargin' instead of 'itemSizing'
-)
-
-# Add the legend
-fig2.update_layout(
-    legend=dict(
-        title='Marital Status'
-    )
-)
-
-# Chart 3
-
-# Filter the data to include only BMI values up to 60
-filtered_data = df1[df1['bmi'] <= 60]
-
-# Calculate the average of avg_glucose_level for each bmi value
-averages = filtered_data.groupby('bmi')['avg_glucose_level'].mean()
-
-# Create a bar plot of the averages
-fig3 = go.Figure(data=[go.Scatter(x=averages.index, y=averages.values, mode='markers', marker=dict(symbol='circle', size=8, color='#D23B5F'))])
-
-fig3.update_layout(
-    paper_bgcolor='#262730',  # Set the background color of the chart
-    plot_bgcolor='rgba(0, 0, 0, 0)'  # Set the background color of the plot area to transparent
-)
-
-fig3.update_layout(
-    title='Did BMI affect the Average Glucose Level?',
-    xaxis_title='Body Mass Index',
-    yaxis_title='Average Glucose Level',
-    legend=dict(title=None),
-    font=dict(
-        color='white'
-    )
-)
-
-fig3.update_xaxes(tickfont=dict(color='white'))
-fig3.update_yaxes(tickfont=dict(color='white'))
-
-# Chart 4
-
-# Define the desired order for stress levels
-stress_level_order = ['Rarely', 'Sometimes', 'Always']
-
-# Specify the desired order for gender
-gender_order = ['Male', 'Female']
-
-# Convert stress level to a categorical data type with the specified order
-df2['stress_level'] = pd.Categorical(df2['stress_level'], categories=stress_level_order, ordered=True)
-
-# Count the occurrences of each combination of stress level and gender
-grouped_df = df2.groupby(['stress_level', 'gender']).size().reset_index(name='total')
-
-# Create line charts for each gender
-fig4 = go.Figure()
-for gender in gender_order:
-    filtered_df = grouped_df[grouped_df['gender'] == gender]
-    if gender == 'Male':
-        color = '#722F37'  # Set color for male
-    elif gender == 'Female':
-        color = '#FC7676'  # Set color for female
-    fig4.add_trace(go.Scatter(x=filtered_df['stress_level'], y=filtered_df['total'], name=gender, line=dict(color=color)))
-
-fig4.update_layout(
-    paper_bgcolor='#262730',  # Set the background color of the chart
-    plot_bgcolor='rgba(0, 0, 0, 0)'  # Set the background color of the plot area to transparent
-)
-
-# Set chart title and axis labels
-fig4.update_layout(
-    title={
-        'text': 'How Does Gender Influence Stress Levels?',
-        'font': {'size': 24},
-        'x': 0.5,
-        'y': 0.95,
-        'xanchor': 'center',
-        'yanchor': 'top'
-    },
-    xaxis_title='Stress Level',
-    yaxis_title='Total',
-    legend=dict(title='Gender')
-)
-
-# Chart 5
-
-# Group the data by sugary_intake and gender, and calculate the mean of exercise_duration
-grouped_data = df2.groupby(['sugary_intake', 'gender'])['exercise_duration'].mean().unstack()
-
-# Define the colors for the bars
-colors = []
-
-for intake in grouped_data.index:
-    if intake in ['1-2 times', '5-6 times', '7-8 times']:
-        colors.extend(['grey', 'lightgrey'])
-    elif intake == '3-4 times':
-        colors.extend(['red', '#FF7276'])
-
-fig5 = go.Figure()
-
-for i, col in enumerate(grouped_data.columns):
-    fig5.add_trace(go.Bar(
-        x=grouped_data.index,
-        y=grouped_data[col],
-        name=col,
-        marker=dict(color=colors[i::len(grouped_data.columns)])  # Set the color for each bar
-    ))
-
-fig5.update_layout(
-    paper_bgcolor='#262730',  # Set the background color of the chart
-    plot_bgcolor='rgba(0, 0, 0, 0)'  # Set the background color of the plot area to transparent
-)
-
-fig5.update_layout(
-    title='Which gender and how much sugar intake has the highest average exercise per week?',
-    xaxis_title='Sugary Intake in Week',
-    yaxis_title='Average Exercise in Week',
-    barmode='stack',
-    legend=dict(title='Gender')
-)
-fig5.update_xaxes(tickfont=dict(color='white'))
-fig5.update_yaxes(tickfont=dict(color='white'))
-
-# Chart 6
-
-years = df3['year'].unique()
-states = df3['NEGERI'].unique()
-
-cases_total = {}
-
-# Calculate the total cases for each state
-for state in states:
-    case = df3[df3['NEGERI'] == state]['case'].sum()
-    cases_total[state] = case
-
-# Sort the states based on the total number of cases in descending order
-sorted_states = sorted(cases_total, key=cases_total.get, reverse=True)
-
-cases = []
-
-# Iterate over the years
-for year in years:
-    # Filter the data for each year
-    year_data = df3[df3['year'] == year]
+# Time the stages of this rerun when profiling is turned on, either for every
+# session (DASHBOARD_PROFILE=1) or for this one (?profile=1 in the URL)
+profiling = instrument.ENABLED or st.query_params.get('profile') == '1'
+instrument.start_rerun(profiling)
+
+# Charts are prepared in the background; every rerun draws the latest ready set
+snap = snapshot.current()
+
+
+# Every chart, with its own controls, and the what-if form are drawn by
+# fragments: changing one of their widgets reruns only that fragment and
+# sends only what it draws, instead of rerunning the whole page.
+# DASHBOARD_FRAGMENTS=0 turns this off (e.g. to measure the difference).
+if os.environ.get('DASHBOARD_FRAGMENTS', '1') != '0':
+    fragment = st.fragment
+else:
+    fragment = lambda func: func
+
+# Labels of the fig3 error bars (see charts.FIG3_BAND)
+FIG3_BAND_LABELS = {
+    'none': 'None',
+    'std': 'Standard deviation',
+    'iqr': '25th to 75th percentile',
+    'p10_p90': '10th to 90th percentile',
+}
+
+
+# Draw a chart. The stroke charts (1-3) are restricted to the rows picked in
+# the sidebar filters; without any filter or other option, the ready chart of
+# the snapshot is used.
+@fragment
+def chart(chart_id, row_filters=()):
+    options = {}
+    if chart_id == 'fig3':
+        band = st.selectbox('Spread of glucose levels', list(FIG3_BAND_LABELS), list(FIG3_BAND_LABELS).index(FIG3_BAND),
+                            format_func=FIG3_BAND_LABELS.get, key='fig3_band')
+        if band != FIG3_BAND:
+            options['band'] = band
+    if row_filters:
+        filtered_chart(chart_id, row_filters, **options)
+    elif options:
+        plotly_chart(chart_id, **options)
+    else:
+        snap.plotly_chart(chart_id)
+
+
+def stroke_chart(chart_id):
+    chart(chart_id, stroke_filters)
 
-    # Get the cases for each state in the sorted order
-    cases_year = [year_data[year_data['NEGERI'] == state]['case'].sum() for state in sorted_states]
-    cases.append(cases_year)
-
-colors = ['#FF9696', 'red', 'darkred']
-
-fig6 = go.Figure()
-
-for i, year in enumerate(years):
-    fig6.add_trace(go.Scatter(
-        x=sorted_states,
-        y=cases[i],
-        mode='lines',
-        stackgroup='one',
-        name=str(year),
-        line=dict(color=colors[i])
-    ))
-
-fig6.update_layout(
-    paper_bgcolor='#262730',  # Set the background color of the chart
-    plot_bgcolor='rgba(0, 0, 0, 0)'  # Set the background color of the plot area to transparent
-)
-
-fig6.update_layout(
-    title='How Do Stroke Cases Evolve Over Time in Different States?',
-    xaxis_title='State',
-    yaxis_title='Number of Cases',
-    showlegend=True
-)
 
 # Define the page layout for Dashboard 1
 def dashboard1():
@@ -316,7 +86,7 @@ def dashboard1():
     
     # Display the first figure and its description
     with col1:
-        st.plotly_chart(fig1)
+        stroke_chart('fig1')
     with col2:
         st.markdown("""
                     <div><p style='font-size: 20px;text-align: justify;'>Private jobs have been associated with a higher 
@@ -335,7 +105,7 @@ def dashboard1():
         st.write("")
         st.write("")
         st.write("")
-        st.plotly_chart(fig2)
+        stroke_chart('fig2')
     with col2:
         st.write("")
         st.write("")
@@ -359,7 +129,7 @@ def dashboard1():
         st.write("")
         st.write("")
         st.write("")
-        st.plotly_chart(fig4)
+        chart('fig4')
     with col2:
         st.write("")
         st.write("")
@@ -453,7 +223,7 @@ def dashboard2():
        st.write("")
        st.write("")
        st.write("")
-       st.plotly_chart(fig3)
+       stroke_chart('fig3')
        
     with col1:
        st.write("")
@@ -493,7 +263,7 @@ def dashboard2():
        st.write("")
        st.write("")
        st.write("")
-       st.plotly_chart(fig5)
+       chart('fig5')
 
     # Add a line
     st.markdown("<hr style='border: 1px solid #ddd;'>", unsafe_allow_html=True)
@@ -534,7 +304,7 @@ def dashboard3():
     with col1:
         st.write("")
         st.write("")
-        st.plotly_chart(fig1)
+        stroke_chart('fig1')
     with col2:
         st.markdown("")
         st.markdown("""
@@ -555,7 +325,7 @@ def dashboard3():
         st.write("")
         st.write("")
         st.write("")
-        st.plotly_chart(fig6)
+        chart('fig6')
     with col2:
         st.write("")
         st.write("")
@@ -593,10 +363,73 @@ def dashboard3():
 # Create a select box to switch between dashboards
 dashboard_selection = st.sidebar.selectbox('Select Dashboard', ('Stroke Analysis and Risk Factors', 'Health Metrics and Lifestyle Analysis', 'Stroke Analysis by Geographic Distribution'))
 
+# Filters for the stroke charts, answered from indexes over the dataset. The
+# index is built off the rerun; until the first one is ready the stroke charts
+# show every patient.
+stroke_filters = ()
+stroke_index = filters.latest_filter_index() if filters.available() else None
+if stroke_index is not None:
+    index = stroke_index[1]
+    yes_no = {0: 'No', 1: 'Yes'}.get
+    age_low, age_high = index.bounds('age')
+    with st.sidebar.expander('Filter stroke data'):
+        selections = {
+            'gender': st.multiselect('Gender', index.values['gender'], index.values['gender']),
+            'age': st.slider('Age', age_low, age_high, (age_low, age_high)),
+            'hypertension': st.multiselect('Hypertension', index.values['hypertension'], index.values['hypertension'], format_func=yes_no),
+            'heart_disease': st.multiselect('Heart disease', index.values['heart_disease'], index.values['heart_disease'], format_func=yes_no),
+            'smoking_status': st.multiselect('Smoking status', index.values['smoking_status'], index.values['smoking_status']),
+            'Residence_type': st.multiselect('Residence type', index.values['Residence_type'], index.values['Residence_type']),
+        }
+    stroke_filters = index.normalize(selections)
+elif filters.available():
+    with st.sidebar.expander('Filter stroke data'):
+        st.caption('The filters are being prepared; the charts show every patient until then.')
+
+# What-if stroke risk of one patient, from the snapshot's model of the stroke
+# dataset. The form only reruns its fragment when submitted; answers are kept
+# per profile.
+@fragment
+def what_if():
+    model = snap.risk[1]
+    with st.form('what_if'):
+        yes_no = {0: 'No', 1: 'Yes'}.get
+        profile = {
+            'gender': st.selectbox('Gender', model.levels['gender']),
+            'age': st.number_input('Age', 0.0, 120.0, 50.0, step=1.0),
+            'hypertension': st.selectbox('Hypertension', [0, 1], format_func=yes_no),
+            'heart_disease': st.selectbox('Heart disease', [0, 1], format_func=yes_no),
+            'ever_married': st.selectbox('Ever married', model.levels['ever_married']),
+            'work_type': st.selectbox('Work type', model.levels['work_type']),
+            'Residence_type': st.selectbox('Residence type', model.levels['Residence_type']),
+            'avg_glucose_level': st.number_input('Average glucose level', 40.0, 400.0, 100.0),
+            'bmi': st.number_input('BMI', 10.0, 100.0, 28.0),
+            'smoking_status': st.selectbox('Smoking status', model.levels['smoking_status']),
+        }
+        st.form_submit_button('Estimate risk')
+    stroke_risk, percentile = risk.what_if(profile, snap.risk)
+    st.metric('Estimated stroke risk', '%.1f%%' % (100 * stroke_risk))
+    st.caption('Higher than for %.0f%% of the patients in the dataset' % percentile)
+
+
+with st.sidebar.expander('Stroke risk what-if'):
+    what_if()
+
 # Show the selected dashboard based on the selection
-if dashboard_selection == 'Stroke Analysis and Risk Factors':
-    dashboard1()
-elif dashboard_selection == 'Health Metrics and Lifestyle Analysis':
-    dashboard2()
-elif dashboard_selection == 'Stroke Analysis by Geographic Distribution':
-    dashboard3()
+with instrument.stage('dashboard'):
+    if dashboard_selection == 'Stroke Analysis and Risk Factors':
+        dashboard1()
+    elif dashboard_selection == 'Health Metrics and Lifestyle Analysis':
+        dashboard2()
+    elif dashboard_selection == 'Stroke Analysis by Geographic Distribution':
+        dashboard3()
+
+# Show the recorded stages in the sidebar: this rerun's, and those of the
+# background build of the charts it drew (recorded with DASHBOARD_PROFILE=1)
+if profiling:
+    stages = instrument.finish_rerun()
+    with st.sidebar.expander('Performance'):
+        st.dataframe(stages, hide_index=True)
+        if snap.stages:
+            st.caption('Snapshot built %s' % time.strftime('%H:%M:%S', time.localtime(snap.built_at)))
+            st.dataframe(list(snap.stages), hide_index=True)
\ No newline at end of file
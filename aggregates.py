@@ -0,0 +1,291 @@
+import functools
+
+import numpy as np
+import pandas as pd
+
+import columnar
+import schema
+from data import (appended_rows, csv_partitions, data_path, dataset_version, is_streamed,
+                  read_csv_range, versioned_chunks, versioned_dataset)
+from instrument import stage
+from parallel import get_backend
+from sketches import batch_moments, batch_sketches, combine_moments, empty_moments, merge_moments, std
+from versioned import VersionedValue
+
+
+def _object_levels(index):
+    # The same MultiIndex with plain object levels instead of categoricals
+    return index.set_levels([level.astype(object) for level in index.levels])
+
+
+class StrokeCube:
+    # Small store of pre-aggregated stroke data. Patient rows are reduced to
+    # counts and sums per combination of the categorical columns, and to
+    # glucose sums per BMI bin, so the charts read a few hundred groups
+    # instead of scanning every patient. The spread of glucose levels is kept
+    # as mergeable moments (per BMI bin and per combination of the
+    # categorical columns) and quantile sketches (per BMI bin). New rows are
+    # folded in with append() without touching the rows already counted.
+
+    # Bumped whenever the cube's contents change, so saved cubes of older
+    # code are not loaded
+    FORMAT = 3
+
+    # Categorical columns the counts are broken down by
+    DIMENSIONS = ['gender', 'ever_married', 'work_type', 'Residence_type', 'smoking_status']
+
+    # BMI is recorded to one decimal, so bins of 0.1 keep every distinct value
+    BMI_BINS_PER_UNIT = 10
+
+    # Width of the glucose level bins of the BMI x glucose density grid
+    GLUCOSE_BIN_WIDTH = 5
+
+    # Columns of the patient rows the cube reads. Rows with an outlier BMI
+    # (see schema.py) are counted, but left out of the BMI tables.
+    COLUMNS = DIMENSIONS + ['stroke', 'bmi', 'avg_glucose_level', 'bmi_outlier']
+
+    def __init__(self):
+        # Patients and strokes per combination of DIMENSIONS
+        self.cells = pd.DataFrame(
+            {'rows': pd.Series(dtype='int64'), 'strokes': pd.Series(dtype='int64')},
+            index=pd.MultiIndex.from_arrays([[]] * len(self.DIMENSIONS), names=self.DIMENSIONS))
+        # Patients and summed glucose level per BMI bin
+        self.bmi = pd.DataFrame(
+            {'rows': pd.Series(dtype='int64'), 'glucose_sum': pd.Series(dtype='float64')},
+            index=pd.Index([], dtype='int64', name='bmi_bin'))
+        # Patients per BMI bin and glucose level bin
+        self.density = pd.Series(
+            dtype='int64', name='rows',
+            index=pd.MultiIndex.from_arrays([[], []], names=['bmi_bin', 'glucose_bin']))
+        # Glucose level moments (see sketches.py) per BMI bin and per
+        # combination of DIMENSIONS, and a quantile sketch per BMI bin
+        self.glucose = empty_moments(self.bmi.index)
+        self.cell_glucose = empty_moments(self.cells.index)
+        self.glucose_sketches = {}
+        self.rows = 0
+
+    @classmethod
+    def from_frame(cls, df1):
+        cube = cls()
+        cube.append(df1)
+        return cube
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        # Cube of a dataset read piece by piece; only one chunk and the
+        # (small) running totals are held in memory at a time
+        cube = cls()
+        for chunk in chunks:
+            cube.append(chunk)
+        return cube
+
+    def copy(self):
+        cube = StrokeCube()
+        cube.cells = self.cells.copy()
+        cube.bmi = self.bmi.copy()
+        cube.density = self.density.copy()
+        cube.glucose = self.glucose.copy()
+        cube.cell_glucose = self.cell_glucose.copy()
+        cube.glucose_sketches = {key: sketch.copy() for key, sketch in self.glucose_sketches.items()}
+        cube.rows = self.rows
+        return cube
+
+    def append(self, rows):
+        # Fold new patient rows into the cube
+        part = StrokeCube()
+        part.cells = rows.groupby(self.DIMENSIONS, observed=True)['stroke'].agg(['size', 'sum'])
+        part.cells.columns = ['rows', 'strokes']
+        part.cells.index = _object_levels(part.cells.index)
+
+        # Measurements may be stored as float32; sum them in float64
+        bmi_values = rows['bmi'].astype('float64')
+        glucose_values = rows['avg_glucose_level'].astype('float64')
+        part.cell_glucose = batch_moments(glucose_values, [rows[column] for column in self.DIMENSIONS])
+        part.cell_glucose.index = _object_levels(part.cell_glucose.index)
+
+        measures = pd.DataFrame({
+            'bmi_bin': np.rint(bmi_values * self.BMI_BINS_PER_UNIT),
+            'glucose_bin': np.floor(glucose_values / self.GLUCOSE_BIN_WIDTH),
+            'avg_glucose_level': glucose_values,
+        })[~rows['bmi_outlier'].to_numpy()].dropna().astype({'bmi_bin': 'int64', 'glucose_bin': 'int64'})
+        part.bmi = measures.groupby('bmi_bin')['avg_glucose_level'].agg(['size', 'sum'])
+        part.bmi.columns = ['rows', 'glucose_sum']
+        part.density = measures.groupby(['bmi_bin', 'glucose_bin']).size().rename('rows')
+        part.glucose = batch_moments(measures['avg_glucose_level'], measures['bmi_bin'])
+        part.glucose_sketches = batch_sketches(measures['avg_glucose_level'], measures['bmi_bin'])
+        part.rows = len(rows)
+
+        self.merge(part)
+
+    @classmethod
+    def from_parts(cls, cubes):
+        # Cube adding up the cubes of the parts of a dataset
+        cube = cls()
+        for part in cubes:
+            cube.merge(part)
+        return cube
+
+    def merge(self, other):
+        # Add the counts of another cube, e.g. one built from another part of
+        # the same dataset
+        self.cells = self.cells.add(other.cells, fill_value=0).astype({'rows': 'int64', 'strokes': 'int64'})
+        self.bmi = self.bmi.add(other.bmi, fill_value=0).astype({'rows': 'int64'})
+        self.density = self.density.add(other.density, fill_value=0).astype('int64')
+        self.glucose = merge_moments(self.glucose, other.glucose)
+        self.cell_glucose = merge_moments(self.cell_glucose, other.cell_glucose)
+        for key, sketch in other.glucose_sketches.items():
+            if key in self.glucose_sketches:
+                self.glucose_sketches[key].merge(sketch)
+            else:
+                self.glucose_sketches[key] = sketch.copy()
+        self.rows += other.rows
+
+    def stroke_counts(self, dimensions):
+        # Stroke cases per combination of the given dimensions
+        return self.cells.groupby(level=dimensions)['strokes'].sum()
+
+    def glucose_by_bmi(self):
+        # Average glucose level for each BMI value
+        bmi = self.bmi_bins()
+        return bmi['glucose_sum'] / bmi['rows']
+
+    def bmi_bins(self):
+        # Patients and summed glucose level per BMI value
+        bmi = self.bmi.copy()
+        bmi.index = bmi.index / self.BMI_BINS_PER_UNIT
+        bmi.index.name = 'bmi'
+        return bmi
+
+    def glucose_spread(self, bin_ids=None, quantiles=()):
+        # Patients, mean and standard deviation of the glucose level, plus the
+        # given quantiles, per BMI value. With bin_ids (one per BMI value, as
+        # from bmi_bins()), per bin instead.
+        glucose = self.glucose
+        if bin_ids is None:
+            keys = glucose.index.to_numpy()
+            spread = glucose.copy()
+        else:
+            keys = np.asarray(bin_ids)
+            spread = combine_moments(glucose, keys)
+        spread['std'] = std(spread)
+
+        if len(quantiles):
+            sketches = {}
+            for bmi_bin, key in zip(glucose.index, keys):
+                if key in sketches:
+                    sketches[key].merge(self.glucose_sketches[bmi_bin])
+                else:
+                    sketches[key] = self.glucose_sketches[bmi_bin].copy()
+            values = np.array([sketches[key].quantiles(quantiles) for key in spread.index]).reshape(len(spread), len(quantiles))
+            for i, q in enumerate(quantiles):
+                spread['q%g' % q] = values[:, i]
+
+        if bin_ids is None:
+            spread.index = spread.index / self.BMI_BINS_PER_UNIT
+            spread.index.name = 'bmi'
+        return spread
+
+    def glucose_by(self, dimensions):
+        # Patients, mean and standard deviation of the glucose level per
+        # combination of the given dimensions
+        keys = [self.cell_glucose.index.get_level_values(d) for d in dimensions]
+        spread = combine_moments(self.cell_glucose, keys)
+        spread['std'] = std(spread)
+        return spread
+
+    def bmi_glucose_density(self):
+        # Patients per (BMI value, glucose bin start)
+        density = self.density
+        return pd.DataFrame({
+            'bmi': density.index.get_level_values('bmi_bin') / self.BMI_BINS_PER_UNIT,
+            'glucose': density.index.get_level_values('glucose_bin') * self.GLUCOSE_BIN_WIDTH,
+            'rows': density.to_numpy(),
+        })
+
+
+def _partition_cube(task):
+    # Cube of one partition of the stroke dataset; runs on a backend worker
+    kind = task[0]
+    if kind == 'rows':
+        return StrokeCube.from_frame(task[1])
+    if kind == 'cache':
+        _, csv_path, meta, start, stop = task
+        return StrokeCube.from_frame(columnar.read_cache(csv_path, meta).iloc[start:stop])
+    _, csv_path, start, stop = task
+    return StrokeCube.from_chunks(read_csv_range('stroke', start, stop, path=csv_path))
+
+
+def build_stroke_cube(backend=None):
+    # Build the cube of the current stroke dataset, splitting the work across
+    # the backend's workers. Returns the dataset version and the cube.
+    backend = backend or get_backend()
+    if backend.workers == 1:
+        version, chunks = versioned_chunks('stroke')
+        return version, StrokeCube.from_chunks(chunks)
+
+    parts = 2 * backend.workers
+    path = data_path('stroke')
+    tasks = None
+    if not is_streamed('stroke'):
+        version, df1 = versioned_dataset('stroke')
+        bounds = np.linspace(0, len(df1), parts + 1).astype(int)
+        ranges = list(zip(bounds[:-1], bounds[1:]))
+        meta = columnar.read_meta(path)
+        if not backend.processes:
+            tasks = [('rows', df1.iloc[start:stop]) for start, stop in ranges]
+        elif meta is not None and meta['source']['hash'] == version:
+            # Workers map the same cache files instead of receiving copies
+            tasks = [('cache', path, meta, start, stop) for start, stop in ranges]
+    if tasks is None:
+        # Workers parse their own byte range of the CSV
+        version, ranges = csv_partitions('stroke', parts)
+        tasks = [('csv', path, start, stop) for start, stop in ranges]
+    return version, StrokeCube.from_parts(backend.map(_partition_cube, tasks))
+
+
+def _cube_file(version):
+    # Cubes of rows cleaned by an older schema are not loaded either
+    return columnar.pickle_file(data_path('stroke'), 'cube', version, schema.FORMAT, StrokeCube.FORMAT)
+
+
+def load_cube(version):
+    # The cube another process saved for this version of the stroke dataset,
+    # or None
+    return columnar.load_pickle(_cube_file(version))
+
+
+def save_cube(version, cube):
+    # Save the cube next to the columnar cache, so other processes serving
+    # the dashboards (see serve.py) load it instead of building it again
+    columnar.save_pickle(_cube_file(version), cube, 'cube')
+
+
+def _load_or_build_cube():
+    version = dataset_version('stroke')
+    with stage('load:stroke_cube'):
+        cube = load_cube(version)
+    if cube is None:
+        with stage('aggregate:stroke_cube') as record:
+            version, cube = build_stroke_cube()
+            record.rows = cube.rows
+        save_cube(version, cube)
+    return version, cube
+
+
+def _append_to_cube(version, cube, rows):
+    with stage('aggregate:stroke_cube_append', rows=len(rows)):
+        cube = cube.copy()
+        cube.append(rows)
+    save_cube(version, cube)
+    return cube
+
+
+# Cube of the stroke dataset, shared by every session
+_stroke_cube = VersionedValue(_load_or_build_cube, appended=functools.partial(appended_rows, 'stroke'),
+                              append=_append_to_cube)
+
+
+def stroke_cube():
+    # Cube for the current version of the stroke dataset. When rows were only
+    # appended to the file since the cube was built, just those rows are added.
+    return _stroke_cube.get()[1]
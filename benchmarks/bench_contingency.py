@@ -0,0 +1,90 @@
+"""Time to tabulate every pair of survey answers with the contingency engine and with groupby.
+
+    python benchmarks/bench_contingency.py --rows 10000 1000000
+    python benchmarks/bench_contingency.py --rows 1000000 --reads 100
+
+Synthetic survey answers (see synthetic.py) are generated in memory and
+cleaned like the app's own. For every row count, each pair of the survey's
+dimensions is tabulated once with SurveyTables (encoded once, one bincount per
+table) and once with a groupby per pair, as charts 4 and 5 used to. --reads
+repeats reading the tables of charts 4 and 5, which the engine answers from
+what it already counted.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+CHART_TABLES = [('stress_level', 'gender'), ('sugary_intake', 'gender')]
+
+
+def answers(rows, seed=0):
+    import data
+    import schema
+    from synthetic import CHUNK_ROWS, survey_chunk
+
+    rng = np.random.default_rng(seed)
+    chunks = [survey_chunk(rng, start, min(CHUNK_ROWS, rows - start)) for start in range(0, rows, CHUNK_ROWS)]
+    return schema.clean('survey', pd.concat(chunks, ignore_index=True).astype(data.DTYPES['survey']))[0]
+
+
+def with_groupby(df2, pairs):
+    # One crosstab and one table of means per pair, as the charts computed them
+    df2 = df2.assign(age_band=df2['age'] // 2 * 2)
+    for a, b in pairs:
+        df2.groupby([a, b], observed=True).size()
+        df2.groupby([a, b], observed=True)['exercise_duration'].mean()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 1_000_000])
+    parser.add_argument('--reads', type=int, default=20)
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    from contingency import SurveyTables
+
+    pairs = list(itertools.combinations(SurveyTables.DIMENSIONS, 2))
+    print('%d pairs of dimensions, %d reads of the chart tables' % (len(pairs), args.reads))
+    print('  %10s  %12s  %12s  %14s  %14s' % ('rows', 'engine', 'groupby', 'engine reads', 'groupby reads'))
+    results = []
+    for rows in args.rows:
+        df2 = answers(rows)
+        start = time.perf_counter()
+        tables = SurveyTables.from_frame(df2)
+        engine = time.perf_counter() - start
+        start = time.perf_counter()
+        with_groupby(df2, pairs)
+        groupby = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.reads):
+            for pair in CHART_TABLES:
+                tables.table(*pair).means('exercise_duration')
+        engine_reads = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(args.reads):
+            with_groupby(df2, CHART_TABLES)
+        groupby_reads = time.perf_counter() - start
+
+        results.append({'rows': rows, 'engine_seconds': engine, 'groupby_seconds': groupby,
+                        'engine_read_seconds': engine_reads, 'groupby_read_seconds': groupby_reads})
+        print('  %10d  %11.3fs  %11.3fs  %13.3fs  %13.3fs' % (rows, engine, groupby, engine_reads, groupby_reads))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
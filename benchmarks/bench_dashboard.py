@@ -0,0 +1,231 @@
+"""Headless benchmark of the dashboard app: rerun latency, memory and payload.
+
+    python benchmarks/bench_dashboard.py --rows 10000 100000 1000000
+    python benchmarks/bench_dashboard.py --rows 100000 --json results.json
+    python benchmarks/bench_dashboard.py --rows 100000 --baseline results.json
+
+For every row count, synthetic data is generated (see synthetic.py) and a
+fresh Python process runs the app with Streamlit's AppTest, without a
+browser. The app's charts are prepared by the background snapshot (see
+snapshot.py), so building the first snapshot (loading, aggregating, building
+and encoding every chart) is timed on its own, and the dashboards are then
+timed against the ready snapshot: on their first rerun in the session and on
+a repeated one. Then every stage behind the charts is timed on its own: CSV
+parse, columnar cache load, the aggregations, building each figure and
+encoding it to JSON. The report holds wall times, the process' peak RSS and
+the encoded size of each figure and dashboard. With --baseline, the run
+fails when a timing is slower than the baseline by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, 'GroupProject.py')
+
+PAGES = {
+    'dashboard1': 'Stroke Analysis and Risk Factors',
+    'dashboard2': 'Health Metrics and Lifestyle Analysis',
+    'dashboard3': 'Stroke Analysis by Geographic Distribution',
+}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+class Recorder:
+    def __init__(self):
+        self.stages = {}
+
+    def time(self, name, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.stages[name] = {
+            'seconds': time.perf_counter() - start,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        return result
+
+
+def build_snapshot(results):
+    # Build and publish the first snapshot, as the server does before it
+    # accepts viewers; the refresher keeps it up to date from then on
+    import snapshot
+
+    start = time.perf_counter()
+    snapshot.warm_up()
+    results['snapshot_seconds'] = time.perf_counter() - start
+    results['peak_rss_mb_after_snapshot'] = peak_rss_mb()
+
+
+def run_dashboards(results):
+    # Drive the app like a viewer switching between the three dashboards,
+    # against the ready snapshot
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP, default_timeout=3600)
+    dashboards = results['dashboards']
+    first = True
+    for visit in ('first', 'repeat'):
+        for name, label in PAGES.items():
+            start = time.perf_counter()
+            if first:
+                # The first run shows the default dashboard
+                app.run()
+                first = False
+            else:
+                app.sidebar.selectbox[0].select(label).run()
+            seconds = time.perf_counter() - start
+            if app.exception:
+                raise RuntimeError('%s failed: %s' % (name, app.exception[0].message))
+            stats = dashboards.setdefault(name, {})
+            stats[visit + '_seconds'] = seconds
+            stats['payload_bytes'] = sum(len(chart.proto.spec) for chart in app.get('plotly_chart'))
+        results['peak_rss_mb_after_' + visit] = peak_rss_mb()
+
+
+def run_stages(results):
+    # Time every stage behind the charts on its own, bypassing all caches
+    import plotly.io as pio
+
+    import columnar
+    import data
+    from aggregates import StrokeCube
+    from casestore import CaseStore
+    from charts import CHARTS
+    from contingency import SurveyTables
+
+    recorder = Recorder()
+    frames = {}
+    for name in data.DATA_FILES:
+        frames[name] = recorder.time('load_csv:' + name, data.read_dataset, name)
+        path = data.data_path(name)
+        meta = columnar.read_meta(path)
+        if meta is not None:
+            recorder.time('load_columnar:' + name, columnar.read_cache, path, meta)
+
+    inputs = {
+        'stroke': recorder.time('aggregate:stroke_cube', StrokeCube.from_frame, frames['stroke']),
+        'survey': recorder.time('aggregate:survey_tables', SurveyTables.from_frame, frames['survey']),
+        'cases': recorder.time('aggregate:case_store', CaseStore.from_frame, frames['cases']),
+    }
+
+    figure_bytes = {}
+    for chart_id, (dataset, _, builder) in CHARTS.items():
+        fig = recorder.time('build:' + chart_id, builder, inputs[dataset])
+        encoded = recorder.time('encode:' + chart_id, pio.to_json, fig, False)
+        figure_bytes[chart_id] = len(encoded)
+
+    results['stages'] = recorder.stages
+    results['figure_bytes'] = figure_bytes
+
+
+def worker(data_dir, rows):
+    # Runs in its own process so peak RSS belongs to this row count only
+    os.environ['STROKE_DATA_DIR'] = data_dir
+    sys.path.insert(0, ROOT)
+    results = {'rows': rows, 'dashboards': {}}
+    start = time.perf_counter()
+    build_snapshot(results)
+    run_dashboards(results)
+    run_stages(results)
+    results['total_seconds'] = time.perf_counter() - start
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def run(rows, data_dir=None):
+    # Benchmark one row count in a fresh process and return its results
+    with tempfile.TemporaryDirectory(prefix='stroke-bench-') as tmp:
+        if data_dir is None:
+            from synthetic import generate
+            data_dir = generate(tmp, rows)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker', data_dir, '--rows', str(rows)],
+            check=True, stdout=subprocess.PIPE, cwd=ROOT,
+        ).stdout
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def timings(results):
+    # Every timing of a run, flattened for printing and comparing
+    flat = {'snapshot': results['snapshot_seconds']}
+    for name, stats in results['dashboards'].items():
+        flat[name + ':first'] = stats['first_seconds']
+        flat[name + ':repeat'] = stats['repeat_seconds']
+    for name, stats in results['stages'].items():
+        flat[name] = stats['seconds']
+    return flat
+
+
+def report(results):
+    print('rows=%d  peak RSS %.1f MB  total %.2fs' % (results['rows'], results['peak_rss_mb'], results['total_seconds']))
+    print('  %-32s %8.3fs  peak RSS %8.1f MB' % ('snapshot', results['snapshot_seconds'],
+                                                results['peak_rss_mb_after_snapshot']))
+    for name, stats in results['dashboards'].items():
+        print('  %-32s first %7.3fs  repeat %7.3fs  payload %9d bytes' % (
+            name, stats['first_seconds'], stats['repeat_seconds'], stats['payload_bytes']))
+    for name, stats in results['stages'].items():
+        print('  %-32s %8.3fs  peak RSS %8.1f MB' % (name, stats['seconds'], stats['peak_rss_mb']))
+    for chart_id, size in results['figure_bytes'].items():
+        print('  %-32s %9d bytes' % ('json:' + chart_id, size))
+
+
+def regressions(results, baseline, tolerance):
+    # Timings slower than the baseline run with the same row count
+    same_rows = [run for run in baseline if run['rows'] == results['rows']]
+    if not same_rows:
+        return []
+    before = timings(same_rows[0])
+    slower = []
+    for name, seconds in timings(results).items():
+        # Ignore stages too short to time reliably
+        if name in before and seconds > before[name] * (1 + tolerance) and seconds - before[name] > 0.005:
+            slower.append('%s rows=%d: %.3fs -> %.3fs' % (name, results['rows'], before[name], seconds))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--data-dir', help='benchmark these CSVs instead of generated ones')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='results file of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline')
+    parser.add_argument('--worker', metavar='DATA_DIR', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.worker, args.rows[0])))
+        return
+
+    all_results = []
+    for rows in args.rows:
+        results = run(rows, args.data_dir)
+        report(results)
+        all_results.append(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(all_results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = [line for results in all_results for line in regressions(results, baseline, args.tolerance)]
+        if slower:
+            print('Slower than the baseline:')
+            print('\n'.join('  ' + line for line in slower))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Cost of one chart-control interaction with and without fragment reruns.
+
+    python benchmarks/bench_fragments.py --interactions 20
+    python benchmarks/bench_fragments.py --rows 1000000
+
+The app is started twice, with DASHBOARD_FRAGMENTS=0 (every widget change
+reruns the whole script) and =1 (each chart is a fragment). A client speaking
+Streamlit's websocket protocol opens the Health Metrics dashboard and then
+keeps changing the spread shown on the glucose/BMI chart, the way the browser
+does it, including the fragment id of the widget when it has one. Reported
+per interaction: rerun time until the script (or fragment) finished, the
+bytes of the messages the server sent, and how many elements they held.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, 'GroupProject.py')
+
+DASHBOARD = 'Health Metrics and Lifestyle Analysis'
+BAND_LABELS = ['Standard deviation', 'None']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_healthy(port, timeout=300):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen('http://127.0.0.1:%d/_stcore/health' % port, timeout=5) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError('the app did not come up within %ds' % timeout)
+            time.sleep(0.5)
+
+
+class Client:
+    # Just enough of the browser's side of the protocol to change widgets
+
+    def __init__(self, ws):
+        self.ws = ws
+        # widget label -> (widget id, id of the fragment drawing it or '')
+        self.widgets = {}
+        self.values = {}
+
+    async def rerun(self, fragment_id=''):
+        # Ask for a rerun and wait for it to finish: (seconds, bytes, elements)
+        request = BackMsg()
+        request.rerun_script.query_string = ''
+        request.rerun_script.fragment_id = fragment_id
+        for label, value in self.values.items():
+            widget = request.rerun_script.widget_states.widgets.add()
+            widget.id = self.widgets[label][0]
+            widget.string_value = value
+        start = time.perf_counter()
+        await self.ws.send(request.SerializeToString())
+        received = elements = 0
+        while True:
+            raw = await self.ws.recv()
+            received += len(raw)
+            message = ForwardMsg()
+            message.ParseFromString(raw)
+            kind = message.WhichOneof('type')
+            if kind == 'delta' and message.delta.WhichOneof('type') == 'new_element':
+                elements += 1
+                element = message.delta.new_element
+                if element.WhichOneof('type') == 'selectbox':
+                    self.widgets[element.selectbox.label] = (element.selectbox.id, message.delta.fragment_id)
+            elif kind == 'script_finished':
+                return time.perf_counter() - start, received, elements
+
+    async def change(self, label, value):
+        self.values[label] = value
+        return await self.rerun(self.widgets[label][1])
+
+
+async def interact(port, interactions):
+    url = 'ws://127.0.0.1:%d/_stcore/stream' % port
+    async with websockets.connect(url, subprotocols=['streamlit'], max_size=None) as ws:
+        client = Client(ws)
+        await client.rerun()
+        await client.change('Select Dashboard', DASHBOARD)
+        results = []
+        for i in range(interactions):
+            results.append(await client.change('Spread of glucose levels', BAND_LABELS[i % len(BAND_LABELS)]))
+        return results
+
+
+def run(fragments, interactions, data_dir):
+    port = free_port()
+    env = dict(os.environ, DASHBOARD_FRAGMENTS='1' if fragments else '0')
+    if data_dir:
+        env['STROKE_DATA_DIR'] = data_dir
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', APP, '--server.port', str(port),
+         '--server.address', '127.0.0.1', '--server.headless', 'true', '--browser.gatherUsageStats', 'false'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_healthy(port)
+        results = asyncio.run(interact(port, interactions))
+    finally:
+        server.terminate()
+        server.wait()
+    # The first change of each option builds its figure; time the rest
+    warm = results[len(BAND_LABELS):] or results
+    return {
+        'fragments': fragments,
+        'interactions': len(warm),
+        'median_seconds': statistics.median(seconds for seconds, _, _ in warm),
+        'bytes': statistics.median(size for _, size, _ in warm),
+        'elements': statistics.median(elements for _, _, elements in warm),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--interactions', type=int, default=20)
+    parser.add_argument('--rows', type=int, help='serve synthetic data with this many rows')
+    parser.add_argument('--data-dir', help='serve these CSVs instead of the app\'s own')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='stroke-fragments-') as tmp:
+        data_dir = args.data_dir
+        if data_dir is None and args.rows:
+            sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+            from synthetic import generate
+            data_dir = generate(tmp, args.rows)
+        results = [run(fragments, args.interactions, data_dir) for fragments in (False, True)]
+
+    print('  %-10s  %12s  %12s  %9s' % ('fragments', 'rerun', 'bytes sent', 'elements'))
+    for result in results:
+        print('  %-10s  %10.1fms  %12d  %9d' % (
+            'on' if result['fragments'] else 'off', 1000 * result['median_seconds'], result['bytes'], result['elements']))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
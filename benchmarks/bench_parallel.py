@@ -0,0 +1,112 @@
+"""Scaling of the chart data preparation with the backend and worker count.
+
+    python benchmarks/bench_parallel.py --rows 1000000
+    python benchmarks/bench_parallel.py --rows 1000000 --workers 1 2 4 8 --streamed
+
+For each backend (see parallel.py) and worker count, the stroke cube is
+built from scratch and all six charts are prepared the way a dashboard does
+it, with the per-dataset work running side by side. Every run happens in a
+fresh process so no cache carries over. With --streamed, the stroke file is
+aggregated straight from CSV byte ranges instead of the columnar cache.
+Speedups are relative to the serial backend.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def worker(data_dir, backend_name, workers, streamed):
+    # Runs in its own process with the backend chosen before anything is cached
+    os.environ['STROKE_DATA_DIR'] = data_dir
+    if streamed:
+        os.environ['STROKE_STREAM_BYTES'] = '0'
+    sys.path.insert(0, ROOT)
+    import data
+    import figcache
+    import parallel
+    from aggregates import build_stroke_cube
+
+    # Parse the CSVs and write the columnar caches up front, outside the timings
+    for name in data.DATA_FILES:
+        data.dataset_version(name)
+    backend = parallel.make_backend(backend_name, workers)
+    parallel.set_backend(backend)
+    # Start the pool's workers before timing
+    list(backend.map(abs, range(backend.workers)))
+
+    results = {}
+    start = time.perf_counter()
+    build_stroke_cube(backend)
+    results['stroke_cube'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chart_ids = list(figcache.CHARTS)
+    if backend.workers == 1:
+        for chart_id in chart_ids:
+            figcache.encoded_figure(chart_id)
+    else:
+        figcache.prefetch(chart_ids)
+    results['all_charts'] = time.perf_counter() - start
+    backend.close()
+    return results
+
+
+def run(data_dir, backend_name, workers, streamed):
+    command = [sys.executable, os.path.abspath(__file__), '--worker', data_dir, backend_name, str(workers)]
+    if streamed:
+        command.append('--streamed')
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, cwd=ROOT).stdout
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--data-dir', help='benchmark these CSVs instead of generated ones')
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument('--backends', nargs='+', default=['thread', 'process'])
+    parser.add_argument('--streamed', action='store_true', help='aggregate the stroke CSV without the columnar cache')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--worker', nargs=3, metavar=('DATA_DIR', 'BACKEND', 'WORKERS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        data_dir, backend_name, workers = args.worker
+        print(json.dumps(worker(data_dir, backend_name, int(workers), args.streamed)))
+        return
+
+    print('%d cores, %d rows%s' % (os.cpu_count() or 1, args.rows, ', streamed' if args.streamed else ''))
+    with tempfile.TemporaryDirectory(prefix='stroke-bench-') as tmp:
+        data_dir = args.data_dir
+        if data_dir is None:
+            from synthetic import generate
+            data_dir = generate(tmp, args.rows)
+
+        serial = run(data_dir, 'serial', 1, args.streamed)
+        all_results = [dict(serial, backend='serial', workers=1)]
+        for backend_name in args.backends:
+            for workers in args.workers:
+                results = run(data_dir, backend_name, workers, args.streamed)
+                all_results.append(dict(results, backend=backend_name, workers=workers))
+
+    print('  %-8s %7s  %12s %8s  %12s %8s' % ('backend', 'workers', 'stroke cube', 'speedup', 'all charts', 'speedup'))
+    for results in all_results:
+        print('  %-8s %7d  %11.3fs %7.2fx  %11.3fs %7.2fx' % (
+            results['backend'], results['workers'],
+            results['stroke_cube'], serial['stroke_cube'] / results['stroke_cube'],
+            results['all_charts'], serial['all_charts'] / results['all_charts'],
+        ))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(all_results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Throughput of the stroke risk model: fitting, batch scoring and what-if queries.
+
+    python benchmarks/bench_risk.py --rows 1000000 5000000
+    python benchmarks/bench_risk.py --rows 1000000 --batch-rows 100000 1000000
+
+Synthetic patient rows (see synthetic.py) are generated in memory with the
+same column types the app loads. The model is fitted on the first --fit-rows
+rows, then every row count is scored with every batch size and reported in
+rows per second. The what-if timings are for one profile scored the first
+time and then answered from the memo.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def patients(rows, seed=0):
+    import data
+    from synthetic import CHUNK_ROWS, stroke_chunk
+
+    rng = np.random.default_rng(seed)
+    chunks = [stroke_chunk(rng, start, min(CHUNK_ROWS, rows - start)) for start in range(0, rows, CHUNK_ROWS)]
+    return pd.concat(chunks, ignore_index=True).astype(data.DTYPES['stroke'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000])
+    parser.add_argument('--fit-rows', type=int, default=100_000)
+    parser.add_argument('--batch-rows', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    import risk
+
+    cohort = patients(max(args.rows + [args.fit_rows]))
+    start = time.perf_counter()
+    model = risk.RiskModel.fit(cohort.iloc[:args.fit_rows])
+    fit_seconds = time.perf_counter() - start
+    print('%d cores, fitted on %d rows in %.3fs' % (os.cpu_count() or 1, args.fit_rows, fit_seconds))
+
+    results = {'fit_rows': args.fit_rows, 'fit_seconds': fit_seconds, 'scoring': []}
+    print('  %10s  %10s  %9s  %12s' % ('rows', 'batch', 'seconds', 'rows/s'))
+    for rows in args.rows:
+        for batch_rows in args.batch_rows:
+            start = time.perf_counter()
+            model.score(cohort.iloc[:rows], batch_rows)
+            seconds = time.perf_counter() - start
+            results['scoring'].append({'rows': rows, 'batch_rows': batch_rows, 'seconds': seconds,
+                                       'rows_per_second': rows / seconds})
+            print('  %10d  %10d  %8.3fs  %12.0f' % (rows, batch_rows, seconds, rows / seconds))
+
+    # What-if queries go through the model of the app's own dataset
+    profile = {column: cohort[column].iloc[0] for column in risk.RiskModel.COLUMNS}
+    start = time.perf_counter()
+    risk.what_if(profile)
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    risk.what_if(profile)
+    repeated = time.perf_counter() - start
+    results['what_if_seconds'] = {'first': first, 'repeated': repeated}
+    print('what-if: %.2fms the first time, %.3fms repeated' % (1000 * first, 1000 * repeated))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
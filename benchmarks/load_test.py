@@ -0,0 +1,132 @@
+"""Load test of the multi-process serving mode: rerun throughput per worker count.
+
+    python benchmarks/load_test.py --workers 1 2 4 --clients 16 --seconds 20
+    python benchmarks/load_test.py --rows 100000 --workers 1 4
+
+For every worker count, serve.py is started on a free port and a number of
+simulated viewers connect to it through its proxy. Each viewer speaks
+Streamlit's websocket protocol like the browser does: it asks for a rerun of
+the app, waits until the script has finished and all charts have arrived,
+and asks again. The report gives reruns per second and rerun latencies.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVE = os.path.join(ROOT, 'serve.py')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_healthy(port, workers, timeout=300):
+    # Every worker answers the health check once it is up; the proxy hands
+    # consecutive requests to consecutive workers, so ask each of them
+    deadline = time.monotonic() + timeout
+    healthy = 0
+    while healthy < workers:
+        if time.monotonic() > deadline:
+            raise RuntimeError('serve.py did not come up within %ds' % timeout)
+        try:
+            with urllib.request.urlopen('http://127.0.0.1:%d/_stcore/health' % port, timeout=5) as response:
+                healthy += response.status == 200
+        except OSError:
+            healthy = 0
+            time.sleep(0.5)
+
+
+async def viewer(port, deadline, latencies):
+    # One simulated browser tab rerunning the app (at least once) until the deadline
+    url = 'ws://127.0.0.1:%d/_stcore/stream' % port
+    async with websockets.connect(url, subprotocols=['streamlit'], max_size=None) as ws:
+        reruns = 0
+        while reruns == 0 or time.monotonic() < deadline:
+            request = BackMsg()
+            request.rerun_script.query_string = ''
+            start = time.perf_counter()
+            await ws.send(request.SerializeToString())
+            while True:
+                message = ForwardMsg()
+                message.ParseFromString(await ws.recv())
+                if message.WhichOneof('type') == 'script_finished':
+                    break
+            latencies.append(time.perf_counter() - start)
+            reruns += 1
+
+
+async def load(port, clients, seconds):
+    latencies = []
+    deadline = time.monotonic() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(*(viewer(port, deadline, latencies) for _ in range(clients)))
+    return latencies, time.perf_counter() - start
+
+
+def run(workers, clients, seconds, data_dir):
+    port = free_port()
+    env = dict(os.environ, STROKE_DATA_DIR=data_dir) if data_dir else dict(os.environ)
+    server = subprocess.Popen(
+        [sys.executable, SERVE, '--workers', str(workers), '--port', str(port),
+         '--address', '127.0.0.1', '--worker-port', str(free_port() + 1000)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_healthy(port, workers)
+        # Warm every worker up once before measuring
+        asyncio.run(load(port, workers, 0))
+        latencies, elapsed = asyncio.run(load(port, clients, seconds))
+    finally:
+        server.terminate()
+        server.wait()
+    latencies.sort()
+    return {
+        'workers': workers,
+        'reruns': len(latencies),
+        'reruns_per_second': len(latencies) / elapsed,
+        'p50_seconds': statistics.median(latencies),
+        'p95_seconds': latencies[int(0.95 * (len(latencies) - 1))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument('--clients', type=int, default=16, help='simulated viewers')
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--rows', type=int, help='serve synthetic data with this many rows')
+    parser.add_argument('--data-dir', help='serve these CSVs instead of the app\'s own')
+    args = parser.parse_args()
+
+    print('%d cores, %d viewers, %gs per run' % (os.cpu_count() or 1, args.clients, args.seconds))
+    with tempfile.TemporaryDirectory(prefix='stroke-load-') as tmp:
+        data_dir = args.data_dir
+        if data_dir is None and args.rows:
+            from synthetic import generate
+            data_dir = generate(tmp, args.rows)
+
+        results = [run(workers, args.clients, args.seconds, data_dir) for workers in args.workers]
+
+    base = results[0]['reruns_per_second']
+    print('  %7s  %8s  %10s  %8s  %8s  %8s' % ('workers', 'reruns', 'reruns/s', 'scaling', 'p50', 'p95'))
+    for result in results:
+        print('  %7d  %8d  %10.1f  %7.2fx  %7.3fs  %7.3fs' % (
+            result['workers'], result['reruns'], result['reruns_per_second'],
+            result['reruns_per_second'] / base, result['p50_seconds'], result['p95_seconds']))
+
+
+if __name__ == '__main__':
+    main()
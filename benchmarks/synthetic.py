@@ -0,0 +1,119 @@
+"""Synthetic versions of the three dashboard CSVs at any row count.
+
+    python benchmarks/synthetic.py OUT_DIR --rows 1000000
+
+The files use the same names, columns and category values as the real ones,
+so the app can be pointed at them with STROKE_DATA_DIR=OUT_DIR.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Rows generated and written per step, which bounds memory use for big files
+CHUNK_ROWS = 1_000_000
+
+STATES = [
+    'WP Kuala Lumpur', 'Selangor', 'Johor', 'Kedah', 'Sabah', 'Sarawak', 'Perak',
+    'Pulau Pinang', 'Negeri Sembilan', 'Kelantan', 'Pahang', 'Terengganu',
+    'Melaka', 'Perlis', 'WP Putrajaya', 'WP Labuan',
+]
+
+
+def _choice(rng, values, p, size):
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=size, p=p)]
+
+
+def stroke_chunk(rng, start, size):
+    age = np.round(rng.uniform(0.08, 82, size), 0)
+    young = age < 2
+    age[young] = np.round(rng.uniform(0.08, 2, young.sum()), 2)
+
+    work_type = _choice(rng, ['Private', 'Self-employed', 'Govt_job', 'Never_worked'], [0.65, 0.19, 0.15, 0.01], size)
+    work_type[age < 16] = 'children'
+    ever_married = np.where((age > 25) & (rng.random(size) < 0.85), 'Yes', 'No')
+
+    hypertension = (rng.random(size) < 0.02 + age / 400).astype(int)
+    heart_disease = (rng.random(size) < 0.01 + age / 1000).astype(int)
+    glucose = np.round(np.clip(rng.lognormal(4.55, 0.35, size), 55, 272), 2)
+    bmi = np.round(np.clip(rng.normal(28.9, 7.8, size), 10.3, 97.6), 1)
+
+    risk = 1 / (1 + np.exp(-(-7.5 + 0.07 * age + 0.5 * hypertension + 0.4 * heart_disease)))
+    stroke = (rng.random(size) < risk).astype(int)
+
+    return pd.DataFrame({
+        'id': np.arange(start, start + size) + 1,
+        'gender': _choice(rng, ['Female', 'Male', 'Other'], [0.5858, 0.414, 0.0002], size),
+        'age': age,
+        'hypertension': hypertension,
+        'heart_disease': heart_disease,
+        'ever_married': ever_married,
+        'work_type': work_type,
+        'Residence_type': _choice(rng, ['Urban', 'Rural'], [0.51, 0.49], size),
+        'avg_glucose_level': glucose,
+        'bmi': bmi,
+        'smoking_status': _choice(rng, ['never smoked', 'Unknown', 'formerly smoked', 'smokes'], [0.37, 0.30, 0.18, 0.15], size),
+        'stroke': stroke,
+    })
+
+
+def survey_chunk(rng, start, size):
+    times = ['1-2 times', '3-4 times', '5-6 times', '7-8 times']
+    return pd.DataFrame({
+        'age': rng.integers(20, 27, size),
+        'gender': _choice(rng, ['Male', 'Female'], [0.4, 0.6], size),
+        'exercise_duration': rng.integers(0, 15, size),
+        'sleep_duration': _choice(rng, ['1 - 3 hours', '4 - 6 hours', '7 - 9 hours'], [0.05, 0.55, 0.40], size),
+        'sugary_intake': _choice(rng, times, [0.4, 0.35, 0.15, 0.1], size),
+        'junk_food': _choice(rng, times, [0.45, 0.35, 0.12, 0.08], size),
+        'stress_level': _choice(rng, ['Never', 'Rarely', 'Sometimes', 'Always'], [0.05, 0.25, 0.45, 0.25], size),
+        'family_history': _choice(rng, ['No', 'Yes'], [0.7, 0.3], size),
+    })
+
+
+def cases_chunk(rng, start, size, years=10):
+    # One row per facility and year, so rows beyond the first `years` add facilities
+    row = np.arange(start, start + size)
+    facility = row // years
+    state = facility % len(STATES)
+    return pd.DataFrame({
+        'year': 2015 + row % years,
+        'case': rng.integers(50, 2000, size),
+        'FASILITI': ['Hospital %d' % f for f in facility],
+        # The real file's header has a trailing space here as well
+        'BANDAR ': ['Bandar %d' % (f % 997) for f in facility],
+        'NEGERI': np.asarray(STATES, dtype=object)[state],
+    })
+
+
+GENERATORS = {
+    'healthcare-dataset-stroke-data.csv': stroke_chunk,
+    'Stroke data Malaysian.csv': survey_chunk,
+    'aa.csv': cases_chunk,
+}
+
+
+def generate(out_dir, rows, seed=0):
+    # Write all three CSVs with `rows` rows each into out_dir
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    for file_name, chunk in GENERATORS.items():
+        path = os.path.join(out_dir, file_name)
+        for start in range(0, rows, CHUNK_ROWS):
+            df = chunk(rng, start, min(CHUNK_ROWS, rows - start))
+            df.to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    return out_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('out_dir')
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate(args.out_dir, args.rows, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+import csv
+import functools
+
+import numpy as np
+import pandas as pd
+
+from data import appended_rows, data_path, dataset_version, versioned_dataset
+from instrument import stage
+from versioned import VersionedValue
+
+
+class CaseStore:
+    # Facility case counts (aa.csv) kept as a small time series store. Rows
+    # are summed per facility into partitions, one per (year, state), and
+    # rolled up per (year, state) and per (year, state, city). New
+    # submissions are folded in with append(), which only replaces the
+    # partitions and rollup entries they touch, so refreshing costs time in
+    # proportion to the new rows rather than to the whole history.
+
+    # Columns of the case rows the store reads
+    COLUMNS = ['year', 'case', 'FASILITI', 'BANDAR', 'NEGERI']
+
+    def __init__(self):
+        # (year, state) -> {(city, facility): cases}, summed over submissions
+        self.partitions = {}
+        # Rollups: (year, state) -> cases and (year, state, city) -> cases
+        self.state_totals = {}
+        self.city_totals = {}
+        # Years and states in the order they first appeared in the rows
+        self.years = []
+        self.states = []
+        self.rows = 0
+
+    @classmethod
+    def from_frame(cls, df3):
+        store = cls()
+        store.append(df3)
+        return store
+
+    def copy(self):
+        # Copies share the partitions until append() changes one of them
+        store = CaseStore()
+        store.partitions = dict(self.partitions)
+        store.state_totals = dict(self.state_totals)
+        store.city_totals = dict(self.city_totals)
+        store.years = list(self.years)
+        store.states = list(self.states)
+        store.rows = self.rows
+        return store
+
+    def append(self, rows):
+        # Fold new case rows into the store
+        for column, seen in (('year', self.years), ('NEGERI', self.states)):
+            known = set(seen)
+            for value in pd.unique(rows[column].dropna()):
+                if value not in known:
+                    seen.append(value)
+                    known.add(value)
+
+        # Rows with a missing year or state belong to no partition and are
+        # left out, like in the charts; a missing city or facility is None
+        rows = rows[rows['year'].notna() & rows['NEGERI'].notna()]
+        keys = [rows['year'], rows['NEGERI']] + [
+            rows[column].astype(object).where(rows[column].notna(), None) for column in ('BANDAR', 'FASILITI')]
+        facilities = rows['case'].groupby(keys, observed=True, dropna=False, sort=False).sum()
+
+        # Only the partitions and rollup entries of the new rows are touched.
+        # A partition may be shared with copies of the store, so it is copied
+        # before it is changed.
+        for (year, state), cases in facilities.groupby(level=[0, 1], sort=False):
+            partition = dict(self.partitions.get((year, state), {}))
+            new = zip(zip(cases.index.get_level_values(2).tolist(), cases.index.get_level_values(3).tolist()), cases.tolist())
+            if partition:
+                for key, value in new:
+                    partition[key] = partition.get(key, 0) + value
+            else:
+                partition.update(new)
+            self.partitions[(year, state)] = partition
+        for partition, cases in facilities.groupby(level=[0, 1], sort=False).sum().items():
+            self.state_totals[partition] = self.state_totals.get(partition, 0) + int(cases)
+        for city, cases in facilities.groupby(level=[0, 1, 2], dropna=False, sort=False).sum().items():
+            self.city_totals[city] = self.city_totals.get(city, 0) + int(cases)
+        self.rows += len(rows)
+
+    def state_year_matrix(self):
+        # Years, states and a (years x states) matrix of total cases. Years
+        # and states keep the order they first appeared in, then the states
+        # are sorted by their total number of cases in descending order
+        # (ties keep their original order).
+        year_codes = {year: i for i, year in enumerate(self.years)}
+        state_codes = {state: i for i, state in enumerate(self.states)}
+        matrix = np.zeros((len(self.years), len(self.states)), dtype=np.int64)
+        for (year, state), total in self.state_totals.items():
+            matrix[year_codes[year], state_codes[state]] = total
+        order = np.argsort(-matrix.sum(axis=0), kind='stable')
+        return list(self.years), [self.states[i] for i in order], matrix[:, order]
+
+    def city_cases(self, state=None):
+        # Total cases per (year, state, city), optionally of one state only
+        totals = pd.Series(self.city_totals, dtype='int64', name='case')
+        totals.index.names = ['year', 'NEGERI', 'BANDAR']
+        if state is not None:
+            totals = totals[totals.index.get_level_values('NEGERI') == state]
+        return totals
+
+    def facility_cases(self, state, year=None):
+        # Cases per facility of one state, one column per year; reads only
+        # that state's partitions
+        columns = {
+            part_year: pd.Series(cases, dtype='int64') for (part_year, part_state), cases in self.partitions.items()
+            if part_state == state and (year is None or part_year == year)
+        }
+        if not columns:
+            return pd.DataFrame(index=pd.MultiIndex.from_arrays([[], []], names=['BANDAR', 'FASILITI']))
+        facilities = pd.DataFrame(columns).fillna(0).astype('int64')
+        facilities.index.names = ['BANDAR', 'FASILITI']
+        return facilities
+
+
+def _build_store():
+    version, df3 = versioned_dataset('cases')
+    with stage('aggregate:case_store', rows=len(df3)):
+        return version, CaseStore.from_frame(df3)
+
+
+def _append_to_store(version, store, rows):
+    with stage('aggregate:case_store_append', rows=len(rows)):
+        store = store.copy()
+        store.append(rows)
+    return store
+
+
+# Store of the case dataset, shared by every session
+_case_store = VersionedValue(_build_store, appended=functools.partial(appended_rows, 'cases'),
+                             append=_append_to_store)
+
+
+def case_store():
+    # Store for the current version of the case dataset. When rows were only
+    # appended to the file since the store was built, just those rows are
+    # added.
+    return _case_store.get()[1]
+
+
+def append_cases(rows):
+    # Add new submissions (a frame with CaseStore.COLUMNS) to the end of
+    # aa.csv. The next case_store() call parses only the added bytes and
+    # updates only the partitions they touch.
+    path = data_path('cases')
+    header = pd.read_csv(path, nrows=0).columns
+    with open(path, 'rb') as f:
+        size = f.seek(0, 2)
+        if size:
+            f.seek(size - 1)
+        ends_with_newline = not size or f.read(1) == b'\n'
+    with open(path, 'a', newline='') as f:
+        if not ends_with_newline:
+            f.write('\r\n')
+        writer = csv.writer(f, lineterminator='\r\n')
+        writer.writerows(rows[[column.strip() for column in header]].itertuples(index=False, name=None))
+    return dataset_version('cases')
+
@@ -0,0 +1,416 @@
+import os
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+import plotly.graph_objs as go
+
+from downsample import binned_means, fixed_width_bins, lttb, quantile_bins
+from filters import filtered_cube
+from instrument import stage
+from schema import group
+from sources import dataset_version, get_source
+
+
+# Chart 1
+def build_fig1(cube):
+    # Sum of 'stroke' occurrences by 'work_type' and 'residence_type'
+    stroke_counts = cube.stroke_counts(['work_type', 'Residence_type'])
+
+    # Filter out the "children" and "never_worked" categories from the 'work_type' attribute
+    stroke_counts = stroke_counts.drop(group('stroke', 'work_type', 'not_working'), level='work_type', errors='ignore')
+    grouped_data = stroke_counts.unstack()
+
+    # Sort the grouped data by stroke occurrences in descending order
+    sorted_data = grouped_data.sum(axis=1).sort_values(ascending=False)
+
+    # Reorder the rows in the grouped data based on the sorted data
+    grouped_data = grouped_data.loc[sorted_data.index]
+
+    # Define the colors for the chart
+    rural_color = '#FC7676'
+    urban_color = '#722F37'
+    other_color_rural = 'lightgray'  # Grey color for rural bars
+    other_color_urban = 'darkgrey'  # Grey color for urban bars
+
+    # Find the maximum stroke cases for rural and urban areas (the sidebar
+    # filters can leave one of them out)
+    max_rural_cases = grouped_data['Rural'].max() if 'Rural' in grouped_data else None
+    max_urban_cases = grouped_data['Urban'].max() if 'Urban' in grouped_data else None
+
+    # Create the chart bars
+    bars = []
+    for col in grouped_data.columns:
+        bar_color = [
+            rural_color if (x == max_rural_cases and col == 'Rural') else
+            urban_color if (x == max_urban_cases and col == 'Urban') else
+            other_color_rural if col == 'Rural' else
+            other_color_urban
+            for x in grouped_data[col]
+        ]
+
+        bars.append(go.Bar(
+            x=grouped_data.index,
+            y=grouped_data[col],
+            name=col,
+            marker=dict(color=bar_color)
+        ))
+
+    fig1 = go.Figure(data=bars)
+
+    fig1.update_layout(
+        paper_bgcolor='#262730',  # Set the background color of the chart
+        plot_bgcolor='rgba(0, 0, 0, 0)'  # Set the background color of the plot area to transparent
+    )
+
+    fig1.update_layout(
+        title={
+            'text': 'Which Residence Type has the Most Stroke Cases by Work Type?',
+            'font': {'size': 24},
+            'x': 0.5,
+            'y': 0.95,
+            'xanchor': 'center',
+            'yanchor': 'top'
+        },
+        xaxis_title='Work Type',
+        yaxis_title='Number of Stroke Cases',
+        legend=dict(title='Residence Type'),
+    )
+    return fig1
+
+
+# Chart 2
+def build_fig2(cube):
+    # Count the stroke occurrences by marital status
+    marital_status_counts = cube.stroke_counts(['ever_married']).sort_values(ascending=False, kind='stable')
+
+    # Label and color of each slice follow its marital status, not its
+    # position, as the sidebar filters can change which status is larger
+    # or leave one out
+    status_labels = {'Yes': 'Married', 'No': 'Not Married'}
+    status_colors = {'Married': '#FC7676', 'Not Married': '#722F37'}
+    legend_labels = [status_labels.get(status, status) for status in marital_status_counts.index]
+    colors = [status_colors.get(label) for label in legend_labels]
+
+    fig2 = go.Figure(data=[go.Pie(labels=None, values=marital_status_counts.values)])
+
+    fig2.update_layout(
+        paper_bgcolor='#262730',  # Set the background color of the chart
+        plot_bgcolor='rgba(0, 0, 0, 0)'  # Set the background color of the plot area to transparent
+    )
+
+    fig2.update_layout(
+        title={
+            'text': 'Distribution of Stroke Cases by Marital Status',
+            'font': {'size': 24},
+            'x': 0.5,
+            'y': 0.95,
+            'xanchor': 'center',
+            'yanchor': 'top'
+        },
+    )
+
+    # Set the legend labels
+    fig2.update_traces(
+        hoverinfo='label+percent',
+        textfont_size=12,
+        marker=dict(colors=colors),
+        labels=legend_labels,
+        automargin=True  # Use 'automargin' instead of 'itemSizing'
+    )
+
+    # Add the legend
+    fig2.update_layout(
+        legend=dict(
+            title='Marital Status'
+        )
+    )
+    return fig2
+
+
+# Chart 3
+
+# How fig3 is rendered, set through environment variables:
+#   FIG3_MODE             'markers' (one marker per BMI value), 'fixed' (fixed-width BMI
+#                         bins), 'quantile' (BMI bins holding the same number of patients),
+#                         'lttb' (downsampled to FIG3_MAX_POINTS) or 'density' (BMI x glucose
+#                         heatmap)
+#   FIG3_BIN_WIDTH        BMI bin width for 'fixed' and 'density'
+#   FIG3_BINS             number of bins for 'quantile'
+#   FIG3_MAX_POINTS       point budget for 'lttb'
+#   FIG3_WEBGL_THRESHOLD  switch to WebGL (Scattergl) above this many points
+#   FIG3_BAND             error bars around every point: 'none', 'std' (one standard
+#                         deviation), 'iqr' (25th to 75th percentile) or 'p10_p90'
+#                         (10th to 90th percentile); not drawn in 'density' mode
+FIG3_MODES = ('markers', 'fixed', 'quantile', 'lttb', 'density')
+FIG3_MODE = os.environ.get('FIG3_MODE', 'markers')
+FIG3_BIN_WIDTH = float(os.environ.get('FIG3_BIN_WIDTH', '1'))
+FIG3_BINS = int(os.environ.get('FIG3_BINS', '50'))
+FIG3_MAX_POINTS = int(os.environ.get('FIG3_MAX_POINTS', '500'))
+FIG3_WEBGL_THRESHOLD = int(os.environ.get('FIG3_WEBGL_THRESHOLD', '1000'))
+FIG3_BANDS = {'none': None, 'std': None, 'iqr': (0.25, 0.75), 'p10_p90': (0.1, 0.9)}
+FIG3_BAND = os.environ.get('FIG3_BAND', 'none')
+
+
+def build_fig3(cube, mode=FIG3_MODE, bin_width=FIG3_BIN_WIDTH, bins=FIG3_BINS,
+               max_points=FIG3_MAX_POINTS, webgl_threshold=FIG3_WEBGL_THRESHOLD, band=FIG3_BAND):
+    if mode not in FIG3_MODES:
+        raise ValueError('Unknown fig3 render mode %r, expected one of %s' % (mode, ', '.join(FIG3_MODES)))
+    if band not in FIG3_BANDS:
+        raise ValueError('Unknown fig3 band %r, expected one of %s' % (band, ', '.join(FIG3_BANDS)))
+
+    if mode == 'density':
+        # Number of patients for each BMI bin and glucose level bin (the cube
+        # leaves out outlier BMIs, over 60)
+        density = cube.bmi_glucose_density()
+        density['bmi'] = fixed_width_bins(density['bmi'].to_numpy(), bin_width) * bin_width
+        grid = density.pivot_table(index='glucose', columns='bmi', values='rows', aggfunc='sum', fill_value=0)
+        trace = go.Heatmap(x=grid.columns, y=grid.index, z=grid.values, colorscale='Reds', colorbar=dict(title='Patients'))
+    else:
+        # Average of avg_glucose_level for each bmi value
+        averages = cube.glucose_by_bmi()
+        x, y = averages.index.to_numpy(), averages.to_numpy()
+        bin_ids = kept = None
+
+        if mode in ('fixed', 'quantile'):
+            # Merge BMI values into wider bins, weighting each value by its number of patients
+            bmi_bins = cube.bmi_bins()
+            counts = bmi_bins['rows'].to_numpy()
+            bin_ids = fixed_width_bins(x, bin_width) if mode == 'fixed' else quantile_bins(counts, bins)
+            x, y, _ = binned_means(x, counts, bmi_bins['glucose_sum'].to_numpy(), bin_ids)
+        elif mode == 'lttb':
+            # Keep only the points that preserve the shape of the series
+            kept = lttb(x, y, max_points)
+            x, y = x[kept], y[kept]
+
+        # Create a bar plot of the averages
+        scatter = go.Scattergl if len(x) > webgl_threshold else go.Scatter
+        trace = scatter(x=x, y=y, mode='markers', marker=dict(symbol='circle', size=8, color='#D23B5F'),
+                        error_y=glucose_band(cube, band, y, bin_ids, kept))
+
+    fig3 = go.Figure(data=[trace])
+
+    fig3.update_layout(
+        paper_bgcolor='#262730',  # Set the background color of the chart
+        plot_bgcolor='rgba(0, 0, 0, 0)'  # Set the background color of the plot area to transparent
+    )
+
+    fig3.update_layout(
+        title='Did BMI affect the Average Glucose Level?',
+        xaxis_title='Body Mass Index',
+        yaxis_title='Average Glucose Level',
+        legend=dict(title=None),
+        font=dict(
+            color='white'
+        )
+    )
+
+    fig3.update_xaxes(tickfont=dict(color='white'))
+    fig3.update_yaxes(tickfont=dict(color='white'))
+    return fig3
+
+
+def glucose_band(cube, band, y, bin_ids=None, kept=None):
+    # Error bars around the plotted averages y, from the cube's glucose
+    # moments and quantile sketches of the same BMI values or bins
+    if band == 'none':
+        return None
+    spread = cube.glucose_spread(bin_ids=bin_ids, quantiles=FIG3_BANDS[band] or ())
+    if kept is not None:
+        spread = spread.iloc[kept]
+    if band == 'std':
+        return dict(type='data', array=spread['std'].fillna(0).to_numpy(), color='rgba(255, 255, 255, 0.5)')
+    lower, upper = ('q%g' % q for q in FIG3_BANDS[band])
+    return dict(type='data', symmetric=False, color='rgba(255, 255, 255, 0.5)',
+                array=np.maximum(spread[upper].to_numpy() - y, 0),
+                arrayminus=np.maximum(y - spread[lower].to_numpy(), 0))
+
+
+# Chart 4
+def build_fig4(tables):
+    # Define the desired order for stress levels
+    stress_level_order = ['Rarely', 'Sometimes', 'Always']
+
+    # Specify the desired order for gender
+    gender_order = ['Male', 'Female']
+
+    # Occurrences of each combination of stress level and gender, from the
+    # survey's contingency tables (levels outside the order, like 'Never',
+    # are left out of the chart)
+    grouped_df = tables.table('stress_level', 'gender').crosstab().reindex(
+        index=stress_level_order, columns=gender_order, fill_value=0)
+
+    # Create line charts for each gender
+    fig4 = go.Figure()
+    for gender in gender_order:
+        if gender == 'Male':
+            color = '#722F37'  # Set color for male
+        elif gender == 'Female':
+            color = '#FC7676'  # Set color for female
+        fig4.add_trace(go.Scatter(x=grouped_df.index, y=grouped_df[gender], name=gender, line=dict(color=color)))
+
+    fig4.update_layout(
+        paper_bgcolor='#262730',  # Set the background color of the chart
+        plot_bgcolor='rgba(0, 0, 0, 0)'  # Set the background color of the plot area to transparent
+    )
+
+    # Set chart title and axis labels
+    fig4.update_layout(
+        title={
+            'text': 'How Does Gender Influence Stress Levels?',
+            'font': {'size': 24},
+            'x': 0.5,
+            'y': 0.95,
+            'xanchor': 'center',
+            'yanchor': 'top'
+        },
+        xaxis_title='Stress Level',
+        yaxis_title='Total',
+        legend=dict(title='Gender')
+    )
+    return fig4
+
+
+# Chart 5
+def build_fig5(tables):
+    # Mean of exercise_duration by sugary_intake and gender, leaving out the
+    # intakes and genders nobody answered
+    grouped_data = tables.table('sugary_intake', 'gender').means('exercise_duration')
+    grouped_data = grouped_data.dropna(how='all').dropna(axis=1, how='all')
+
+    # Define the colors for the bars
+    colors = []
+
+    for intake in grouped_data.index:
+        if intake in ['1-2 times', '5-6 times', '7-8 times']:
+            colors.extend(['grey', 'lightgrey'])
+        elif intake == '3-4 times':
+            colors.extend(['red', '#FF7276'])
+
+    fig5 = go.Figure()
+
+    for i, col in enumerate(grouped_data.columns):
+        fig5.add_trace(go.Bar(
+            x=grouped_data.index,
+            y=grouped_data[col],
+            name=col,
+            marker=dict(color=colors[i::len(grouped_data.columns)])  # Set the color for each bar
+        ))
+
+    fig5.update_layout(
+        paper_bgcolor='#262730',  # Set the background color of the chart
+        plot_bgcolor='rgba(0, 0, 0, 0)'  # Set the background color of the plot area to transparent
+    )
+
+    fig5.update_layout(
+        title='Which gender and how much sugar intake has the highest average exercise per week?',
+        xaxis_title='Sugary Intake in Week',
+        yaxis_title='Average Exercise in Week',
+        barmode='stack',
+        legend=dict(title='Gender')
+    )
+    fig5.update_xaxes(tickfont=dict(color='white'))
+    fig5.update_yaxes(tickfont=dict(color='white'))
+    return fig5
+
+
+# Chart 6
+def build_fig6(store):
+    # Total cases per year and state, with the states sorted by their total
+    # number of cases in descending order
+    years, sorted_states, cases = store.state_year_matrix()
+
+    colors = ['#FF9696', 'red', 'darkred']
+
+    fig6 = go.Figure()
+
+    for i, year in enumerate(years):
+        fig6.add_trace(go.Scatter(
+            x=sorted_states,
+            y=cases[i],
+            mode='lines',
+            stackgroup='one',
+            name=str(year),
+            line=dict(color=colors[i % len(colors)])
+        ))
+
+    fig6.update_layout(
+        paper_bgcolor='#262730',  # Set the background color of the chart
+        plot_bgcolor='rgba(0, 0, 0, 0)'  # Set the background color of the plot area to transparent
+    )
+
+    fig6.update_layout(
+        title='How Do Stroke Cases Evolve Over Time in Different States?',
+        xaxis_title='State',
+        yaxis_title='Number of Cases',
+        showlegend=True
+    )
+    return fig6
+
+
+# Every chart the dashboards can show:
+# chart id -> (dataset it reads, data source method giving the builder's
+# input, builder)
+CHARTS = {
+    'fig1': ('stroke', 'stroke_counts', build_fig1),
+    'fig2': ('stroke', 'stroke_counts', build_fig2),
+    'fig3': ('stroke', 'stroke_cube', build_fig3),
+    'fig4': ('survey', 'survey_tables', build_fig4),
+    'fig5': ('survey', 'survey_tables', build_fig5),
+    'fig6': ('cases', 'case_store', build_fig6),
+}
+
+# Built figures, keyed by chart id and the version of the dataset they came from.
+# Kept at module level so they are shared by every rerun and every session.
+# Each key holds a future, so a figure is built once however many sessions ask
+# for it, while figures with other keys are built at the same time; the lock
+# only guards the registry itself.
+_figures = {}
+_figures_lock = threading.Lock()
+
+
+def get_figure(chart_id, **options):
+    # Build a chart the first time a dashboard asks for it, then reuse it
+    # until the content of its dataset changes. Options are passed on to the
+    # chart's builder and each combination of them is kept separately.
+    dataset, load_input, builder = CHARTS[chart_id]
+    chart = (chart_id, tuple(sorted(options.items())))
+    key = (chart, dataset_version(dataset))
+    future = _figures.get(key)
+    if future is None:
+        with _figures_lock:
+            future = _figures.get(key)
+            building = future is None
+            if building:
+                future = _figures[key] = Future()
+        if building:
+            try:
+                chart_input = getattr(get_source(), load_input)()
+                with stage('build:' + chart_id):
+                    future.set_result(builder(chart_input, **options))
+            except BaseException as exc:
+                # Let the sessions waiting for it fail too, and the next
+                # request try again
+                future.set_exception(exc)
+                with _figures_lock:
+                    if _figures.get(key) is future:
+                        del _figures[key]
+                raise
+            with _figures_lock:
+                # Drop figures built from older versions of the dataset
+                for old_key in [k for k in _figures if k[0] == chart and k != key]:
+                    del _figures[old_key]
+    return future.result()
+
+
+def filtered_figure(chart_id, filters, **options):
+    # Build a stroke chart from only the rows matching the sidebar filters
+    # (normalized by filters.FilterIndex). Returns the dataset version it
+    # was built from and the figure; the filtered cubes are kept by the
+    # index, so building the figure again is cheap.
+    dataset, _, builder = CHARTS[chart_id]
+    if dataset != 'stroke':
+        raise ValueError('%s does not read the stroke dataset and cannot be filtered' % chart_id)
+    version, cube = filtered_cube(filters)
+    with stage('build:' + chart_id):
+        return version, builder(cube, **options)
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+# Binary copy of a parsed CSV, kept in a folder next to the CSV
+# (e.g. 'aa.csv' -> 'aa.csv.cache/'). Every column is stored as its own .npy
+# file: numeric columns as their values, categorical columns dictionary
+# encoded as integer codes with the categories kept in meta.json. Loading
+# memory-maps the .npy files, so nothing is parsed or copied and every
+# process reading the same cache shares the same pages of the OS page cache.
+
+META_FILE = 'meta.json'
+
+
+def cache_dir(csv_path):
+    return csv_path + '.cache'
+
+
+def read_meta(csv_path):
+    # Description of the cached columns and of the CSV they were built from,
+    # or None when there is no cache
+    try:
+        with open(os.path.join(cache_dir(csv_path), META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache(df, csv_path, source):
+    # Write df as the columnar cache of csv_path. `source` identifies the CSV
+    # content the frame was parsed from and is stored so readers can tell
+    # whether the cache is fresh.
+    folder = cache_dir(csv_path)
+    os.makedirs(folder, exist_ok=True)
+
+    # Column files are named after the source version and after what they
+    # hold (the parsed types, the cleaning's format), so a new cache never
+    # overwrites files another process may still have mapped, even one built
+    # from the same CSV by other code
+    layout = [source['hash'], source.get('dtypes'), source.get('schema'),
+              [(str(name), str(dtype)) for name, dtype in df.dtypes.items()]]
+    tag = hashlib.sha1(json.dumps(layout, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    columns = []
+    for i, name in enumerate(df.columns):
+        column = df[name]
+        file_name = '%d-%s.npy' % (i, tag)
+        info = {'name': name, 'file': file_name}
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            values = column.cat.codes.to_numpy()
+            info['categories'] = column.cat.categories.tolist()
+            info['ordered'] = bool(column.cat.ordered)
+        else:
+            values = column.to_numpy()
+        # Written aside and moved into place, like meta.json: another process
+        # writing the same version at the same time must not truncate a file
+        # a reader has already mapped
+        tmp_path = os.path.join(folder, '%s.%d.tmp' % (file_name, os.getpid()))
+        with open(tmp_path, 'wb') as f:
+            np.save(f, values, allow_pickle=False)
+        os.replace(tmp_path, os.path.join(folder, file_name))
+        columns.append(info)
+
+    meta = {'source': source, 'rows': len(df), 'columns': columns}
+
+    # Publish the new cache by atomically replacing meta.json
+    tmp_path = os.path.join(folder, '%s.%d.tmp' % (META_FILE, os.getpid()))
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(folder, META_FILE))
+
+    # Remove column files left over from older versions
+    keep = {info['file'] for info in columns}
+    for file_name in os.listdir(folder):
+        if file_name.endswith('.npy') and file_name not in keep:
+            try:
+                os.remove(os.path.join(folder, file_name))
+            except OSError:
+                pass
+    return meta
+
+
+def read_cache(csv_path, meta):
+    # Build a DataFrame over memory-mapped views of the cached columns
+    folder = cache_dir(csv_path)
+    data = {}
+    for info in meta['columns']:
+        values = np.load(os.path.join(folder, info['file']), mmap_mode='r', allow_pickle=False)
+        if 'categories' in info:
+            dtype = pd.CategoricalDtype(info['categories'], ordered=info['ordered'])
+            data[info['name']] = pd.Categorical.from_codes(values, dtype=dtype, validate=False)
+        else:
+            data[info['name']] = values
+    return pd.DataFrame(data, copy=False)
+
+
+# Objects derived from a dataset (the stroke cube, the risk model) are pickled
+# next to its columnar cache, one file per kind, dataset version and formats
+# (of the code that produced them), so other processes load them instead of
+# building them again.
+
+def pickle_file(csv_path, kind, version, *formats):
+    # The version is hashed, as other data sources' versions are not file names
+    tag = hashlib.sha1(version.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(cache_dir(csv_path), '%s-%s-%s.pkl' % (kind, tag, '-'.join(map(str, formats))))
+
+
+def load_pickle(path):
+    # The object another process saved at path, or None
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+def save_pickle(path, value, kind):
+    # Save atomically, then remove the files of the same kind saved for older
+    # versions
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        folder = os.path.dirname(path)
+        for file_name in os.listdir(folder):
+            if file_name.startswith(kind + '-') and file_name.endswith('.pkl') and file_name != os.path.basename(path):
+                os.remove(os.path.join(folder, file_name))
+    except OSError:
+        # Read-only deployments still work, every process builds its own
+        pass
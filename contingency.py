@@ -0,0 +1,207 @@
+import itertools
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from schema import SCHEMAS, Ordinal
+
+# Width in years of the survey's age bands
+AGE_BAND_WIDTH = int(os.environ.get('SURVEY_AGE_BAND_WIDTH', '2'))
+
+
+class ContingencyTable:
+    # Answers counted per combination of the levels of some survey
+    # dimensions, with the sums of the measures, as n-dimensional arrays
+
+    def __init__(self, dimensions, levels, counts, sums, sizes):
+        self.dimensions = dimensions
+        # Labels of each dimension, in the order of its axis
+        self.levels = levels
+        self.counts = counts
+        # measure -> summed values, and number of values summed, per cell
+        self.sums = sums
+        self.sizes = sizes
+
+    def _frame(self, values):
+        # Cells as a frame: the last dimension across, the others down
+        columns = pd.Index(self.levels[-1], name=self.dimensions[-1])
+        if len(self.dimensions) == 2:
+            index = pd.Index(self.levels[0], name=self.dimensions[0])
+        else:
+            index = pd.MultiIndex.from_product(self.levels[:-1], names=self.dimensions[:-1])
+        return pd.DataFrame(values.reshape(-1, len(columns)), index=index, columns=columns)
+
+    def crosstab(self):
+        # Answers per cell, like pd.crosstab over the dimensions
+        return self._frame(self.counts)
+
+    def means(self, measure):
+        # Mean of a measure per cell, NaN for cells without answers
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = self.sums[measure] / self.sizes[measure]
+        return self._frame(np.where(self.sizes[measure] > 0, means, np.nan))
+
+    def chi_square(self):
+        # Pearson's chi-square test of the dimensions being independent:
+        # (statistic, degrees of freedom, p-value). Levels nobody answered
+        # are left out.
+        counts = self.counts
+        for axis in range(counts.ndim):
+            others = tuple(a for a in range(counts.ndim) if a != axis)
+            counts = counts.compress(counts.sum(axis=others) > 0, axis=axis)
+        total = counts.sum()
+        if not total:
+            return float('nan'), 0, float('nan')
+        expected = np.ones(counts.shape) * total
+        for axis in range(counts.ndim):
+            others = tuple(a for a in range(counts.ndim) if a != axis)
+            shape = [1] * counts.ndim
+            shape[axis] = -1
+            expected = expected * (counts.sum(axis=others) / total).reshape(shape)
+        statistic = float(((counts - expected) ** 2 / expected).sum())
+        dof = counts.size - 1 - sum(k - 1 for k in counts.shape)
+        return statistic, dof, chi2_sf(statistic, dof)
+
+
+class SurveyTables:
+    # Contingency tables of the lifestyle survey (df2). Every dimension is
+    # encoded once as integer codes, ordered like its answers (see the
+    # ordinals in schema.py). The table of every pair of dimensions, and of
+    # the THREE_WAY triples, is then one np.bincount over the combined codes
+    # (and one per measure, weighted by it), so crosstabs, means and
+    # chi-square tests are read from small arrays instead of grouping the
+    # answers again. Other combinations are counted on first use and kept.
+
+    DIMENSIONS = ['gender', 'age_band', 'exercise_duration', 'sleep_duration', 'sugary_intake', 'junk_food',
+                  'stress_level', 'family_history']
+    MEASURES = ['exercise_duration', 'age']
+    THREE_WAY = [
+        ('stress_level', 'gender', 'family_history'),
+        ('sugary_intake', 'junk_food', 'gender'),
+        ('sleep_duration', 'stress_level', 'gender'),
+    ]
+
+    def __init__(self, codes, levels, measures, rows):
+        # dimension -> code of every answer (-1 when missing), and its labels
+        self.codes = codes
+        self.levels = levels
+        # measure -> value of every answer
+        self.measures = measures
+        self.rows = rows
+        # dimensions -> ContingencyTable. Sessions may count the same new
+        # table at the same time; either copy is kept.
+        self.tables = {}
+
+    @classmethod
+    def from_frame(cls, df2):
+        codes, levels = {}, {}
+        for dimension in cls.DIMENSIONS:
+            codes[dimension], levels[dimension] = _encode(df2, dimension)
+        measures = {measure: df2[measure].to_numpy(dtype='float64', na_value=np.nan) for measure in cls.MEASURES}
+        tables = cls(codes, levels, measures, len(df2))
+        for dimensions in itertools.chain(itertools.combinations(cls.DIMENSIONS, 2), cls.THREE_WAY):
+            tables.table(*dimensions)
+        return tables
+
+    def table(self, *dimensions):
+        # Table of the answers per combination of the dimensions' levels
+        table = self.tables.get(dimensions)
+        if table is not None:
+            return table
+        levels = [self.levels[dimension] for dimension in dimensions]
+        shape = tuple(len(labels) for labels in levels)
+        size = math.prod(shape)
+        codes = [self.codes[dimension] for dimension in dimensions]
+        # Answers missing any of the dimensions are left out, like groupby does
+        valid = np.logical_and.reduce([c >= 0 for c in codes])
+        cells = np.ravel_multi_index([c[valid] for c in codes], shape) if size else np.zeros(0, dtype='int64')
+        counts = np.bincount(cells, minlength=size).reshape(shape)
+        sums, sizes = {}, {}
+        for measure, values in self.measures.items():
+            values = values[valid]
+            present = ~np.isnan(values)
+            sums[measure] = np.bincount(cells[present], weights=values[present], minlength=size).reshape(shape)
+            sizes[measure] = np.bincount(cells[present], minlength=size).reshape(shape)
+        table = self.tables[dimensions] = ContingencyTable(dimensions, levels, counts, sums, sizes)
+        return table
+
+    def associations(self):
+        # Chi-square test of every pair of dimensions, strongest first
+        tests = [(a, b) + self.table(a, b).chi_square() for a, b in itertools.combinations(self.DIMENSIONS, 2)]
+        return pd.DataFrame(tests, columns=['dimension', 'other', 'chi_square', 'dof', 'p_value']).sort_values(
+            'p_value', ignore_index=True)
+
+
+def _encode(df2, dimension):
+    # Codes of a dimension's answers and its labels, ordered like the answers
+    if dimension == 'age_band':
+        start = df2['age'].to_numpy(dtype='float64', na_value=np.nan) // AGE_BAND_WIDTH * AGE_BAND_WIDTH
+        codes, starts = pd.factorize(start, sort=True)
+        return codes, ['%d-%d' % (s, s + AGE_BAND_WIDTH - 1) for s in starts]
+    column = df2[dimension]
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        spec = SCHEMAS['survey'].get(dimension)
+        if isinstance(spec, Ordinal):
+            categories = column.cat.categories
+            column = column.cat.reorder_categories(categories[np.argsort(spec.ordinals(categories), kind='stable')])
+        else:
+            column = column.cat.reorder_categories(sorted(column.cat.categories))
+    codes, uniques = pd.factorize(column, sort=True)
+    return codes, list(uniques)
+
+
+def chi2_sf(statistic, dof):
+    # Probability of a chi-square statistic at least this big with this many
+    # degrees of freedom: the regularized upper incomplete gamma function
+    # Q(dof / 2, statistic / 2), from its series below dof / 2 + 1 and its
+    # continued fraction above
+    if dof <= 0 or math.isnan(statistic):
+        return float('nan')
+    a, x = dof / 2, statistic / 2
+    if x <= 0:
+        return 1.0
+    log_scale = a * math.log(x) - x - math.lgamma(a)
+    if x < a + 1:
+        term = total = 1 / a
+        n = a
+        while abs(term) > abs(total) * 1e-15:
+            n += 1
+            term *= x / n
+            total += term
+        return max(0.0, 1 - total * math.exp(log_scale))
+    tiny = 1e-300
+    b = x + 1 - a
+    c, d = 1 / tiny, 1 / b
+    q = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = 1 / (d if abs(d) > tiny else tiny)
+        c = b + an / c
+        c = c if abs(c) > tiny else tiny
+        q *= d * c
+        if abs(d * c - 1) < 1e-15:
+            break
+    return q * math.exp(log_scale)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from sources import get_source
+
+    parser = argparse.ArgumentParser(description='Test every pair of survey answers for independence.')
+    parser.add_argument('--crosstab', nargs='+', metavar='DIMENSION', help='print the table of these dimensions')
+    args = parser.parse_args()
+
+    tables = get_source().survey_tables()
+    if args.crosstab:
+        table = tables.table(*args.crosstab)
+        print(table.crosstab().to_string())
+        statistic, dof, p_value = table.chi_square()
+        print('\nchi-square %.3f, %d degrees of freedom, p = %.4f' % (statistic, dof, p_value))
+    else:
+        print(tables.associations().to_string())
@@ -0,0 +1,432 @@
+import collections
+import hashlib
+import io
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+import columnar
+from instrument import stage
+import schema
+from schema import SCHEMAS, clean, parse_options
+
+# Folder the CSV files live in: next to this file, unless STROKE_DATA_DIR
+# points somewhere else (e.g. at generated benchmark data)
+DATA_DIR = os.environ.get('STROKE_DATA_DIR') or os.path.dirname(os.path.abspath(__file__))
+
+# Source file for each dataset the dashboards read
+DATA_FILES = {
+    'stroke': 'healthcare-dataset-stroke-data.csv',
+    'survey': 'Stroke data Malaysian.csv',
+    'cases': 'aa.csv',
+}
+
+# Column types for each dataset, from its schema (see schema.py). Text
+# columns with few distinct values are stored as categoricals and 0/1 flags
+# as small ints, which keeps the shared frames a fraction of the size of the
+# default object/int64 columns. The stroke measurements are recorded with at
+# most two decimals, which float32 holds to about seven significant digits;
+# aggregates sum them as float64.
+DTYPES = {name: {col: spec.dtype for col, spec in columns.items()} for name, columns in SCHEMAS.items()}
+
+# When the stroke registry CSV is bigger than this many bytes it is not
+# loaded into memory. Its charts are built from aggregates computed by
+# streaming the file in chunks of CHUNK_ROWS rows, so memory use does not grow
+# with the file. The other datasets are always loaded.
+STREAMED_DATASETS = {'stroke'}
+STREAM_BYTES = int(os.environ.get('STROKE_STREAM_BYTES', str(1 << 30)))
+CHUNK_ROWS = int(os.environ.get('STROKE_CHUNK_ROWS', '200000'))
+
+# Loaded frames, one per dataset, shared by every rerun and every session in
+# this process (the frame is None for streamed datasets). `appended` is set
+# when the file only grew since the previous entry: (content hash of the
+# previous entry, frame of the new rows).
+_Entry = collections.namedtuple('_Entry', ['stat', 'hash', 'frame', 'appended'])
+_datasets = {}
+_datasets_lock = threading.Lock()
+
+
+def data_path(name):
+    return os.path.join(DATA_DIR, DATA_FILES[name])
+
+
+def _file_stat(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _file_hash(path, prefix_size=None):
+    # Content hash of the file, and, when prefix_size is given, the hash of
+    # its first prefix_size bytes, computed in the same read
+    digest = hashlib.sha1()
+    prefix_hash = None
+    with open(path, 'rb') as f:
+        if prefix_size is not None:
+            digest.update(f.read(prefix_size))
+            prefix_hash = digest.hexdigest()
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest(), prefix_hash
+
+
+def _parsed(name, df):
+    # A frame parsed with the schema's options, with stripped column names,
+    # cleaned: (cleaned frame, rejected rows)
+    df.columns = df.columns.str.strip()
+    return clean(name, df)
+
+
+def _read_csv(name, f, columns, **options):
+    # read_csv from f with the schema's options. When a numeric column holds
+    # something that is not a number, the rows are read again leniently, so
+    # only the bad rows are rejected (see schema.parse_options()).
+    position = f.tell()
+    dtype, na_values = parse_options(name, columns)
+    try:
+        return pd.read_csv(f, dtype=dtype, na_values=na_values, **options)
+    except ValueError:
+        f.seek(position)
+        dtype, na_values = parse_options(name, columns, lenient=True)
+        return pd.read_csv(f, dtype=dtype, na_values=na_values, **options)
+
+
+def read_raw(name):
+    # Parse a dataset's CSV straight into its declared column types and clean
+    # it: (cleaned frame, rejected rows)
+    path = data_path(name)
+    header = pd.read_csv(path, nrows=0).columns
+    with open(path, 'rb') as f:
+        return _parsed(name, _read_csv(name, f, header))
+
+
+def read_dataset(name):
+    # The dataset's rows as the charts read them, without the rejected ones
+    return read_raw(name)[0]
+
+
+def _read_tail(name, offset):
+    # Parse only the rows that start at byte `offset` of the dataset's CSV
+    path = data_path(name)
+    header = pd.read_csv(path, nrows=0).columns
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        df = _read_csv(name, f, header, header=None, names=header)
+    return _parsed(name, df)[0]
+
+
+def read_csv_range(name, start, stop, chunk_rows=CHUNK_ROWS, path=None, rejected=False):
+    # Parse the rows stored in bytes [start, stop) of the dataset's CSV (from
+    # the top, header included, when start is None) in chunks of chunk_rows
+    # rows, holding one chunk in memory at a time. `path` overrides the
+    # dataset's file, for worker processes that may not share DATA_DIR.
+    # Chunks are cleaned; with `rejected` the rows left out are yielded
+    # instead.
+    path = path or data_path(name)
+    header = pd.read_csv(path, nrows=0).columns
+    # Rows already yielded, skipped when the range is read again leniently
+    done = 0
+    for lenient in (False, True):
+        dtype, na_values = parse_options(name, header, lenient)
+        with open(path, 'rb') as f:
+            if start is None:
+                reader = pd.read_csv(
+                    _LimitedReader(f, stop), dtype=dtype, na_values=na_values, chunksize=chunk_rows,
+                    skiprows=range(1, done + 1))
+            else:
+                f.seek(start)
+                reader = pd.read_csv(
+                    _LimitedReader(f, stop - start), header=None, names=header,
+                    dtype=dtype, na_values=na_values, chunksize=chunk_rows, skiprows=done)
+            try:
+                for chunk in reader:
+                    done += len(chunk)
+                    yield _parsed(name, chunk)[1 if rejected else 0]
+                return
+            except ValueError:
+                # A value that is not a number: read the rest of the range
+                # leniently
+                if lenient:
+                    raise
+
+
+def csv_partitions(name, parts):
+    # Split the dataset's CSV into about `parts` byte ranges of whole rows,
+    # which can be parsed independently with read_csv_range(). Returns the
+    # dataset's version and the (start, stop) ranges.
+    entry = _refresh(name)
+    size = entry.stat[1]
+    with open(data_path(name), 'rb') as f:
+        f.readline()
+        boundaries = [f.tell()]
+        for k in range(1, parts):
+            f.seek(max(boundaries[0] + (size - boundaries[0]) * k // parts - 1, boundaries[-1]))
+            f.readline()
+            if f.tell() < size and f.tell() > boundaries[-1]:
+                boundaries.append(f.tell())
+    boundaries.append(size)
+    return entry.hash, [(start, stop) for start, stop in zip(boundaries, boundaries[1:]) if stop > start]
+
+
+class _LimitedReader(io.RawIOBase):
+    # Read-only view of the first `size` bytes of a file, so chunked reads
+    # stop at the end of the version that was hashed even if rows are being
+    # appended meanwhile
+
+    def __init__(self, f, size):
+        self._f = f
+        self._left = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = min(len(buffer), self._left)
+        data = self._f.read(n)
+        buffer[:len(data)] = data
+        self._left -= len(data)
+        return len(data)
+
+
+def _empty(name):
+    return clean(name, pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in DTYPES[name].items()}))[0]
+
+
+def _concat(old, new):
+    # Stack the new rows under the old ones, merging the categories of
+    # categorical columns instead of falling back to object columns
+    columns = {}
+    for col in old.columns:
+        if isinstance(old[col].dtype, pd.CategoricalDtype):
+            columns[col] = union_categoricals([old[col].array, new[col].astype('category').array])
+        else:
+            columns[col] = np.concatenate([old[col].to_numpy(), new[col].to_numpy()])
+    return pd.DataFrame(columns, copy=False)
+
+
+def _load(name, content_hash, stat, df=None):
+    # Memory-map the dataset's columnar cache, writing it first (from df, or
+    # from the parsed CSV) when it is missing or was built from different
+    # content
+    path = data_path(name)
+    meta = columnar.read_meta(path)
+    # A cache written with other column types or cleaned by other code is
+    # rebuilt as well
+    if (meta is None or meta['source']['hash'] != content_hash or meta['source'].get('dtypes') != DTYPES[name]
+            or meta['source'].get('schema') != schema.FORMAT):
+        if df is None:
+            with stage('parse_csv:' + name) as record:
+                df = read_dataset(name)
+                record.rows = len(df)
+        source = {'hash': content_hash, 'stat': list(stat), 'dtypes': DTYPES[name], 'schema': schema.FORMAT}
+        try:
+            with stage('write_cache:' + name, rows=len(df)):
+                meta = columnar.write_cache(df, path, source)
+        except OSError:
+            # Read-only deployments still work, just without the cache
+            return df
+    with stage('map_cache:' + name, rows=meta['rows']):
+        return columnar.read_cache(path, meta)
+
+
+def _append_offset(path, entry, prefix_hash):
+    # Byte offset the new rows start at when the file is the previous
+    # entry's file with rows added at the end, otherwise None
+    old_size = entry.stat[1]
+    if prefix_hash != entry.hash or old_size == 0:
+        return None
+    with open(path, 'rb') as f:
+        f.seek(old_size - 1)
+        if f.read(1) != b'\n':
+            return None
+    return old_size
+
+
+def _refresh(name):
+    # Make sure the cached copy of a dataset matches the file on disk and
+    # return the cache entry. The file is only hashed when its mtime or size
+    # moved, and only loaded again when its content actually changed. When
+    # rows were only appended, just the new rows are parsed.
+    path = data_path(name)
+    stat = _file_stat(path)
+    entry = _datasets.get(name)
+    if entry is not None and entry.stat == stat:
+        return entry
+    with _datasets_lock:
+        entry = _datasets.get(name)
+        if entry is not None and entry.stat == stat:
+            return entry
+        # Big files of streamed datasets are only hashed, never loaded
+        if name in STREAMED_DATASETS and stat[1] > STREAM_BYTES:
+            load = lambda *args: None
+        else:
+            load = _load
+        if entry is None:
+            # On a cold start, trust a columnar cache built from a file with
+            # the same mtime and size instead of reading the whole CSV to
+            # hash it
+            meta = columnar.read_meta(path)
+            if meta is not None and tuple(meta['source']['stat']) == stat:
+                content_hash = meta['source']['hash']
+            else:
+                content_hash = _file_hash(path)[0]
+            entry = _Entry(stat, content_hash, load(name, content_hash, stat), None)
+        else:
+            grew = stat[1] > entry.stat[1]
+            content_hash, prefix_hash = _file_hash(path, entry.stat[1] if grew else None)
+            offset = _append_offset(path, entry, prefix_hash) if grew else None
+            if content_hash == entry.hash:
+                entry = entry._replace(stat=stat)
+            elif offset is not None:
+                with stage('parse_csv_tail:' + name) as record:
+                    rows = _read_tail(name, offset)
+                    record.rows = len(rows)
+                frame = None
+                if entry.frame is not None:
+                    frame = load(name, content_hash, stat, _concat(entry.frame, rows))
+                entry = _Entry(stat, content_hash, frame, (entry.hash, rows))
+            else:
+                entry = _Entry(stat, content_hash, load(name, content_hash, stat), None)
+        _datasets[name] = entry
+        return entry
+
+
+def dataset_version(name):
+    # Content hash of the file the dataset was loaded from
+    return _refresh(name).hash
+
+
+def is_streamed(name):
+    # Whether the dataset is too big to be loaded and has to be read in chunks
+    return _refresh(name).frame is None
+
+
+def _frame(name, entry):
+    if entry.frame is None:
+        raise ValueError(
+            '%s is too big to load into memory (%d bytes > STROKE_STREAM_BYTES); '
+            'read it with versioned_chunks() instead' % (DATA_FILES[name], entry.stat[1]))
+    return entry.frame
+
+
+def load_dataset(name):
+    # The returned frame is shared across sessions (and, through the
+    # memory-mapped cache, across processes), so callers must treat it as
+    # read-only and work on copies if they need to change it
+    return _frame(name, _refresh(name))
+
+
+def versioned_dataset(name):
+    # The dataset together with its version, read from the same cache entry
+    entry = _refresh(name)
+    return entry.hash, _frame(name, entry)
+
+
+def versioned_chunks(name, chunk_rows=CHUNK_ROWS):
+    # The dataset's version and an iterator over its rows in chunks, which
+    # works for datasets of any size
+    entry = _refresh(name)
+    if entry.frame is not None:
+        frame = entry.frame
+        chunks = (frame.iloc[start:start + chunk_rows] for start in range(0, len(frame), chunk_rows))
+    else:
+        chunks = read_csv_range(name, None, entry.stat[1], chunk_rows)
+    return entry.hash, chunks
+
+
+def appended_rows(name, since_version):
+    # Rows added to the end of the dataset since `since_version`, together
+    # with the version they bring the dataset to. The rows are None when the
+    # file changed in any other way (or too much happened since then to
+    # tell) and the dataset has to be processed again from scratch.
+    entry = _refresh(name)
+    if entry.hash == since_version:
+        return entry.hash, _empty(name)
+    if entry.appended is not None and entry.appended[0] == since_version:
+        return entry.hash, entry.appended[1]
+    return entry.hash, None
+
+
+# Rows each dataset's schema rejected: name -> (dataset version, rows)
+_rejected = {}
+
+
+def rejected_rows(name):
+    # Rows of the dataset's file left out by its schema (see schema.py), with
+    # the reason each was rejected for in a `reason` column. The file is read
+    # again in chunks, once per version.
+    entry = _refresh(name)
+    current = _rejected.get(name)
+    if current is None or current[0] != entry.hash:
+        with stage('reject:' + name) as record:
+            chunks = list(read_csv_range(name, None, entry.stat[1], rejected=True))
+            rows = pd.concat(chunks, ignore_index=True) if chunks else _empty(name).assign(reason=pd.Series(dtype=object))
+            record.rows = len(rows)
+        current = _rejected[name] = (entry.hash, rows)
+    return current[1]
+
+
+def _is_mapped(values):
+    # Whether an array is a view of a memory-mapped file
+    while values is not None:
+        if isinstance(values, np.memmap):
+            return True
+        values = getattr(values, 'base', None)
+    return False
+
+
+def memory_report(name):
+    # Bytes per column of a dataset as it is held here, next to the same CSV
+    # parsed with pandas' default types (object strings, int64, float64).
+    # Mapped columns live in the OS page cache, shared by every process
+    # serving the dashboards, rather than in each process' own memory.
+    df = load_dataset(name)
+    default = pd.read_csv(data_path(name))
+    default.columns = default.columns.str.strip()
+    report = pd.DataFrame({
+        'dtype': df.dtypes.astype(str),
+        'bytes': df.memory_usage(index=False, deep=True),
+        'mapped': [_is_mapped(df[col].cat.codes.to_numpy() if isinstance(df[col].dtype, pd.CategoricalDtype)
+                              else df[col].to_numpy()) for col in df.columns],
+        'default_dtype': default.dtypes.astype(str),
+        'default_bytes': default.memory_usage(index=False, deep=True),
+    })
+    report.index.name = 'column'
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build the columnar caches of the datasets.')
+    parser.add_argument('--memory', action='store_true', help='print how much memory each dataset takes')
+    parser.add_argument('--rejected', action='store_true', help='print the rows the schema rejected')
+    args = parser.parse_args()
+
+    # Convert every CSV to its columnar cache ahead of serving, so the
+    # dashboard processes only have to map it
+    for name in DATA_FILES:
+        if not is_streamed(name):
+            load_dataset(name)
+        print('%s: %s' % (name, columnar.cache_dir(data_path(name))))
+
+    if args.memory:
+        for name in DATA_FILES:
+            if is_streamed(name):
+                continue
+            report = memory_report(name)
+            total, default_total = report['bytes'].sum(), report['default_bytes'].sum()
+            private = report.loc[~report['mapped'], 'bytes'].sum()
+            print('\n%s: %d bytes (%d outside the shared mapping), %d with default types, %.1fx smaller' % (
+                name, total, private, default_total, default_total / max(total, 1)))
+            print(report.to_string())
+
+    if args.rejected:
+        for name in DATA_FILES:
+            rows = rejected_rows(name)
+            print('\n%s: %d rows rejected' % (name, len(rows)))
+            if len(rows):
+                print(rows['reason'].value_counts().to_string())
+                print(rows.to_string(max_rows=20))
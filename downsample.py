@@ -0,0 +1,51 @@
+import numpy as np
+
+
+def binned_means(x, counts, sums, bin_ids):
+    # Combine points that share a bin id into one point per bin: the count
+    # weighted mean of x, the total count and the mean of the summed values
+    bins, inverse = np.unique(bin_ids, return_inverse=True)
+    total = np.bincount(inverse, weights=counts, minlength=len(bins))
+    x_mean = np.bincount(inverse, weights=x * counts, minlength=len(bins)) / total
+    y_mean = np.bincount(inverse, weights=sums, minlength=len(bins)) / total
+    return x_mean, y_mean, total
+
+
+def fixed_width_bins(x, width):
+    # Bin id of every x for bins of the given width
+    return np.floor(x / width).astype(np.int64)
+
+
+def quantile_bins(counts, n_bins):
+    # Bin id of every point (sorted by x) so that each bin holds about the
+    # same number of patients
+    cumulative = np.cumsum(counts) - counts / 2
+    return np.minimum((cumulative * n_bins / counts.sum()).astype(np.int64), n_bins - 1)
+
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets downsampling: keep n_out of the (sorted
+    # by x) points, picking in every bucket the point that forms the largest
+    # triangle with the previously kept point and the average of the next
+    # bucket, which preserves the visual shape of the series
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        kept[i + 1] = previous
+    return kept
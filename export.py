@@ -0,0 +1,190 @@
+import argparse
+import hashlib
+import html
+import json
+import os
+import sys
+import time
+
+# Export the dashboards as static HTML, for viewers who only look at them:
+#
+#   python export.py --out static-export
+#   python export.py --out static-export --watch 60
+#
+# Every dashboard is rendered by running the app once (without a browser) and
+# turning what it draws into a page: its markdown as is, its columns as flex
+# rows and its charts as the Plotly JSON the app already encoded, drawn by a
+# local copy of plotly.js. The pages can be served by any static file server
+# or CDN, without a Streamlit session per viewer.
+#
+# The bundle is tagged with a fingerprint of the datasets' versions and of
+# the app's source, and only rendered again when that changes. With --watch
+# the fingerprint is checked every that many seconds.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+APP = os.path.join(ROOT, 'GroupProject.py')
+OUT_DIR = os.environ.get('STATIC_EXPORT_DIR') or os.path.join(ROOT, 'static-export')
+
+# Bumped whenever the pages change, so bundles of older code are rendered again
+FORMAT = 1
+FINGERPRINT_FILE = 'fingerprint.txt'
+
+PAGE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<script src="{plotly_js}"></script>
+<style>
+body {{ margin: 0; font-family: sans-serif; color: #31333F; }}
+.stApp {{ min-height: 100vh; padding: 1rem 4rem; box-sizing: border-box; }}
+nav {{ text-align: center; margin-bottom: 1rem; }}
+nav a {{ margin: 0 1rem; color: #262730; }}
+nav a.current {{ font-weight: bold; text-decoration: none; }}
+.row {{ display: flex; gap: 1rem; }}
+.column {{ min-width: 0; }}
+.gap {{ height: 1.5rem; }}
+.chart {{ height: 450px; }}
+</style>
+</head>
+<body>
+<div class="stApp">
+<nav>{nav}</nav>
+{body}
+</div>
+<script>
+document.querySelectorAll('script[type="application/json"]').forEach(function (spec) {{
+  var fig = JSON.parse(spec.textContent);
+  Plotly.newPlot(spec.previousElementSibling, fig.data, fig.layout || {{}}, {{responsive: true, displaylogo: false}});
+}});
+</script>
+</body>
+</html>
+'''
+
+
+def fingerprint():
+    # Changes whenever any dataset, the app or the export itself changes. The
+    # app is every module next to GroupProject.py (charts, schema, ...), as a
+    # change to any of them can change what the page shows.
+    import data
+    from sources import get_source
+
+    datasets = sorted(data.DATA_FILES)
+    digest = hashlib.sha1()
+    digest.update(json.dumps([FORMAT, datasets, get_source().versions(datasets)]).encode('utf-8'))
+    for file_name in sorted(os.listdir(ROOT)):
+        if file_name.endswith('.py'):
+            digest.update(file_name.encode('utf-8'))
+            with open(os.path.join(ROOT, file_name), 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _element_html(node):
+    # HTML for one element or block of the app's element tree
+    if node.type in ('flex_container', 'horizontal'):
+        return '<div class="row">\n%s\n</div>' % '\n'.join(_element_html(child) for child in node.children.values())
+    if node.type == 'column':
+        return '<div class="column" style="flex: %g">\n%s\n</div>' % (
+            node.proto.weight, '\n'.join(_element_html(child) for child in node.children.values()))
+    if node.type == 'markdown':
+        body = node.proto.body
+        if node.proto.allow_html:
+            return body
+        if not body.strip():
+            # st.write('') used as vertical space
+            return '<div class="gap"></div>'
+        if body.strip() == '---':
+            return '<hr>'
+        return '<p>%s</p>' % html.escape(body)
+    if node.type == 'plotly_chart':
+        # The JSON goes inside a <script>, where only '</' could end it early
+        return '<div class="chart"></div><script type="application/json">%s</script>' % (
+            node.proto.spec.replace('</', '<\\/'))
+    return ''
+
+
+def render():
+    # Run the app once per dashboard: [(label, body HTML)]
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP, default_timeout=600)
+    app.run()
+    labels = app.sidebar.selectbox[0].options
+    pages = []
+    for i, label in enumerate(labels):
+        if i:
+            app.sidebar.selectbox[0].select(label).run()
+        if app.exception:
+            raise RuntimeError('%s failed: %s' % (label, app.exception[0].message))
+        body = '\n'.join(_element_html(node) for node in app.main.children.values())
+        pages.append((label, body))
+    return pages
+
+
+def _write(path, text):
+    # Replace the file in one step, so a server never sends half of it
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def export(out_dir=OUT_DIR, force=False):
+    # Render the bundle into out_dir unless it is already up to date.
+    # Returns whether it was rendered.
+    from plotly.offline import get_plotlyjs, get_plotlyjs_version
+
+    sys.path.insert(0, ROOT)
+    current = fingerprint()
+    fingerprint_path = os.path.join(out_dir, FINGERPRINT_FILE)
+    if not force and os.path.exists(fingerprint_path):
+        with open(fingerprint_path) as f:
+            if f.read().strip() == current:
+                return False
+
+    os.makedirs(out_dir, exist_ok=True)
+    plotly_js = 'plotly-%s.min.js' % get_plotlyjs_version()
+    if not os.path.exists(os.path.join(out_dir, plotly_js)):
+        _write(os.path.join(out_dir, plotly_js), get_plotlyjs())
+
+    pages = render()
+    files = ['dashboard%d.html' % (i + 1) for i in range(len(pages))]
+    for i, (label, body) in enumerate(pages):
+        nav = ' '.join('<a href="%s"%s>%s</a>' % (file_name, ' class="current"' if j == i else '', html.escape(other))
+                       for j, (file_name, (other, _)) in enumerate(zip(files, pages)))
+        page = PAGE.format(title=html.escape(label), plotly_js=plotly_js, nav=nav, body=body)
+        _write(os.path.join(out_dir, files[i]), page)
+        if i == 0:
+            # The app opens on the first dashboard
+            _write(os.path.join(out_dir, 'index.html'), page)
+    # Written last, so an interrupted export is rendered again next time
+    _write(fingerprint_path, current + '\n')
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the dashboards as static HTML.')
+    parser.add_argument('--out', default=OUT_DIR, help='folder to write the pages to')
+    parser.add_argument('--force', action='store_true', help='render even if the data did not change')
+    parser.add_argument('--watch', type=float, metavar='SECONDS', help='keep checking for changes every SECONDS')
+    args = parser.parse_args()
+
+    force = args.force
+    while True:
+        start = time.perf_counter()
+        if export(args.out, force):
+            print('Exported the dashboards to %s in %.2fs' % (args.out, time.perf_counter() - start))
+        elif not args.watch:
+            print('%s is up to date' % args.out)
+        sys.stdout.flush()
+        if not args.watch:
+            break
+        force = False
+        time.sleep(args.watch)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import plotly.io as pio
+import streamlit as st
+from packaging.version import Version
+
+from charts import CHARTS, filtered_figure, get_figure
+from instrument import current_stages, recording, stage
+from parallel import get_backend
+from sources import dataset_version
+
+# st.plotly_chart turns the figure back into a dict, validates it and encodes
+# it to JSON on every call, for every viewer. Here each figure is encoded once
+# per dataset version and the JSON is handed to the frontend as is. This uses
+# Streamlit internals, whose signatures change between minor releases, so it
+# is only done on the releases below, which it was tested against (see
+# requirements.txt and tests/test_figcache.py). Other releases, and any
+# failure of the internals, fall back to st.plotly_chart.
+TESTED_STREAMLIT = ('1.66', '1.67')
+try:
+    from streamlit.elements.lib.layout_utils import LayoutConfig
+    from streamlit.elements.lib.utils import compute_and_register_element_id
+    from streamlit.elements.plotly_chart import _resolve_content_height
+    from streamlit.proto.PlotlyChart_pb2 import PlotlyChart as PlotlyChartProto
+    ENCODED_SENDS = Version(TESTED_STREAMLIT[0]) <= Version(st.__version__) < Version(TESTED_STREAMLIT[1])
+except ImportError:  # pragma: no cover - depends on the installed Streamlit
+    ENCODED_SENDS = False
+
+# Upper bound for the encoded figures kept in memory, in bytes
+MAX_BYTES = int(os.environ.get('FIGURE_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+
+logger = logging.getLogger('dashboard.figcache')
+
+
+class EncodedFigure:
+    # A figure encoded to Plotly JSON. `key` is a content address for it,
+    # usable as an ETag.
+
+    __slots__ = ('key', 'json')
+
+    def __init__(self, key, json_text):
+        self.key = key
+        self.json = json_text
+
+    @property
+    def size(self):
+        return len(self.json)
+
+
+class FigureCache:
+    # Least recently used cache of encoded figures, bounded by their total size
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, entry):
+        with self._lock:
+            old = self._entries.pop(entry.key, None)
+            if old is not None:
+                self.size -= old.size
+            self._entries[entry.key] = entry
+            self.size += entry.size
+            # Evict the least recently used figures, but always keep the new one
+            while self.size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.size
+
+
+_cache = FigureCache()
+
+
+def figure_key(chart_id, theme, options, version):
+    # Content address of an encoded figure
+    spec = json.dumps([version, chart_id, theme, sorted(options.items())], default=str)
+    return hashlib.sha1(spec.encode('utf-8')).hexdigest()
+
+
+def encoded_figure(chart_id, theme='streamlit', **options):
+    # Plotly JSON of a chart, encoded once and shared by every viewer
+    dataset = CHARTS[chart_id][0]
+    key = figure_key(chart_id, theme, options, dataset_version(dataset))
+    entry = _cache.get(key)
+    if entry is None:
+        fig = get_figure(chart_id, **options)
+        with stage('encode:' + chart_id):
+            entry = EncodedFigure(key, pio.to_json(fig, validate=False))
+        _cache.put(entry)
+    return entry
+
+
+# Threads preparing the charts of a dashboard side by side. They are kept
+# apart from the backend's own pool, which the charts' aggregations use.
+_prefetch_pool = None
+_prefetch_lock = threading.Lock()
+
+
+def prefetch(chart_ids, theme='streamlit'):
+    # Build and encode the given charts concurrently, so charts on different
+    # datasets are prepared at the same time. Does nothing on the serial
+    # backend; the charts are then built one by one as they are drawn.
+    global _prefetch_pool
+    backend = get_backend()
+    if backend.workers == 1:
+        return
+    with _prefetch_lock:
+        if _prefetch_pool is None:
+            _prefetch_pool = ThreadPoolExecutor(len(CHARTS), thread_name_prefix='prefetch')
+    # The workers' stages are recorded with those of the calling thread
+    stages = current_stages()
+    futures = [_prefetch_pool.submit(_prefetch_one, stages, chart_id, theme) for chart_id in chart_ids]
+    for future in futures:
+        future.result()
+
+
+def _prefetch_one(stages, chart_id, theme):
+    with recording(stages):
+        return encoded_figure(chart_id, theme)
+
+
+def send_figure(chart_id, fig, entry, theme='streamlit'):
+    # Send a built figure to the page, using its encoded JSON when possible
+    global ENCODED_SENDS
+    if ENCODED_SENDS:
+        try:
+            return _send_encoded(chart_id, fig, entry, theme)
+        except Exception:
+            # The internals do not work as expected; stop using them
+            logger.exception('Sending encoded figures failed, falling back to st.plotly_chart')
+            ENCODED_SENDS = False
+    with stage('send:' + chart_id):
+        return st.plotly_chart(fig, theme=theme)
+
+
+def _send_encoded(chart_id, fig, entry, theme):
+    proto = PlotlyChartProto()
+    proto.spec = entry.json
+    proto.config = json.dumps({})
+    proto.theme = theme or ''
+
+    width = 'stretch'
+    height = _resolve_content_height('content', fig)
+    proto.id = compute_and_register_element_id(
+        'plotly_chart',
+        user_key=None,
+        key_as_main_identity=False,
+        dg=st._main,
+        plotly_spec=proto.spec,
+        plotly_config=proto.config,
+        selection_mode=('points', 'box', 'lasso'),
+        is_selection_activated=False,
+        theme=theme,
+        width=width,
+        height=height,
+        alt=None,
+    )
+    with stage('send:' + chart_id):
+        return st._main._enqueue('plotly_chart', proto, layout_config=LayoutConfig(width=width, height=height))
+
+
+def plotly_chart(chart_id, theme='streamlit', **options):
+    # Drop-in for st.plotly_chart(get_figure(chart_id, **options)) that sends
+    # the cached JSON instead of encoding the figure again
+    fig = get_figure(chart_id, **options)
+    entry = encoded_figure(chart_id, theme, **options) if ENCODED_SENDS else None
+    return send_figure(chart_id, fig, entry, theme)
+
+
+def filtered_chart(chart_id, filters, theme='streamlit', **options):
+    # plotly_chart() for a stroke chart restricted to the rows matching the
+    # sidebar filters; each combination is encoded once and kept in the cache
+    version, fig = filtered_figure(chart_id, filters, **options)
+    entry = None
+    if ENCODED_SENDS:
+        key = figure_key(chart_id, theme, dict(options, filters=filters), version)
+        entry = _cache.get(key)
+        if entry is None:
+            with stage('encode:' + chart_id):
+                entry = EncodedFigure(key, pio.to_json(fig, validate=False))
+            _cache.put(entry)
+    return send_figure(chart_id, fig, entry, theme)
@@ -0,0 +1,192 @@
+import collections
+import logging
+import math
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aggregates import StrokeCube
+from instrument import stage
+from sources import get_source
+from versioned import VersionedValue
+
+# Filter combinations whose cube is kept per dataset version
+CACHE_SIZE = int(os.environ.get('FILTER_CACHE_SIZE', '64'))
+
+logger = logging.getLogger('dashboard.filters')
+
+
+class FilterIndex:
+    # Indexes over the stroke dataset that answer the sidebar filters without
+    # scanning every row on each rerun. Each value of a categorical column
+    # has a packed bitmap of the rows holding it (one bit per row), and age
+    # has the row numbers sorted by age. A filter combination ORs the bitmaps
+    # of the values picked within a column, ANDs them across columns and
+    # checks only the rows in the age range against the result.
+
+    # Columns filtered by picking values, and by a range
+    CATEGORIES = ['gender', 'hypertension', 'heart_disease', 'smoking_status', 'Residence_type']
+    RANGES = ['age']
+
+    def __init__(self, df1):
+        self.frame = df1
+        self.rows = len(df1)
+        # Values of each categorical column and the bitmap of every value
+        self.values = {}
+        self.bitmaps = {}
+        for column in self.CATEGORIES:
+            codes, values = pd.factorize(df1[column], sort=True)
+            self.values[column] = values.tolist()
+            self.bitmaps[column] = {
+                value: np.packbits(codes == code) for code, value in enumerate(self.values[column])
+            }
+        # Row numbers in ascending order of the column, and the sorted values
+        # (rows with a missing value sort last and match no range)
+        self.order = {}
+        self.sorted = {}
+        for column in self.RANGES:
+            values = df1[column].to_numpy()
+            self.order[column] = np.argsort(values, kind='stable')
+            self.sorted[column] = values[self.order[column]]
+
+        self._cubes = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def bounds(self, column):
+        # Whole numbers around the smallest and largest value of a range column
+        values = self.sorted[column]
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return 0, 0
+        return math.floor(values[0]), math.ceil(values[-1])
+
+    def normalize(self, selections):
+        # Hashable form of the sidebar selections ({column: picked values} and
+        # {column: (low, high)}), leaving out the columns that are not restricted
+        filters = []
+        for column in self.CATEGORIES:
+            picked = selections.get(column)
+            if picked is not None and set(picked) != set(self.values[column]):
+                filters.append((column, tuple(sorted(picked))))
+        for column in self.RANGES:
+            picked = selections.get(column)
+            if picked is not None:
+                low, high = self.bounds(column)
+                if picked[0] > low or picked[1] < high:
+                    filters.append((column, (float(picked[0]), float(picked[1]))))
+        return tuple(filters)
+
+    def select(self, filters):
+        # Sorted row numbers matching the normalized filters
+        mask = None
+        ranges = []
+        for column, picked in filters:
+            if column in self.bitmaps:
+                bits = np.zeros((self.rows + 7) // 8, dtype=np.uint8)
+                for value in picked:
+                    if value in self.bitmaps[column]:
+                        bits |= self.bitmaps[column][value]
+                if mask is None:
+                    mask = bits
+                else:
+                    mask &= bits
+            else:
+                ranges.append((column, picked))
+
+        if not ranges:
+            if mask is None:
+                return np.arange(self.rows)
+            return np.flatnonzero(np.unpackbits(mask, count=self.rows))
+
+        # Only the rows inside every range are looked at from here on
+        rows = None
+        for column, (low, high) in ranges:
+            start = np.searchsorted(self.sorted[column], low, side='left')
+            stop = np.searchsorted(self.sorted[column], high, side='right')
+            in_range = np.sort(self.order[column][start:stop])
+            rows = in_range if rows is None else np.intersect1d(rows, in_range, assume_unique=True)
+        if mask is not None:
+            rows = rows[((mask[rows >> 3] >> (7 - (rows & 7))) & 1).astype(bool)]
+        return rows
+
+    def cube(self, filters):
+        # Cube of the rows matching the normalized filters, kept for the most
+        # recently used combinations
+        with self._lock:
+            cube = self._cubes.get(filters)
+            if cube is not None:
+                self._cubes.move_to_end(filters)
+                return cube
+        with stage('filter') as record:
+            rows = self.select(filters)
+            record.rows = len(rows)
+        with stage('aggregate:filtered_cube', rows=len(rows)):
+            # Gather only the matching rows of the columns the cube reads
+            cube = StrokeCube.from_frame(self.frame[StrokeCube.COLUMNS].take(rows))
+        with self._lock:
+            self._cubes[filters] = cube
+            while len(self._cubes) > CACHE_SIZE:
+                self._cubes.popitem(last=False)
+        return cube
+
+
+def _build_index():
+    version, df1 = get_source().versioned('stroke')
+    with stage('index:stroke_filters', rows=len(df1)):
+        return version, FilterIndex(df1)
+
+
+# Index of the stroke dataset, shared by every session
+_index = VersionedValue(_build_index, version=lambda: get_source().version('stroke'))
+# Version of the stroke dataset an index is being built for in the background
+_building = None
+_building_lock = threading.Lock()
+
+
+def available():
+    # Filtering needs the rows in memory, which a streamed dataset never is
+    return not get_source().streamed('stroke')
+
+
+def stroke_filter_index():
+    # Index for the current version of the stroke dataset: (version, index)
+    return _index.get()
+
+
+def _build_in_background(version):
+    global _building
+    try:
+        stroke_filter_index()
+    except Exception:
+        logger.exception('Building the stroke filter index failed')
+    finally:
+        with _building_lock:
+            if _building == version:
+                _building = None
+
+
+def latest_filter_index():
+    # The index last built, (version, index), or None before the first one.
+    # When the stroke dataset changed, the index of the new version is built
+    # on a background thread and the previous one is returned meanwhile, so
+    # reruns never wait for an index.
+    global _building
+    version = get_source().version('stroke')
+    current = _index.current
+    if current is None or current[0] != version:
+        with _building_lock:
+            if _building != version:
+                _building = version
+                threading.Thread(target=_build_in_background, args=(version,), name='filter-index',
+                                 daemon=True).start()
+    return current
+
+
+def filtered_cube(filters):
+    # Cube of the stroke rows matching the normalized filters: (version, cube).
+    # The filters were normalized against latest_filter_index(), whose rows
+    # are used.
+    version, index = latest_filter_index() or stroke_filter_index()
+    return version, index.cube(filters)
@@ -0,0 +1,162 @@
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+
+# Opt-in timing of the stages behind a dashboard rerun (data loads, chart
+# builds, encoding, sending). Turn it on for every session with
+# DASHBOARD_PROFILE=1 or for one session by opening the app with ?profile=1.
+# When it is off, stage() hands back a shared do-nothing context, so the
+# instrumented code pays for one attribute lookup. Allocations are only
+# tracked with DASHBOARD_PROFILE=1: tracemalloc slows down the whole process,
+# so one viewer's ?profile=1 only gets timings, not every session a slowdown.
+ENABLED = os.environ.get('DASHBOARD_PROFILE', '') not in ('', '0')
+
+# Write process-wide totals in Prometheus text format to this file
+# (e.g. for node_exporter's textfile collector)
+PROMETHEUS_FILE = os.environ.get('DASHBOARD_PROFILE_PROM')
+
+logger = logging.getLogger('dashboard.profile')
+
+# Stage records of the rerun running on this thread (Streamlit runs every
+# session's script in its own thread)
+_local = threading.local()
+
+# Totals per stage over every profiled rerun: name -> [count, seconds, bytes]
+_totals = {}
+_totals_lock = threading.Lock()
+
+
+class Stage:
+    __slots__ = ('name', 'rows', 'seconds', 'alloc_bytes', '_start', '_memory')
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self.seconds = None
+        self.alloc_bytes = None
+
+    def __enter__(self):
+        self._memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self._start
+        if self._memory is not None:
+            self.alloc_bytes = tracemalloc.get_traced_memory()[0] - self._memory
+        return False
+
+    def as_dict(self):
+        return {
+            'stage': self.name,
+            'seconds': self.seconds,
+            'alloc_bytes': self.alloc_bytes,
+            'rows': self.rows,
+        }
+
+
+class _NoStage:
+    # Stand-in for Stage when profiling is off; setting `rows` on it is a no-op
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name, rows=None):
+    # Context manager timing one stage of the current rerun. Set `rows` on
+    # the object it returns to record how many rows the stage handled.
+    stages = getattr(_local, 'stages', None)
+    if stages is None:
+        return _NO_STAGE
+    record = Stage(name, rows)
+    stages.append(record)
+    return record
+
+
+def start_rerun(enabled=ENABLED):
+    # Start recording the stages of the rerun on this thread, or stop
+    # recording if profiling is off for it
+    if enabled:
+        if ENABLED and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _local.stages = []
+    else:
+        _local.stages = None
+
+
+def current_stages():
+    # The stage records of the rerun on this thread, or None when it is not
+    # profiled; hand them to recording() on threads doing part of its work
+    return getattr(_local, 'stages', None)
+
+
+class recording:
+    # Record the stages run on this (worker) thread into another thread's
+    # rerun, from current_stages() there
+
+    def __init__(self, stages):
+        self.stages = stages
+
+    def __enter__(self):
+        self._previous = getattr(_local, 'stages', None)
+        _local.stages = self.stages
+
+    def __exit__(self, *exc_info):
+        _local.stages = self._previous
+        return False
+
+
+def finish_rerun(event='rerun'):
+    # Stop recording, log and export the rerun's stages and return them.
+    # `event` names what was recorded in the log (e.g. 'snapshot' for the
+    # refresher building one).
+    stages = [record.as_dict() for record in getattr(_local, 'stages', None) or [] if record.seconds is not None]
+    _local.stages = None
+    if not stages:
+        return stages
+
+    logger.info(json.dumps({'event': event, 'stages': stages}))
+    with _totals_lock:
+        for record in stages:
+            totals = _totals.setdefault(record['stage'], [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += record['seconds']
+            totals[2] += max(record['alloc_bytes'] or 0, 0)
+        if PROMETHEUS_FILE:
+            _write_prometheus(PROMETHEUS_FILE)
+    return stages
+
+
+def _write_prometheus(path):
+    lines = [
+        '# HELP dashboard_stage_seconds Time spent in each dashboard stage.',
+        '# TYPE dashboard_stage_seconds summary',
+    ]
+    for name, (count, seconds, _) in sorted(_totals.items()):
+        lines.append('dashboard_stage_seconds_sum{stage="%s"} %f' % (name, seconds))
+        lines.append('dashboard_stage_seconds_count{stage="%s"} %d' % (name, count))
+    lines += [
+        '# HELP dashboard_stage_alloc_bytes_total Memory allocated in each dashboard stage.',
+        '# TYPE dashboard_stage_alloc_bytes_total counter',
+    ]
+    for name, (_, _, alloc) in sorted(_totals.items()):
+        lines.append('dashboard_stage_alloc_bytes_total{stage="%s"} %d' % (name, alloc))
+
+    # Replace the file atomically so scrapers never read half of it
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, path)
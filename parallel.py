@@ -0,0 +1,105 @@
+import collections
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Where chart data preparation runs, set through environment variables:
+#   DASHBOARD_BACKEND  'serial' (default), 'thread' or 'process'
+#   DASHBOARD_WORKERS  number of threads or processes (default: one per core)
+BACKEND = os.environ.get('DASHBOARD_BACKEND', 'serial')
+WORKERS = int(os.environ.get('DASHBOARD_WORKERS', '0')) or os.cpu_count() or 1
+
+
+class SerialBackend:
+    # Runs everything on the calling thread
+    name = 'serial'
+    workers = 1
+    processes = False
+
+    def map(self, func, items):
+        return map(func, items)
+
+    def close(self):
+        pass
+
+
+class _PoolBackend:
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self._pool = self.executor(workers)
+
+    def map(self, func, items):
+        # Like Executor.map, but submits at most two tasks per worker ahead of
+        # the results being consumed, so a long iterator of work items (e.g.
+        # chunks read from a file) is never pulled into memory all at once
+        pending = collections.deque()
+        for item in items:
+            pending.append(self._pool.submit(func, item))
+            if len(pending) >= 2 * self.workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def close(self):
+        self._pool.shutdown()
+
+
+class ThreadBackend(_PoolBackend):
+    # Threads share the process' data; pandas and NumPy release the GIL in
+    # their heavy loops, so aggregations overlap partially
+    name = 'thread'
+    processes = False
+    executor = ThreadPoolExecutor
+
+
+class ProcessBackend(_PoolBackend):
+    # Separate processes run fully in parallel. Tasks only carry file
+    # locations and row ranges: workers read their partition straight from
+    # the memory-mapped columnar cache (shared through the OS page cache) or
+    # parse their byte range of the CSV, and send back small partial results.
+    name = 'process'
+    processes = True
+
+    @staticmethod
+    def executor(workers):
+        # Streamlit runs the app script as __main__, which freshly spawned
+        # workers would import (and so run) again; fork them where possible
+        method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(method))
+
+
+BACKENDS = {
+    'serial': SerialBackend,
+    'thread': ThreadBackend,
+    'process': ProcessBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def make_backend(name, workers=WORKERS):
+    if name not in BACKENDS:
+        raise ValueError('Unknown backend %r, expected one of %s' % (name, ', '.join(BACKENDS)))
+    if name == 'serial':
+        return SerialBackend()
+    return BACKENDS[name](workers)
+
+
+def get_backend():
+    # The process-wide backend chosen by DASHBOARD_BACKEND, started on first use
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = make_backend(BACKEND, WORKERS)
+    return _backend
+
+
+def set_backend(backend):
+    # Replace the process-wide backend (e.g. from a benchmark) and return the old one
+    global _backend
+    with _backend_lock:
+        old, _backend = _backend, backend
+    return old
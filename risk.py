@@ -0,0 +1,190 @@
+import functools
+import os
+
+import numpy as np
+import pandas as pd
+
+import columnar
+import data
+import schema
+from instrument import stage
+from sources import get_source
+from versioned import VersionedValue
+
+# Rows scored at a time; bounds the temporary arrays whatever the cohort size
+BATCH_ROWS = int(os.environ.get('RISK_BATCH_ROWS', '1000000'))
+# What-if profiles whose risk is kept per model
+WHAT_IF_CACHE_SIZE = int(os.environ.get('RISK_WHAT_IF_CACHE_SIZE', '256'))
+# Rows the model is fitted on when the stroke dataset is streamed
+STREAMED_FIT_ROWS = int(os.environ.get('RISK_STREAMED_FIT_ROWS', '1000000'))
+
+
+class RiskModel:
+    # Logistic regression of `stroke` on the patient columns, fitted with
+    # Newton's method and a small L2 penalty. Numeric columns are
+    # standardized (a missing value counts as the mean) and every category
+    # value has a weight of its own (an unseen value weighs nothing), so a
+    # batch is scored with one matrix product and one table lookup per
+    # categorical column.
+
+    # Bumped whenever the model changes, so saved models of older code are
+    # not loaded
+    FORMAT = 1
+
+    NUMERIC = ['age', 'avg_glucose_level', 'bmi', 'hypertension', 'heart_disease']
+    CATEGORICAL = ['gender', 'ever_married', 'work_type', 'Residence_type', 'smoking_status']
+    COLUMNS = NUMERIC + CATEGORICAL
+
+    # Strength of the L2 penalty on the weights (not on the intercept)
+    PENALTY = 1.0
+
+    def __init__(self, means, scales, levels, intercept, numeric_weights, category_weights):
+        self.means = means
+        self.scales = scales
+        # column -> category values seen when fitting
+        self.levels = levels
+        self.intercept = intercept
+        self.numeric_weights = numeric_weights
+        # column -> weight per category value, with a 0 at the end for
+        # values that were not seen
+        self.category_weights = category_weights
+        self.rows = 0
+
+    @classmethod
+    def fit(cls, df1, iterations=50, tolerance=1e-8):
+        numeric = df1[cls.NUMERIC].to_numpy(dtype='float64')
+        means = np.nanmean(numeric, axis=0)
+        scales = np.nanstd(numeric, axis=0)
+        scales[scales == 0] = 1
+        numeric = np.nan_to_num((numeric - means) / scales)
+
+        levels, one_hot = {}, []
+        for column in cls.CATEGORICAL:
+            categorical = pd.Categorical(df1[column])
+            levels[column] = categorical.categories.tolist()
+            # A missing value (code -1) picks the last column, which is dropped
+            one_hot.append(np.eye(len(levels[column]) + 1)[categorical.codes][:, :-1])
+        features = np.hstack([np.ones((len(df1), 1)), numeric] + one_hot)
+        target = df1['stroke'].to_numpy(dtype='float64')
+
+        penalty = np.full(features.shape[1], cls.PENALTY)
+        penalty[0] = 0
+        weights = np.zeros(features.shape[1])
+        for _ in range(iterations):
+            probability = 1 / (1 + np.exp(-(features @ weights)))
+            gradient = features.T @ (probability - target) + penalty * weights
+            hessian = (features.T * (probability * (1 - probability))) @ features + np.diag(penalty)
+            step = np.linalg.solve(hessian, gradient)
+            weights -= step
+            if np.abs(step).max() < tolerance:
+                break
+
+        category_weights, start = {}, 1 + len(cls.NUMERIC)
+        for column in cls.CATEGORICAL:
+            count = len(levels[column])
+            category_weights[column] = np.append(weights[start:start + count], 0.0)
+            start += count
+        model = cls(means, scales, levels, weights[0], weights[1:1 + len(cls.NUMERIC)], category_weights)
+        model.rows = len(df1)
+        return model
+
+    def _score_batch(self, rows):
+        numeric = rows[self.NUMERIC].to_numpy(dtype='float64')
+        logits = np.nan_to_num((numeric - self.means) / self.scales) @ self.numeric_weights + self.intercept
+        for column in self.CATEGORICAL:
+            codes = pd.Categorical(rows[column], categories=self.levels[column]).codes
+            # Code -1 (unseen value) picks the 0 at the end
+            logits += self.category_weights[column][codes]
+        return 1 / (1 + np.exp(-logits))
+
+    def score(self, rows, batch_rows=BATCH_ROWS):
+        # Stroke probability of every row, as a float64 array
+        scores = np.empty(len(rows))
+        for start in range(0, len(rows), batch_rows):
+            scores[start:start + batch_rows] = self._score_batch(rows.iloc[start:start + batch_rows])
+        return scores
+
+
+def _model_file(version):
+    # Saved next to the stroke dataset's columnar cache, like the cube
+    return columnar.pickle_file(data.data_path('stroke'), 'risk', version, schema.FORMAT, RiskModel.FORMAT)
+
+
+def load_model(version):
+    # The model another process saved for this version of the stroke
+    # dataset, or None
+    return columnar.load_pickle(_model_file(version))
+
+
+def save_model(version, model):
+    columnar.save_pickle(_model_file(version), model, 'risk')
+
+
+def _training_rows():
+    # (version, rows) to fit the model on
+    source = get_source()
+    if source.streamed('stroke'):
+        version, chunks = data.versioned_chunks('stroke', STREAMED_FIT_ROWS)
+        return version, next(chunks)
+    return source.versioned('stroke')
+
+
+def _load_or_fit():
+    version = get_source().version('stroke')
+    with stage('load:risk_model'):
+        model = load_model(version)
+    if model is None:
+        version, rows = _training_rows()
+        with stage('fit:risk_model', rows=len(rows)):
+            model = RiskModel.fit(rows)
+        save_model(version, model)
+    return version, model
+
+
+# Model of the stroke dataset, shared by every session
+_model = VersionedValue(_load_or_fit, version=lambda: get_source().version('stroke'))
+
+
+def risk_model():
+    # Model for the current version of the stroke dataset: (version, model).
+    # It is fitted once per version and saved, so other processes load it.
+    return _model.get()
+
+
+@functools.lru_cache(maxsize=4)
+def _cohort_scores(version, model):
+    # Sorted scores of every patient of the dataset the model was fitted on
+    source = get_source()
+    with stage('score:risk_cohort') as record:
+        if source.streamed('stroke'):
+            _, chunks = data.versioned_chunks('stroke')
+            scores = np.concatenate([model.score(chunk) for chunk in chunks])
+        else:
+            scores = model.score(source.load('stroke'))
+        record.rows = len(scores)
+    return np.sort(scores)
+
+
+@functools.lru_cache(maxsize=WHAT_IF_CACHE_SIZE)
+def _what_if(version, model, profile):
+    risk = model.score(pd.DataFrame([dict(profile)], columns=RiskModel.COLUMNS))[0]
+    scores = _cohort_scores(version, model)
+    return risk, 100 * np.searchsorted(scores, risk) / max(len(scores), 1)
+
+
+def warm_up():
+    # Fit (or load) the model of the current stroke dataset and score its
+    # cohort: (version, model). The dashboard does this with its snapshot
+    # (see snapshot.py), so a viewer's what-if never waits for either.
+    current = risk_model()
+    _cohort_scores(*current)
+    return current
+
+
+def what_if(profile, current=None):
+    # Stroke risk of one patient described by `profile` (column -> value),
+    # and the percentage of the dataset's patients with a lower risk, from
+    # the (version, model) `current` (by default the current model).
+    # Answers are kept, so going back to an earlier profile costs nothing.
+    version, model = current or risk_model()
+    return _what_if(version, model, tuple(sorted(profile.items())))
@@ -0,0 +1,308 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# What the columns of each dataset hold, declared once. A dataset's schema is
+# compiled into a cleaning function that runs over every frame read from its
+# file (whole, appended tail or streamed chunk) in one vectorized pass:
+#
+#   - a value that is not a number (see parse_options()), a missing required
+#     value or a value outside what a column can hold (a negative age, a BMI
+#     of 500, a gender or a range the schema does not know) rejects its row
+#     instead of failing the whole read. Rejected rows are left out of the
+#     cleaned frame and listed in the rejected rows, and the numeric columns
+#     are then stored in their declared types.
+#   - tokens meaning "not recorded" become missing values, and categorical
+#     columns with a label for unknown values (smoking_status' 'Unknown')
+#     give it to their missing values, so no group silently loses rows
+#   - range answers ('7 - 9 hours', '3-4 times') and ordered answers
+#     ('Never' ... 'Always') get an int8 <column>_ordinal column that sorts
+#     like the answers (the range's lower bound, or the answer's position;
+#     -1 when missing)
+#   - implausible but possible values get a bool <column>_outlier column,
+#     which the aggregates leave out instead of every chart masking them
+#
+# Categorical checks run on a column's categories, which are few, and are
+# then looked up by code, so the pass costs a few array operations per
+# column whatever the number of rows.
+
+# Bumped whenever what the cleaning produces changes, so caches of frames
+# cleaned by older code are built again
+FORMAT = 2
+
+
+class Column:
+    # A column of a dataset: the type it is parsed as and the tokens that
+    # mean the value was not recorded
+
+    def __init__(self, dtype, missing=()):
+        self.dtype = dtype
+        self.missing = list(missing)
+
+    def compile(self, name):
+        # Steps run over a frame, each taking it and returning
+        # (reason mask or None, {derived column: values})
+        return []
+
+
+class Number(Column):
+    # A numeric column holding values in [low, high] (either end may be
+    # None), with values above `outlier_above` flagged as outliers. A missing
+    # value rejects the row when the column is `required`, which integer
+    # columns always are, as their types cannot hold missing values.
+
+    def __init__(self, dtype, low=None, high=None, outlier_above=None, missing=(), required=False):
+        super().__init__(dtype, missing)
+        self.low = low
+        self.high = high
+        self.outlier_above = outlier_above
+        self.required = required or np.dtype(dtype).kind in 'iu'
+
+    def compile(self, name):
+        def parse(df):
+            column = df[name]
+            values = pd.to_numeric(column, errors='coerce')
+            values = np.asarray(values.to_numpy(dtype='float64', na_value=np.nan), dtype='float64')
+            return np.isnan(values) & column.notna().to_numpy(), {name: values}
+        steps = [('%s not a number' % name, parse)]
+        if self.required:
+            def missing(df):
+                return np.isnan(df[name].to_numpy()), {}
+            steps.append(('%s missing' % name, missing))
+        if self.low is not None or self.high is not None:
+            low = -np.inf if self.low is None else self.low
+            high = np.inf if self.high is None else self.high
+
+            def out_of_range(df):
+                values = df[name].to_numpy(dtype='float64', na_value=np.nan)
+                # Missing values compare False and are not rejected
+                return (values < low) | (values > high), {}
+            steps.append(('%s out of range' % name, out_of_range))
+        if self.outlier_above is not None:
+            def outliers(df):
+                values = df[name].to_numpy(dtype='float64', na_value=np.nan)
+                return None, {name + '_outlier': values > self.outlier_above}
+            steps.append((None, outliers))
+        return steps
+
+
+class Flag(Number):
+    # A 0/1 column
+
+    def __init__(self, dtype='int8'):
+        super().__init__(dtype, 0, 1, required=True)
+
+
+class Category(Column):
+    # A text column. With `values`, any other value rejects the row; with
+    # `unknown`, missing values are given that label. `groups` names sets of
+    # values the charts treat together.
+
+    def __init__(self, values=None, unknown=None, groups=None, missing=()):
+        super().__init__('category', missing)
+        self.values = values
+        self.unknown = unknown
+        self.groups = groups or {}
+
+    def _lookup(self, df, name, per_category):
+        # per_category(categories) gives one value per category of the
+        # column; returns that value for every row and whether it is missing
+        column = df[name]
+        if not isinstance(column.dtype, pd.CategoricalDtype):
+            column = column.astype('category')
+        codes = column.cat.codes.to_numpy()
+        return np.asarray(per_category(column.cat.categories))[codes], codes < 0
+
+    def compile(self, name):
+        steps = []
+        if self.values is not None:
+            allowed = set(self.values) | ({self.unknown} if self.unknown else set())
+
+            def unknown_value(df):
+                rejected, _ = self._lookup(df, name, lambda categories: [c not in allowed for c in categories] + [False])
+                return rejected, {}
+            steps.append(('%s not one of %s' % (name, ', '.join(self.values)), unknown_value))
+        if self.unknown is not None:
+            def fill_unknown(df):
+                column = df[name]
+                if not column.isna().any():
+                    return None, {}
+                if self.unknown not in column.cat.categories:
+                    column = column.cat.add_categories([self.unknown])
+                return None, {name: column.fillna(self.unknown)}
+            steps.append((None, fill_unknown))
+        return steps
+
+
+class Ordinal(Category):
+    # Answers with a natural order, listed from lowest to highest
+
+    def __init__(self, levels, missing=()):
+        super().__init__(levels, missing=missing)
+        self.levels = levels
+
+    def ordinals(self, categories):
+        return [self.levels.index(c) if c in self.levels else -1 for c in categories]
+
+    def compile(self, name):
+        def ordinal(df):
+            values, _ = self._lookup(df, name, lambda categories: self.ordinals(categories) + [-1])
+            return None, {name + '_ordinal': values.astype('int8')}
+        return super().compile(name) + [(None, ordinal)]
+
+
+class Range(Ordinal):
+    # Answers given as a range of `unit`s ('7 - 9 hours', '3-4 times'),
+    # ordered by their lower bound. Answers of any other form reject the row.
+
+    def __init__(self, unit, missing=()):
+        super().__init__(None, missing=missing)
+        self.pattern = re.compile(r'^\s*(\d+)\s*-\s*(\d+)\s*%s\s*$' % re.escape(unit))
+
+    def ordinals(self, categories):
+        matches = [self.pattern.match(c) for c in categories]
+        return [int(match.group(1)) if match else -1 for match in matches]
+
+    def compile(self, name):
+        def malformed(df):
+            values, missing = self._lookup(df, name, lambda categories: self.ordinals(categories) + [-1])
+            return (values < 0) & ~missing, {}
+        return [('%s not a range' % name, malformed)] + super().compile(name)
+
+
+SCHEMAS = {
+    'stroke': {
+        'id': Number('int32', low=0),
+        'gender': Category(['Female', 'Male', 'Other']),
+        'age': Number('float32', low=0, high=120),
+        'hypertension': Flag(),
+        'heart_disease': Flag(),
+        'ever_married': Category(['No', 'Yes']),
+        'work_type': Category(['Govt_job', 'Never_worked', 'Private', 'Self-employed', 'children'],
+                              groups={'not_working': ['children', 'Never_worked']}),
+        'Residence_type': Category(['Rural', 'Urban']),
+        'avg_glucose_level': Number('float32', low=0, high=1000),
+        # BMIs over 60 are recorded but too rare to chart
+        'bmi': Number('float32', low=5, high=200, outlier_above=60, missing=['N/A']),
+        'smoking_status': Category(['formerly smoked', 'never smoked', 'smokes'], unknown='Unknown'),
+        'stroke': Flag(),
+    },
+    'survey': {
+        'age': Number('int8', low=0, high=120),
+        'gender': Category(['Female', 'Male']),
+        # Hours per week; up to 168, more than int8 holds
+        'exercise_duration': Number('int16', low=0, high=168),
+        'sleep_duration': Range('hours'),
+        'sugary_intake': Range('times'),
+        'junk_food': Range('times'),
+        'stress_level': Ordinal(['Never', 'Rarely', 'Sometimes', 'Always']),
+        'family_history': Category(['No', 'Yes']),
+    },
+    'cases': {
+        'year': Number('int16', low=1900, high=2100),
+        'case': Number('int32', low=0),
+        'FASILITI': Category(),
+        'BANDAR': Category(),
+        'NEGERI': Category(),
+    },
+}
+
+
+def parse_options(name, header, lenient=False):
+    # read_csv's dtype and na_values for a CSV with this header. Numeric
+    # columns are read as float64, which holds missing values, and given
+    # their declared types by clean(). A value that is not a number fails
+    # that read, so the file is read again `lenient`ly, with numeric columns
+    # as text that clean() parses, rejecting only the bad rows. Some headers
+    # carry stray spaces (e.g. 'BANDAR ' in aa.csv), so columns are matched on
+    # the stripped names.
+    schema = SCHEMAS[name]
+    columns = [(col, schema[col.strip()]) for col in header if col.strip() in schema]
+    number = object if lenient else 'float64'
+    return ({col: number if isinstance(spec, Number) else spec.dtype for col, spec in columns},
+            {col: spec.missing for col, spec in columns if spec.missing})
+
+
+def group(name, column, group_name):
+    # Values of a group declared on a categorical column
+    return SCHEMAS[name][column].groups[group_name]
+
+
+def compile_schema(name):
+    # The cleaning function of a dataset: frame -> (cleaned frame, rejected
+    # rows with the reason each was rejected for)
+    steps = [(column, message, step) for column, spec in SCHEMAS[name].items()
+             for message, step in spec.compile(column)]
+    numbers = {column: spec.dtype for column, spec in SCHEMAS[name].items() if isinstance(spec, Number)}
+    for column, dtype in numbers.items():
+        # Accepted values are cast to the column's type, so its range has to
+        # fit in it (a value that does not would wrap around silently)
+        spec = SCHEMAS[name][column]
+        info = np.iinfo(dtype) if np.dtype(dtype).kind in 'iu' else np.finfo(dtype)
+        for bound in (spec.low, spec.high):
+            assert bound is None or info.min <= bound <= info.max, (
+                '%s.%s: %s does not fit in %s' % (name, column, bound, dtype))
+
+    def clean(df):
+        reasons = np.zeros(len(df), dtype='int16')
+        messages = ['']
+        cleaned = df
+        for column, message, step in steps:
+            # Frames of grouped queries only hold some of the columns
+            if column not in df.columns:
+                continue
+            # Steps see the values earlier steps parsed
+            mask, values = step(cleaned)
+            if mask is not None and mask.any():
+                messages.append(message)
+                # A row is reported with the first reason it was rejected for
+                reasons[(reasons == 0) & mask] = len(messages) - 1
+            if values:
+                cleaned = cleaned.assign(**values)
+        rejected = reasons > 0
+        if rejected.any():
+            report = df[rejected].assign(reason=np.asarray(messages, dtype=object)[reasons[rejected]])
+            cleaned = cleaned[~rejected].reset_index(drop=True)
+        else:
+            report = df.iloc[:0].assign(reason=pd.Series(dtype=object))
+        # Only the rows kept are stored in the numeric columns' own types
+        return cleaned.astype({column: dtype for column, dtype in numbers.items() if column in cleaned.columns}), report
+
+    return clean
+
+
+def sql_condition(name, quote):
+    # SQL condition keeping the rows of a dataset's table that clean() would
+    # keep, for queries that group rows in the database instead of reading
+    # them. `quote` quotes a column name. Numbers are checked against their
+    # range and required values, categories against their values; values a
+    # database holds as text in a numeric column are not told apart (typed
+    # columns, as PostgreSQL's, cannot hold them). Ranges need a regular
+    # expression, which SQL does not have, so schemas with them are refused.
+    conditions = []
+    for column, spec in SCHEMAS[name].items():
+        quoted = quote(column)
+        if isinstance(spec, Range):
+            raise ValueError('%s.%s cannot be checked in SQL' % (name, column))
+        if isinstance(spec, Number):
+            checks = ['%s >= %r' % (quoted, spec.low)] if spec.low is not None else []
+            checks += ['%s <= %r' % (quoted, spec.high)] if spec.high is not None else []
+            if spec.required:
+                conditions += ['%s IS NOT NULL' % quoted] + checks
+            elif checks:
+                conditions.append('(%s IS NULL OR (%s))' % (quoted, ' AND '.join(checks)))
+        elif isinstance(spec, Category) and spec.values is not None:
+            allowed = list(spec.values) + ([spec.unknown] if spec.unknown else [])
+            values = ', '.join("'%s'" % value.replace("'", "''") for value in allowed)
+            conditions.append('(%s IS NULL OR %s IN (%s))' % (quoted, quoted, values))
+    return ' AND '.join(conditions) or '1 = 1'
+
+
+_cleaners = {name: compile_schema(name) for name in SCHEMAS}
+
+
+def clean(name, df):
+    # Clean a frame of dataset `name` parsed with parse_options():
+    # (cleaned frame, rejected rows)
+    return _cleaners[name](df)
@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import itertools
+import os
+import secrets
+import signal
+import subprocess
+import sys
+
+# Serve the dashboards from several Streamlit processes, so concurrent
+# viewers' reruns are not serialized by one interpreter's GIL:
+#
+#   python serve.py --workers 4 --port 8501
+#
+# The datasets' columnar caches and the stroke cube are built once before the
+# workers start. Every worker then memory-maps the same cache files (one copy
+# in the OS page cache, whatever the number of workers) and loads the saved
+# cube instead of aggregating the data again. A small TCP proxy on --port
+# hands each incoming connection to the next worker in turn; a viewer's
+# session lives on its websocket connection, so it stays on one worker.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Each worker warms itself up before opening its port (see warmup.py)
+WARMUP = os.path.join(ROOT, 'warmup.py')
+
+# Seconds between two checks that every worker is still running
+CHECK_SECONDS = 5
+
+
+def prepare():
+    # Build everything the workers share before the first one starts
+    import data
+    from sources import get_source
+
+    source = get_source()
+    source.load_all(list(data.DATA_FILES))
+    source.stroke_cube()
+
+
+def start_worker(port, cookie_secret):
+    # The same cookie secret everywhere, so cookies signed by one worker are
+    # accepted by the others
+    env = dict(os.environ, STREAMLIT_SERVER_COOKIE_SECRET=cookie_secret)
+    return subprocess.Popen([
+        sys.executable, WARMUP,
+        '--server.port', str(port),
+        '--server.address', '127.0.0.1',
+        '--server.headless', 'true',
+        '--browser.gatherUsageStats', 'false',
+    ], cwd=ROOT, env=env)
+
+
+async def _pipe(reader, writer):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+class Proxy:
+    # Forwards every incoming connection to the next worker that accepts it
+
+    def __init__(self, ports):
+        self.ports = ports
+        self._next = itertools.cycle(ports)
+
+    async def handle(self, client_reader, client_writer):
+        for _ in self.ports:
+            try:
+                upstream_reader, upstream_writer = await asyncio.open_connection('127.0.0.1', next(self._next))
+                break
+            except OSError:
+                # Worker still starting or restarting, try the next one
+                continue
+        else:
+            client_writer.close()
+            return
+        await asyncio.gather(_pipe(client_reader, upstream_writer), _pipe(upstream_reader, client_writer))
+
+
+async def serve(address, port, workers, cookie_secret):
+    # Run the proxy, restarting any worker that exits
+    proxy = Proxy(sorted(workers))
+    server = await asyncio.start_server(proxy.handle, address, port)
+    async with server:
+        while True:
+            await asyncio.sleep(CHECK_SECONDS)
+            for worker_port, process in list(workers.items()):
+                if process.poll() is not None:
+                    print('worker on port %d exited with %d, restarting' % (worker_port, process.returncode), file=sys.stderr)
+                    workers[worker_port] = start_worker(worker_port, cookie_secret)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the dashboards from several Streamlit processes.')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', '0')) or os.cpu_count() or 1)
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '8501')))
+    parser.add_argument('--address', default='0.0.0.0')
+    parser.add_argument('--worker-port', type=int, default=8600, help='port of the first worker; the others follow')
+    args = parser.parse_args()
+
+    prepare()
+    cookie_secret = os.environ.get('STREAMLIT_SERVER_COOKIE_SECRET') or secrets.token_hex(32)
+    workers = {}
+    for i in range(args.workers):
+        workers[args.worker_port + i] = start_worker(args.worker_port + i, cookie_secret)
+
+    # Stop the workers on SIGTERM as well as on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        asyncio.run(serve(args.address, args.port, workers, cookie_secret))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in workers.values():
+            process.terminate()
+        for process in workers.values():
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import math
+import random
+
+import numpy as np
+import pandas as pd
+
+# Mergeable summaries of a measurement, small enough to keep per group.
+#
+# Moments are kept as a DataFrame with one row per group and the columns
+# count, mean and m2 (sum of squared deviations from the mean), which gives
+# the variance without the cancellation of a sum of squares. Batches of
+# values are summarized exactly, then combined with existing moments with
+# Chan et al.'s parallel form of Welford's update, which is also how
+# moments of separate partitions are merged.
+
+MOMENTS = ['count', 'mean', 'm2']
+
+
+def empty_moments(index):
+    return pd.DataFrame({
+        'count': pd.Series(dtype='int64', index=index),
+        'mean': pd.Series(dtype='float64', index=index),
+        'm2': pd.Series(dtype='float64', index=index),
+    })
+
+
+def batch_moments(values, keys):
+    # Moments of `values` (a Series) per group of `keys` (anything groupby
+    # takes); missing values are left out
+    groups = values.groupby(keys, observed=True)
+    deviations = values - groups.transform('mean')
+    return pd.DataFrame({
+        'count': groups.count(),
+        'mean': groups.mean(),
+        'm2': (deviations * deviations).groupby(keys, observed=True).sum(),
+    })
+
+
+def merge_moments(left, right):
+    # Moments of the union of the groups' values
+    left, right = left.align(right, join='outer')
+    left_count = left['count'].fillna(0).to_numpy()
+    right_count = right['count'].fillna(0).to_numpy()
+    count = left_count + right_count
+    left_mean = left['mean'].fillna(0).to_numpy()
+    delta = right['mean'].fillna(0).to_numpy() - left_mean
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = left_mean + delta * np.where(count > 0, right_count / count, 0)
+        m2 = (left['m2'].fillna(0).to_numpy() + right['m2'].fillna(0).to_numpy()
+              + delta * delta * np.where(count > 0, left_count * right_count / count, 0))
+    return pd.DataFrame({'count': count.astype('int64'), 'mean': mean, 'm2': m2}, index=left.index)
+
+
+def combine_moments(moments, keys):
+    # Moments of coarser groups, each made of the rows of `moments` sharing a
+    # key (`keys` as taken by groupby)
+    weighted = moments['count'] * moments['mean']
+    count = moments['count'].groupby(keys).transform('sum')
+    deviation = moments['mean'] - weighted.groupby(keys).transform('sum') / count
+    groups = pd.DataFrame({
+        'count': moments['count'],
+        'weighted': weighted,
+        'm2': moments['m2'] + moments['count'] * deviation * deviation,
+    }).groupby(keys).sum()
+    return pd.DataFrame({
+        'count': groups['count'],
+        'mean': groups['weighted'] / groups['count'],
+        'm2': groups['m2'],
+    })
+
+
+def std(moments):
+    # Sample standard deviation of every group (NaN for single values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.sqrt(moments['m2'] / (moments['count'] - 1).where(moments['count'] > 1))
+
+
+class KLLSketch:
+    # Quantile sketch of Karnin, Lang and Liberty. Values are kept in a stack
+    # of compactors; a full compactor sorts its values and promotes every
+    # other one (with a random offset) to the next level, where each value
+    # stands for twice as many. Memory stays around k * log(n / k) values,
+    # ranks are off by about 1.7 / k of the count, and two sketches merge by
+    # stacking their compactors.
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.count = 0
+        self.compactors = [np.empty(0)]
+        self._random = random.Random(seed)
+
+    def copy(self):
+        sketch = KLLSketch(self.k)
+        sketch.count = self.count
+        sketch.compactors = list(self.compactors)
+        sketch._random.setstate(self._random.getstate())
+        return sketch
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _size(self):
+        return sum(len(compactor) for compactor in self.compactors)
+
+    def _max_size(self):
+        return sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def update(self, values):
+        # Add a batch of values (or a single one)
+        values = np.atleast_1d(np.asarray(values, dtype='float64'))
+        values = values[~np.isnan(values)]
+        self.compactors[0] = np.concatenate([self.compactors[0], values])
+        self.count += len(values)
+        self._compress()
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append(np.empty(0))
+        for level, values in enumerate(other.compactors):
+            self.compactors[level] = np.concatenate([self.compactors[level], values])
+        self.count += other.count
+        self._compress()
+
+    def _compress(self):
+        while self._size() >= self._max_size():
+            for level, values in enumerate(self.compactors):
+                if len(values) >= self._capacity(level):
+                    if level + 1 == len(self.compactors):
+                        self.compactors.append(np.empty(0))
+                    values = np.sort(values)
+                    # An odd value out stays on this level
+                    rest = values[len(values) - len(values) % 2:]
+                    promoted = values[self._random.random() < 0.5:len(values) - len(values) % 2:2]
+                    self.compactors[level] = rest
+                    self.compactors[level + 1] = np.concatenate([self.compactors[level + 1], promoted])
+                    break
+
+    def quantiles(self, qs):
+        # Estimated values at the given quantiles (NaN when empty)
+        qs = np.atleast_1d(qs)
+        if not self.count:
+            return np.full(len(qs), np.nan)
+        values = np.concatenate(self.compactors)
+        weights = np.concatenate([np.full(len(c), 2 ** level) for level, c in enumerate(self.compactors)])
+        order = np.argsort(values, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        ranks = np.searchsorted(cumulative, qs * cumulative[-1], side='left')
+        return values[order][np.minimum(ranks, len(values) - 1)]
+
+
+def batch_sketches(values, keys, k=200):
+    # A sketch of `values` for every group of `keys`: {key: KLLSketch}
+    values = np.asarray(values, dtype='float64')
+    keys = np.asarray(keys)
+    order = np.argsort(keys, kind='stable')
+    groups, starts = np.unique(keys[order], return_index=True)
+    sketches = {}
+    for key, chunk in zip(groups.tolist(), np.split(values[order], starts[1:])):
+        sketch = KLLSketch(k)
+        sketch.update(chunk)
+        sketches[key] = sketch
+    return sketches
@@ -0,0 +1,115 @@
+import logging
+import os
+import threading
+import time
+import types
+from collections import namedtuple
+
+import filters
+import instrument
+import risk
+from charts import CHARTS, get_figure
+from figcache import encoded_figure, prefetch, send_figure
+from sources import get_source
+
+# A background thread keeps a snapshot of every chart, built and encoded, and
+# checks the data files for changes every SNAPSHOT_REFRESH_SECONDS. When one
+# changed, it builds a new snapshot next to the old one and then swaps the
+# pointer, so reruns keep drawing the old charts until the new ones are
+# complete and never wait for a rebuild. Only the first rerun of a process
+# waits, for the first snapshot. With DASHBOARD_PROFILE=1 the stages of every
+# build are recorded like a rerun's and kept with the snapshot.
+REFRESH_SECONDS = float(os.environ.get('SNAPSHOT_REFRESH_SECONDS', '2'))
+
+logger = logging.getLogger('dashboard.snapshot')
+
+
+class Snapshot(namedtuple('Snapshot', ['versions', 'figures', 'encoded', 'risk', 'built_at', 'stages'])):
+    # Every chart, built and encoded from one version of each dataset.
+    # versions: ((dataset, content hash), ...); figures and encoded: read-only
+    # mappings of chart id -> figure / EncodedFigure; risk: the what-if
+    # model, (version, model), with its cohort already scored (see risk.py);
+    # stages: the stages of its build when profiling (see instrument.py). Never changed once
+    # published; a refresh publishes a new snapshot instead.
+    __slots__ = ()
+
+    def plotly_chart(self, chart_id, theme='streamlit'):
+        return send_figure(chart_id, self.figures[chart_id], self.encoded[chart_id], theme)
+
+
+def _versions():
+    datasets = sorted({dataset for dataset, _, _ in CHARTS.values()})
+    return tuple(zip(datasets, get_source().versions(datasets)))
+
+
+def build_snapshot():
+    # Runs on the refresher (or warm-up) thread, which records its own stages
+    instrument.start_rerun(instrument.ENABLED)
+    try:
+        versions = _versions()
+        # Fetch the datasets at the same time, then build the charts of the
+        # different datasets side by side on the backend
+        get_source().load_all([dataset for dataset, _ in versions])
+        prefetch(list(CHARTS))
+        figures = {chart_id: get_figure(chart_id) for chart_id in CHARTS}
+        encoded = {chart_id: encoded_figure(chart_id) for chart_id in CHARTS}
+        risk_model = risk.warm_up()
+        # The sidebar filters' index, so it is ready with the charts
+        if filters.available():
+            filters.stroke_filter_index()
+    finally:
+        stages = instrument.finish_rerun('snapshot')
+    return Snapshot(versions, types.MappingProxyType(figures), types.MappingProxyType(encoded), risk_model, time.time(),
+                    tuple(stages))
+
+
+# The published snapshot; replacing it is a single reference assignment
+_snapshot = None
+# Why the last refresh failed, raised to viewers while there is no snapshot yet
+_error = None
+_ready = threading.Event()
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def _refresh_forever():
+    global _snapshot, _error
+    while True:
+        try:
+            if _snapshot is None or _versions() != _snapshot.versions:
+                _snapshot = build_snapshot()
+                _error = None
+        except Exception as exc:
+            # Keep serving the last good snapshot and try again later
+            logger.exception('Refreshing the dashboard snapshot failed')
+            _error = exc
+        _ready.set()
+        time.sleep(REFRESH_SECONDS)
+
+
+def start():
+    # Start the refresher thread, once per process
+    global _thread
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_refresh_forever, name='snapshot-refresher', daemon=True)
+            _thread.start()
+
+
+def warm_up():
+    # Build and publish the first snapshot on the calling thread (e.g. before
+    # the server accepts viewers), then start the refresher
+    global _snapshot
+    _snapshot = build_snapshot()
+    _ready.set()
+    start()
+
+
+def current():
+    # The latest published snapshot
+    start()
+    _ready.wait()
+    snapshot = _snapshot
+    if snapshot is None:
+        raise _error
+    return snapshot
@@ -0,0 +1,434 @@
+import abc
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import data
+from aggregates import StrokeCube, _object_levels, stroke_cube
+from casestore import CaseStore, case_store
+from contingency import SurveyTables
+from instrument import stage
+from schema import SCHEMAS, clean, sql_condition
+
+# The optional packages are only needed by the sources that use them
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on the installed packages
+    pq = None
+try:
+    import asyncpg
+except ImportError:  # pragma: no cover - depends on the installed packages
+    asyncpg = None
+
+# Where the dashboards read their datasets from, set through environment
+# variables:
+#   DATA_SOURCE            'csv' (the CSV files, see data.py), 'parquet:<folder>'
+#                          (one .parquet file per dataset, named like its CSV),
+#                          'sqlite:///<path>' or 'postgresql://...' (one table
+#                          per dataset, named like the dataset)
+#   DATA_SOURCE_POOL_SIZE  connections the SQL sources keep open
+#
+#   python sources.py --export parquet:data/      copies the CSVs to Parquet files
+#   python sources.py --export sqlite:///stroke.db     or to SQLite tables
+DATA_SOURCE = os.environ.get('DATA_SOURCE', 'csv')
+POOL_SIZE = int(os.environ.get('DATA_SOURCE_POOL_SIZE', '4'))
+
+
+def _typed(name, df):
+    # A frame read from elsewhere, with the CSV's stripped column names,
+    # cleaned like the CSV's rows (which also gives numeric columns their
+    # declared types)
+    df.columns = df.columns.str.strip()
+    return clean(name, df.astype({col: dtype for col, dtype in data.DTYPES[name].items()
+                                  if col in df.columns and dtype == 'category'}))[0]
+
+
+class DataSource(abc.ABC):
+    # Gives the charts their inputs: the datasets and what is computed from
+    # them, each kept until the dataset's version changes. Sources implement
+    # version() and _read(), and may compute the inputs more cheaply where
+    # they can (e.g. in the database). A source missing either cannot be
+    # created.
+
+    def __init__(self):
+        # input name -> (dataset version, value). Inputs are built from other
+        # inputs (e.g. the cube from the frame), so the lock is re-entrant.
+        self._inputs = {}
+        self._lock = threading.RLock()
+
+    @abc.abstractmethod
+    def version(self, name):
+        pass
+
+    def versions(self, names):
+        return [self.version(name) for name in names]
+
+    @abc.abstractmethod
+    def _read(self, name):
+        pass
+
+    def streamed(self, name):
+        # Whether the dataset is too big to be loaded and is only aggregated
+        return False
+
+    def _cached(self, key, name, build, version=None):
+        # The input `key` for the current version of dataset `name`, built
+        # with build() when missing or older: (version, value)
+        version = version or self.version(name)
+        current = self._inputs.get(key)
+        if current is not None and current[0] == version:
+            return current
+        with self._lock:
+            current = self._inputs.get(key)
+            if current is None or current[0] != version:
+                current = self._inputs[key] = (version, build())
+            return current
+
+    def versioned(self, name):
+        # The dataset together with its version: (version, frame)
+        return self._cached('frame:' + name, name, lambda: self._read(name))
+
+    def load(self, name):
+        return self.versioned(name)[1]
+
+    def load_all(self, names):
+        # Load several datasets side by side rather than one after another
+        # (streamed ones are only aggregated, never loaded)
+        names = [name for name in names if not self.streamed(name)]
+        with ThreadPoolExecutor(max(len(names), 1), thread_name_prefix='load') as pool:
+            return dict(zip(names, pool.map(self.load, names)))
+
+    # Inputs of the charts (see charts.CHARTS)
+
+    def stroke_cube(self):
+        return self._cached('stroke_cube', 'stroke', lambda: StrokeCube.from_frame(self.load('stroke')))[1]
+
+    def stroke_counts(self):
+        # Anything with StrokeCube.stroke_counts()
+        return self.stroke_cube()
+
+    def survey(self):
+        return self.load('survey')
+
+    def survey_tables(self):
+        def build():
+            df2 = self.load('survey')
+            with stage('aggregate:survey_tables', rows=len(df2)):
+                return SurveyTables.from_frame(df2)
+        return self._cached('survey_tables', 'survey', build)[1]
+
+    def case_store(self):
+        return self._cached('case_store', 'cases', lambda: CaseStore.from_frame(self.load('cases')))[1]
+
+
+class CsvSource(DataSource):
+    # The app's CSV files, read through the columnar caches and incremental
+    # aggregates of data.py, aggregates.py and casestore.py
+
+    def version(self, name):
+        return data.dataset_version(name)
+
+    def _read(self, name):
+        return data.versioned_dataset(name)[1]
+
+    def versioned(self, name):
+        return data.versioned_dataset(name)
+
+    def streamed(self, name):
+        return data.is_streamed(name)
+
+    def stroke_cube(self):
+        return stroke_cube()
+
+    def case_store(self):
+        return case_store()
+
+
+class ParquetSource(DataSource):
+    # One Parquet file per dataset in `folder`, named like the dataset's CSV
+    # ('aa.csv' -> 'aa.parquet')
+
+    def __init__(self, folder):
+        if pq is None:
+            raise RuntimeError('Reading Parquet files needs the pyarrow package')
+        super().__init__()
+        self.folder = folder
+
+    def path(self, name):
+        return os.path.join(self.folder, os.path.splitext(data.DATA_FILES[name])[0] + '.parquet')
+
+    def version(self, name):
+        # Parquet files are written whole, so their mtime and size tell
+        # versions apart without reading them
+        stat = os.stat(self.path(name))
+        return '%d-%d' % (stat.st_mtime_ns, stat.st_size)
+
+    def _read(self, name):
+        with stage('read_parquet:' + name) as record:
+            df = _typed(name, pq.read_table(self.path(name)).to_pandas())
+            record.rows = len(df)
+        return df
+
+
+class SqliteClient:
+    # Asyncio client for a SQLite database. sqlite3 blocks, so every query
+    # runs on one of `size` threads, each taking a connection from a pool
+    # that is opened once and reused.
+
+    def __init__(self, path, size):
+        self.path = path
+        self._connections = queue.LifoQueue()
+        for _ in range(size):
+            connection = sqlite3.connect('file:%s?mode=ro' % path, uri=True, check_same_thread=False)
+            self._connections.put(connection)
+        self._executor = ThreadPoolExecutor(size, thread_name_prefix='sqlite')
+
+    def _query(self, sql):
+        connection = self._connections.get()
+        try:
+            cursor = connection.execute(sql)
+            return [column[0] for column in cursor.description], cursor.fetchall()
+        finally:
+            self._connections.put(connection)
+
+    async def fetch(self, sql):
+        # Column names and rows of the query's result
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._query, sql)
+
+    async def marker(self, table):
+        # Something that moves whenever the table may have changed, without
+        # reading it: every write changes the database file or its WAL
+        marker = []
+        for path in (self.path, self.path + '-wal'):
+            try:
+                stat = os.stat(path)
+                marker += [stat.st_mtime_ns, stat.st_size]
+            except OSError:
+                marker += [None, None]
+        return tuple(marker)
+
+
+class PostgresClient:
+    # Asyncio client for a PostgreSQL database, over an asyncpg connection
+    # pool opened on first use
+
+    def __init__(self, url, size):
+        if asyncpg is None:
+            raise RuntimeError('Reading from PostgreSQL needs the asyncpg package')
+        self.url = url
+        self.size = size
+        self._pool = None
+        self._pool_lock = None
+
+    async def fetch(self, sql):
+        # Column names and rows of the query's result
+        if self._pool_lock is None:
+            self._pool_lock = asyncio.Lock()
+        async with self._pool_lock:
+            if self._pool is None:
+                self._pool = await asyncpg.create_pool(self.url, min_size=1, max_size=self.size)
+        async with self._pool.acquire() as connection:
+            statement = await connection.prepare(sql)
+            rows = await statement.fetch()
+        return [attribute.name for attribute in statement.get_attributes()], [tuple(row) for row in rows]
+
+    async def marker(self, table):
+        # Something that moves whenever the table may have changed, without
+        # reading it: the statistics collector's write counters
+        _, rows = await self.fetch(
+            "SELECT n_tup_ins, n_tup_upd, n_tup_del FROM pg_stat_user_tables WHERE relname = '%s'" % table)
+        return tuple(rows[0]) if rows else None
+
+
+def _quote(column):
+    return '"%s"' % column
+
+
+def _labelled(name, column):
+    # A categorical column with its missing values given the schema's label
+    # for unknown values, if it has one
+    unknown = getattr(SCHEMAS[name][column], 'unknown', None)
+    if unknown is None:
+        return _quote(column)
+    return "COALESCE(%s, '%s') AS %s" % (_quote(column), unknown.replace("'", "''"), _quote(column))
+
+
+class SqlSource(DataSource):
+    # One table per dataset in a SQL database, named like the dataset
+    # ('stroke', 'survey', 'cases'), with the CSV's (stripped) column names.
+    # Queries run on the source's own event loop thread, so connections are
+    # pooled across reruns and sessions, and queries for several datasets
+    # run at the same time. Chart 1 and 2's stroke counts and chart 6's case
+    # totals are grouped in the database, which returns a few hundred rows
+    # instead of every patient or submission; the rows the schema rejects
+    # (see schema.sql_condition()) are left out there, as they are from the
+    # rows read whole.
+
+    # The tables are expected to only ever grow or be replaced, so a
+    # version is their row count and a few sums, which any change to the
+    # rows read by the charts moves. Counting and summing reads the whole
+    # table, so it only runs when the client's cheap change marker for the
+    # table moved (the SQLite file's mtime and size, PostgreSQL's write
+    # counters); otherwise the last version is returned.
+    VERSION_COLUMNS = {
+        'stroke': ['stroke', 'avg_glucose_level', 'bmi', 'age'],
+        'survey': ['age', 'exercise_duration'],
+        'cases': ['year', 'case'],
+    }
+
+    def __init__(self, url, pool_size=POOL_SIZE):
+        super().__init__()
+        if url.startswith('sqlite:///'):
+            self.client = SqliteClient(url[len('sqlite:///'):], pool_size)
+        else:
+            self.client = PostgresClient(url, pool_size)
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name='sql-source', daemon=True).start()
+        # table -> (change marker, version)
+        self._versions = {}
+
+    def _run(self, coroutine):
+        # Run a coroutine on the source's event loop and wait for its result
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _frame(self, sql):
+        columns, rows = await self.client.fetch(sql)
+        return pd.DataFrame.from_records(rows, columns=columns)
+
+    async def _version(self, name):
+        marker = await self.client.marker(name)
+        current = self._versions.get(name)
+        if marker is not None and current is not None and current[0] == marker:
+            return current[1]
+        sums = ', '.join('SUM(%s)' % _quote(column) for column in self.VERSION_COLUMNS[name])
+        _, rows = await self.client.fetch('SELECT COUNT(*), %s FROM %s' % (sums, name))
+        version = repr(tuple(rows[0]))
+        # The marker was read first, so a change made meanwhile is counted
+        # again on the next call
+        self._versions[name] = (marker, version)
+        return version
+
+    def version(self, name):
+        return self._run(self._version(name))
+
+    def versions(self, names):
+        async def gather():
+            return await asyncio.gather(*(self._version(name) for name in names))
+        return self._run(gather())
+
+    def _read(self, name):
+        with stage('read_sql:' + name) as record:
+            df = _typed(name, self._run(self._frame('SELECT * FROM %s' % name)))
+            record.rows = len(df)
+        return df
+
+    def load_all(self, names):
+        # Query every dataset at once on the pooled connections
+        versions = self.versions(names)
+        stale = [name for name, version in zip(names, versions)
+                 if self._inputs.get('frame:' + name, (None,))[0] != version]
+
+        async def gather():
+            return await asyncio.gather(*(self._frame('SELECT * FROM %s' % name) for name in stale))
+        with stage('read_sql:' + ','.join(stale)):
+            frames = dict(zip(stale, self._run(gather()))) if stale else {}
+        for name, version in zip(names, versions):
+            if name in frames:
+                self._cached('frame:' + name, name, lambda: _typed(name, frames[name]), version)
+        return {name: self.load(name) for name in names}
+
+    def stroke_counts(self):
+        # A cube holding only the patient and stroke counts, grouped in the
+        # database
+        def build():
+            # Missing values are given the label clean() gives them, so the
+            # groups are named by their position
+            dimensions = ', '.join(_labelled('stroke', column) for column in StrokeCube.DIMENSIONS)
+            positions = ', '.join(str(i + 1) for i in range(len(StrokeCube.DIMENSIONS)))
+            sql = 'SELECT %s, COUNT(*) AS "rows", SUM("stroke") AS "strokes" FROM stroke WHERE %s GROUP BY %s' % (
+                dimensions, sql_condition('stroke', _quote), positions)
+            with stage('aggregate_sql:stroke_counts'):
+                cells = self._run(self._frame(sql)).set_index(StrokeCube.DIMENSIONS)
+            cube = StrokeCube()
+            cube.cells = cells.astype('int64')
+            cube.cells.index = _object_levels(cube.cells.index)
+            cube.rows = int(cube.cells['rows'].sum())
+            return cube
+        return self._cached('stroke_counts', 'stroke', build)[1]
+
+    def case_store(self):
+        # Cases summed per facility and year in the database; the store sums
+        # them into its partitions and totals
+        def build():
+            columns = ', '.join(_quote(column) for column in ['year', 'NEGERI', 'BANDAR', 'FASILITI'])
+            sql = 'SELECT %s, SUM("case") AS "case" FROM cases WHERE %s GROUP BY %s' % (
+                columns, sql_condition('cases', _quote), columns)
+            with stage('aggregate_sql:case_store'):
+                return CaseStore.from_frame(_typed('cases', self._run(self._frame(sql))))
+        return self._cached('case_store', 'cases', build)[1]
+
+
+def make_source(spec):
+    # Source for a DATA_SOURCE value
+    if spec == 'csv':
+        return CsvSource()
+    if spec.startswith('parquet:'):
+        return ParquetSource(spec[len('parquet:'):])
+    if spec.startswith(('sqlite:///', 'postgresql://', 'postgres://')):
+        return SqlSource(spec)
+    raise ValueError('Unknown data source %r, expected csv, parquet:<folder>, sqlite:///<path> '
+                     'or postgresql://...' % spec)
+
+
+_source = None
+_source_lock = threading.Lock()
+
+
+def get_source():
+    # The source configured by DATA_SOURCE, created on first use and then
+    # shared by every session in the process
+    global _source
+    if _source is None:
+        with _source_lock:
+            if _source is None:
+                _source = make_source(DATA_SOURCE)
+    return _source
+
+
+def set_source(source):
+    global _source
+    _source = source
+
+
+def dataset_version(name):
+    return get_source().version(name)
+
+
+def export(spec):
+    # Copy the CSV datasets to the Parquet files or SQL tables `spec` reads
+    frames = {name: data.read_dataset(name) for name in data.DATA_FILES}
+    if spec.startswith('parquet:'):
+        source = ParquetSource(spec[len('parquet:'):])
+        os.makedirs(source.folder, exist_ok=True)
+        for name, df in frames.items():
+            df.to_parquet(source.path(name), index=False)
+    elif spec.startswith('sqlite:///'):
+        with sqlite3.connect(spec[len('sqlite:///'):]) as connection:
+            for name, df in frames.items():
+                df.to_sql(name, connection, index=False, if_exists='replace')
+    else:
+        raise ValueError('Can only export to parquet:<folder> or sqlite:///<path>, not %r' % spec)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Copy the CSV datasets to another data source.')
+    parser.add_argument('--export', required=True, metavar='SOURCE', help='parquet:<folder> or sqlite:///<path>')
+    args = parser.parse_args()
+    export(args.export)
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The app's modules live at the root of the repository, the synthetic data
+# generator with the benchmarks
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+
+@pytest.fixture
+def stroke_rows():
+    # Cleaned stroke rows, some with a missing or outlier BMI
+    import data
+    import schema
+    from synthetic import stroke_chunk
+
+    rng = np.random.default_rng(0)
+    df = stroke_chunk(rng, 0, 3000)
+    df.loc[rng.random(len(df)) < 0.05, 'bmi'] = np.nan
+    return schema.clean('stroke', df.astype(data.DTYPES['stroke']))[0]
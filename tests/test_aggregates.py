@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from aggregates import StrokeCube
+from sketches import std
+
+
+def assert_same_cube(cube, expected):
+    assert cube.rows == expected.rows
+    pd.testing.assert_frame_equal(cube.cells.sort_index(), expected.cells.sort_index())
+    pd.testing.assert_frame_equal(cube.bmi.sort_index(), expected.bmi.sort_index(), rtol=1e-12)
+    pd.testing.assert_series_equal(cube.density.sort_index(), expected.density.sort_index())
+    for name in ('glucose', 'cell_glucose'):
+        pd.testing.assert_frame_equal(getattr(cube, name).sort_index(), getattr(expected, name).sort_index(),
+                                      rtol=1e-9, check_dtype=False)
+    assert {key: s.count for key, s in cube.glucose_sketches.items()} == {
+        key: s.count for key, s in expected.glucose_sketches.items()}
+
+
+def test_cube_counts_like_groupby(stroke_rows):
+    cube = StrokeCube.from_frame(stroke_rows)
+    expected = stroke_rows.groupby(StrokeCube.DIMENSIONS, observed=True)['stroke'].agg(['size', 'sum'])
+    cells = cube.cells.loc[expected.index.to_list()]
+    np.testing.assert_array_equal(cells['rows'], expected['size'])
+    np.testing.assert_array_equal(cells['strokes'], expected['sum'])
+
+    kept = stroke_rows[~stroke_rows['bmi_outlier'] & stroke_rows['bmi'].notna()]
+    glucose = kept['avg_glucose_level'].astype('float64')
+    by_bmi = glucose.groupby(np.rint(kept['bmi'].astype('float64') * 10) / 10).agg(['size', 'mean', 'std'])
+    spread = cube.glucose_spread()
+    np.testing.assert_allclose(cube.glucose_by_bmi().loc[by_bmi.index], by_bmi['mean'], rtol=1e-9)
+    np.testing.assert_allclose(std(cube.glucose.loc[np.rint(by_bmi.index * 10)]), by_bmi['std'], rtol=1e-9)
+    np.testing.assert_array_equal(spread.loc[by_bmi.index, 'count'], by_bmi['size'])
+
+
+def test_appended_cube_matches_a_rebuild(stroke_rows):
+    first, rest = stroke_rows.iloc[:2000], stroke_rows.iloc[2000:]
+    cube = StrokeCube.from_frame(first)
+    appended = cube.copy()
+    appended.append(rest)
+    assert_same_cube(appended, StrokeCube.from_frame(stroke_rows))
+    # The cube it was copied from is left as it was
+    assert_same_cube(cube, StrokeCube.from_frame(first))
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from casestore import CaseStore
+
+
+def case_rows(rows=400, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'year': rng.integers(2018, 2023, rows),
+        'case': rng.integers(1, 100, rows),
+        'FASILITI': rng.choice(['Hospital %d' % i for i in range(12)], rows),
+        'BANDAR': rng.choice(['Bandar A', 'Bandar B', 'Bandar C'], rows),
+        'NEGERI': rng.choice(['Johor', 'Kedah', 'Perak', 'Selangor'], rows),
+    }).astype({'FASILITI': 'category', 'BANDAR': 'category', 'NEGERI': 'category'})
+
+
+def assert_like_groupby(store, df3):
+    years, states, matrix = store.state_year_matrix()
+    expected = df3.groupby(['year', 'NEGERI'], observed=True)['case'].sum().unstack(fill_value=0)
+    expected = expected.reindex(index=years, columns=states, fill_value=0)
+    np.testing.assert_array_equal(matrix, expected.to_numpy())
+    assert list(matrix.sum(axis=0)) == sorted(matrix.sum(axis=0), reverse=True)
+
+    cities = df3.groupby(['year', 'NEGERI', 'BANDAR'], observed=True)['case'].sum()
+    assert store.city_cases().sort_index().to_dict() == cities.sort_index().to_dict()
+
+    facilities = df3[df3['NEGERI'] == 'Perak'].groupby(['BANDAR', 'FASILITI', 'year'], observed=True)['case'].sum()
+    facilities = facilities.unstack(fill_value=0)
+    stored = store.facility_cases('Perak')
+    stored = stored[sorted(stored.columns)].sort_index()
+    np.testing.assert_array_equal(stored.to_numpy(), facilities.sort_index().to_numpy())
+
+
+def test_store_totals_like_groupby():
+    df3 = case_rows()
+    assert_like_groupby(CaseStore.from_frame(df3), df3)
+
+
+def test_appended_store_matches_a_rebuild():
+    df3 = case_rows()
+    # The new rows bring a year and a state the first ones did not have
+    first = df3[(df3['year'] < 2022) & (df3['NEGERI'] != 'Kedah')]
+    rest = df3.drop(first.index)
+    store = CaseStore.from_frame(first)
+    appended = store.copy()
+    appended.append(rest)
+
+    rebuilt = CaseStore.from_frame(pd.concat([first, rest]))
+    assert appended.rows == rebuilt.rows == len(df3)
+    assert appended.partitions == rebuilt.partitions
+    assert appended.state_totals == rebuilt.state_totals
+    assert appended.city_totals == rebuilt.city_totals
+    assert_like_groupby(appended, pd.concat([first, rest]))
+    # The store it was copied from still holds only the first rows
+    assert_like_groupby(store, first)
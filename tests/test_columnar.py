@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import columnar
+
+
+def frame():
+    return pd.DataFrame({
+        'age': np.arange(1000, dtype='float32'),
+        'gender': pd.Categorical(np.where(np.arange(1000) % 3, 'Male', 'Female')),
+    })
+
+
+def assert_same_frame(mapped, expected):
+    # The mapped columns are np.memmap views, so values are compared
+    assert list(mapped.columns) == list(expected.columns)
+    for column in expected.columns:
+        assert mapped[column].dtype == expected[column].dtype
+        assert mapped[column].tolist() == expected[column].tolist()
+
+
+def test_cache_round_trip(tmp_path):
+    csv_path = str(tmp_path / 'data.csv')
+    meta = columnar.write_cache(frame(), csv_path, {'hash': 'abc'})
+    assert columnar.read_meta(csv_path) == meta
+    assert_same_frame(columnar.read_cache(csv_path, meta), frame())
+
+
+def test_rewriting_a_version_leaves_mapped_files_intact(tmp_path):
+    csv_path = str(tmp_path / 'data.csv')
+    meta = columnar.write_cache(frame(), csv_path, {'hash': 'abc'})
+    mapped = columnar.read_cache(csv_path, meta)
+    # Another process writing the same version replaces the files instead of
+    # truncating them under the mapping
+    columnar.write_cache(frame(), csv_path, {'hash': 'abc'})
+    assert_same_frame(mapped, frame())
+    assert not [name for name in os.listdir(columnar.cache_dir(csv_path)) if name.endswith('.tmp')]
@@ -0,0 +1,56 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data
+import schema
+from contingency import SurveyTables, chi2_sf
+
+
+@pytest.mark.parametrize('statistic', [0.01, 0.5, 1.0, 3.84, 10.0, 40.0])
+def test_chi2_sf_matches_closed_forms(statistic):
+    x = statistic / 2
+    assert chi2_sf(statistic, 1) == pytest.approx(math.erfc(math.sqrt(x)), rel=1e-9, abs=1e-15)
+    assert chi2_sf(statistic, 2) == pytest.approx(math.exp(-x), rel=1e-9, abs=1e-15)
+    assert chi2_sf(statistic, 4) == pytest.approx(math.exp(-x) * (1 + x), rel=1e-9, abs=1e-15)
+    assert chi2_sf(statistic, 6) == pytest.approx(math.exp(-x) * (1 + x + x * x / 2), rel=1e-9, abs=1e-15)
+
+
+def test_chi2_sf_edges():
+    assert chi2_sf(0.0, 3) == 1.0
+    assert math.isnan(chi2_sf(1.0, 0))
+    assert math.isnan(chi2_sf(float('nan'), 2))
+
+
+@pytest.fixture
+def survey_rows():
+    from synthetic import survey_chunk
+
+    df2 = survey_chunk(np.random.default_rng(0), 0, 2000)
+    return schema.clean('survey', df2.astype(data.DTYPES['survey']))[0]
+
+
+def test_tables_match_crosstab_and_groupby(survey_rows):
+    tables = SurveyTables.from_frame(survey_rows)
+    table = tables.table('stress_level', 'gender')
+    expected = pd.crosstab(survey_rows['stress_level'], survey_rows['gender'])
+    crosstab = table.crosstab()
+    np.testing.assert_array_equal(crosstab.loc[expected.index, expected.columns], expected)
+    # Rows follow the order of the answers, not the alphabet
+    assert list(crosstab.index) == [level for level in ['Never', 'Rarely', 'Sometimes', 'Always']
+                                    if level in expected.index]
+
+    means = survey_rows.groupby(['sugary_intake', 'gender'], observed=True)['exercise_duration'].mean().unstack()
+    table_means = tables.table('sugary_intake', 'gender').means('exercise_duration')
+    np.testing.assert_allclose(table_means.loc[means.index, means.columns], means, rtol=1e-12)
+
+
+def test_chi_square_matches_the_expected_counts(survey_rows):
+    observed = pd.crosstab(survey_rows['junk_food'], survey_rows['family_history']).to_numpy()
+    expected = observed.sum(axis=1, keepdims=True) * observed.sum(axis=0, keepdims=True) / observed.sum()
+    statistic, dof, p_value = SurveyTables.from_frame(survey_rows).table('junk_food', 'family_history').chi_square()
+    assert statistic == pytest.approx(((observed - expected) ** 2 / expected).sum(), rel=1e-12)
+    assert dof == (observed.shape[0] - 1) * (observed.shape[1] - 1)
+    assert p_value == pytest.approx(chi2_sf(statistic, dof))
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import figcache
+
+
+def send_a_figure():
+    import plotly.graph_objs as go
+    import plotly.io as pio
+
+    import figcache
+
+    fig = go.Figure(go.Bar(x=[1, 2, 3], y=[4, 5, 6]))
+    figcache.send_figure('test', fig, figcache.EncodedFigure('key', pio.to_json(fig, validate=False)))
+
+
+def sent_figure(monkeypatch, encoded):
+    monkeypatch.setattr(figcache, 'ENCODED_SENDS', encoded)
+    app = AppTest.from_function(send_a_figure).run()
+    assert not app.exception
+    charts = app.get('plotly_chart')
+    assert len(charts) == 1
+    return json.loads(charts[0].proto.spec)
+
+
+@pytest.mark.skipif(not figcache.ENCODED_SENDS, reason='Streamlit release the internals were not tested against')
+def test_encoded_sends_match_st_plotly_chart(monkeypatch):
+    encoded = sent_figure(monkeypatch, True)
+    # Sent through the internals, without falling back
+    assert figcache.ENCODED_SENDS
+    plain = sent_figure(monkeypatch, False)
+    assert encoded['data'] == plain['data']
+
+
+def test_failing_internals_fall_back_to_st_plotly_chart(monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError('internals changed')
+    monkeypatch.setattr(figcache, '_send_encoded', broken)
+    spec = sent_figure(monkeypatch, True)
+    assert spec['data'][0]['type'] == 'bar'
+    # Later figures go straight to st.plotly_chart
+    assert not figcache.ENCODED_SENDS
+
+
+def test_sends_are_only_encoded_on_the_tested_releases():
+    import streamlit
+    from packaging.version import Version
+
+    low, high = (Version(v) for v in figcache.TESTED_STREAMLIT)
+    assert figcache.ENCODED_SENDS == (low <= Version(streamlit.__version__) < high)
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregates import StrokeCube
+from filters import FilterIndex
+
+SELECTIONS = [
+    {},
+    {'gender': ['Female']},
+    {'age': (40, 60)},
+    {'gender': ['Male', 'Other'], 'hypertension': [1], 'age': (30.5, 80)},
+    {'smoking_status': ['smokes', 'Unknown'], 'Residence_type': ['Rural'], 'heart_disease': [0]},
+    {'gender': []},
+    {'age': (200, 300)},
+]
+
+
+def pandas_mask(df1, selections):
+    mask = pd.Series(True, index=df1.index)
+    for column, picked in selections.items():
+        if column == 'age':
+            mask &= df1['age'].between(*picked)
+        else:
+            mask &= df1[column].isin(picked)
+    return mask.to_numpy()
+
+
+@pytest.mark.parametrize('selections', SELECTIONS)
+def test_select_matches_a_pandas_mask(stroke_rows, selections):
+    index = FilterIndex(stroke_rows)
+    rows = index.select(index.normalize(selections))
+    np.testing.assert_array_equal(rows, np.flatnonzero(pandas_mask(stroke_rows, selections)))
+
+
+def test_unrestricted_columns_are_left_out(stroke_rows):
+    index = FilterIndex(stroke_rows)
+    low, high = index.bounds('age')
+    everything = {column: index.values[column] for column in index.CATEGORIES}
+    assert index.normalize(dict(everything, age=(low, high))) == ()
+    assert index.normalize({'smoking_status': ['smokes', 'never smoked']}) == (
+        ('smoking_status', ('never smoked', 'smokes')),)
+
+
+def test_filtered_cube_counts_only_the_matching_rows(stroke_rows):
+    index = FilterIndex(stroke_rows)
+    selections = SELECTIONS[3]
+    cube = index.cube(index.normalize(selections))
+    expected = StrokeCube.from_frame(stroke_rows[pandas_mask(stroke_rows, selections)])
+    assert cube.rows == expected.rows
+    pd.testing.assert_frame_equal(cube.cells.sort_index(), expected.cells.sort_index())
+    # Kept for the next rerun asking for the same rows
+    assert index.cube(index.normalize(selections)) is cube
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import schema
+from schema import Number
+
+
+def stroke_frame(**overrides):
+    # Stroke rows typed as parse_options() reads them: numbers as float64,
+    # text as categories
+    rows = {
+        'id': [1, 2, 3, 4, 5, 6, 7],
+        'gender': ['Male', 'Female', 'Alien', 'Male', 'Female', 'Other', 'Male'],
+        'age': [50, -3, 40, 30, 61, 70, 20],
+        'hypertension': [0, 1, 0, np.nan, 1, 0, 0],
+        'heart_disease': [0, 0, 0, 0, 1, 0, 0],
+        'ever_married': ['Yes', 'No', 'Yes', 'Yes', 'No', 'Yes', 'No'],
+        'work_type': ['Private', 'children', 'Private', 'Govt_job', 'Self-employed', 'Private', 'Never_worked'],
+        'Residence_type': ['Urban', 'Rural', 'Urban', 'Urban', 'Rural', 'Urban', 'Rural'],
+        'avg_glucose_level': [100.5, 90.0, 80.0, 120.0, 200.0, 95.0, 85.0],
+        'bmi': [28.1, np.nan, 30.0, 25.0, 70.5, 22.0, 19.0],
+        'smoking_status': ['smokes', None, 'never smoked', 'smokes', 'formerly smoked', np.nan, 'never smoked'],
+        'stroke': [1, 0, 0, 0, 1, 0, 0],
+    }
+    rows.update(overrides)
+    df = pd.DataFrame(rows)
+    for column, spec in schema.SCHEMAS['stroke'].items():
+        df[column] = df[column].astype(object if column in overrides and isinstance(spec, Number)
+                                       else 'float64' if isinstance(spec, Number) else 'category')
+    return df
+
+
+def test_clean_keeps_and_rejects_rows_like_a_pandas_mask():
+    df = stroke_frame()
+    cleaned, rejected = schema.clean('stroke', df)
+
+    expected = (df['age'].between(0, 120) & df['gender'].isin(['Female', 'Male', 'Other'])
+                & df['hypertension'].notna())
+    assert cleaned['id'].tolist() == df.loc[expected, 'id'].astype(int).tolist()
+    assert rejected['id'].astype(int).tolist() == df.loc[~expected, 'id'].astype(int).tolist()
+    assert rejected['reason'].tolist() == ['age out of range', 'gender not one of Female, Male, Other',
+                                           'hypertension missing']
+
+
+def test_clean_types_fills_and_derives_columns():
+    cleaned, _ = schema.clean('stroke', stroke_frame())
+    assert cleaned['id'].dtype == 'int32'
+    assert cleaned['hypertension'].dtype == 'int8'
+    assert cleaned['age'].dtype == 'float32'
+    # Missing smoking statuses get the schema's label for unknown values
+    assert cleaned['smoking_status'].tolist() == ['smokes', 'formerly smoked', 'Unknown', 'never smoked']
+    assert cleaned['bmi_outlier'].tolist() == (cleaned['bmi'].astype('float64') > 60).tolist()
+
+
+def test_lenient_clean_rejects_values_that_are_not_numbers():
+    ages = ['50', 'abc', '40', '30', '61', '70', '']
+    df = stroke_frame(age=[None if a == '' else a for a in ages])
+    cleaned, rejected = schema.clean('stroke', df)
+    assert 2 not in cleaned['id'].tolist()
+    assert rejected.set_index(rejected['id'].astype(int))['reason'].to_dict()[2] == 'age not a number'
+    # A missing age is allowed, it is not a required column
+    assert np.isnan(cleaned.set_index('id').loc[7, 'age'])
+
+
+def test_survey_ranges_and_ordinals():
+    df = pd.DataFrame({
+        'age': [20.0, 30.0, 40.0],
+        'gender': ['Male', 'Female', 'Male'],
+        'exercise_duration': [150.0, 2.0, 3.0],
+        'sleep_duration': ['7 - 9 hours', '4-6 hours', 'lots'],
+        'sugary_intake': ['1-2 times', '3-4 times', '1-2 times'],
+        'junk_food': ['1-2 times', '1-2 times', '1-2 times'],
+        'stress_level': ['Never', 'Always', 'Sometimes'],
+        'family_history': ['No', 'Yes', 'No'],
+    })
+    df = df.astype({column: 'category' for column in df.columns if df[column].dtype == object})
+    cleaned, rejected = schema.clean('survey', df)
+    assert rejected['reason'].tolist() == ['sleep_duration not a range']
+    # Stored without wrapping around (int8 would turn 150 into -106)
+    assert cleaned['exercise_duration'].tolist() == [150, 2]
+    assert cleaned['sleep_duration_ordinal'].tolist() == [7, 4]
+    assert cleaned['stress_level_ordinal'].tolist() == [0, 3]
+
+
+def test_ranges_have_to_fit_the_column_type(monkeypatch):
+    monkeypatch.setitem(schema.SCHEMAS, 'bad', {'hours': Number('int8', low=0, high=168)})
+    with pytest.raises(AssertionError, match='168 does not fit in int8'):
+        schema.compile_schema('bad')
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+from sketches import KLLSketch, batch_moments, batch_sketches, combine_moments, merge_moments, std
+
+
+def groups(rows=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    values = pd.Series(rng.normal(100, 25, rows))
+    values[rng.random(rows) < 0.05] = np.nan
+    keys = pd.Series(rng.integers(0, 7, rows))
+    return values, keys
+
+
+def assert_moments_like_pandas(moments, values, keys):
+    expected = values.groupby(keys).agg(['count', 'mean', 'std'])
+    moments = moments.loc[expected.index]
+    np.testing.assert_array_equal(moments['count'], expected['count'])
+    np.testing.assert_allclose(moments['mean'], expected['mean'], rtol=1e-12)
+    np.testing.assert_allclose(std(moments), expected['std'], rtol=1e-10)
+
+
+def test_batch_moments():
+    values, keys = groups()
+    assert_moments_like_pandas(batch_moments(values, keys), values, keys)
+
+
+def test_merged_moments_match_moments_of_all_values():
+    values, keys = groups()
+    # Parts with groups missing from one side
+    first = keys < 5
+    merged = merge_moments(batch_moments(values[first], keys[first]), batch_moments(values[~first], keys[~first]))
+    assert_moments_like_pandas(merged, values, keys)
+
+
+def test_combined_moments_match_moments_of_coarser_groups():
+    values, keys = groups()
+    moments = batch_moments(values, keys)
+    coarse = moments.index % 3
+    assert_moments_like_pandas(combine_moments(moments, coarse), values, keys % 3)
+
+
+def test_std_of_single_values_is_nan():
+    moments = batch_moments(pd.Series([1.0, 2.0, 4.0]), pd.Series([0, 1, 1]))
+    assert np.isnan(std(moments)[0])
+    assert std(moments)[1] == np.std([2.0, 4.0], ddof=1)
+
+
+def rank_error(values, estimates, qs):
+    # How far the estimates' ranks are from the asked ones, as a fraction
+    values = np.sort(values)
+    ranks = np.searchsorted(values, estimates, side='right') / len(values)
+    return np.abs(ranks - qs).max()
+
+
+def test_sketch_quantiles_are_within_its_rank_error():
+    values = np.random.default_rng(1).lognormal(4, 0.5, 100_000)
+    sketch = KLLSketch(200)
+    for batch in np.array_split(values, 37):
+        sketch.update(batch)
+    qs = np.array([0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99])
+    assert sketch.count == len(values)
+    assert rank_error(values, sketch.quantiles(qs), qs) < 0.02
+    # Memory stays bounded
+    assert sum(len(c) for c in sketch.compactors) < 2000
+
+
+def test_small_sketches_are_exact():
+    values = np.arange(1.0, 101.0)
+    sketch = KLLSketch(200)
+    sketch.update(np.append(values, np.nan))
+    np.testing.assert_array_equal(sketch.quantiles([0.01, 0.5, 1.0]), [1.0, 50.0, 100.0])
+    assert np.isnan(KLLSketch().quantiles([0.5])).all()
+
+
+def test_merged_sketches_match_quantiles_of_all_values():
+    values, keys = groups(50_000)
+    values, keys = values.to_numpy(), keys.to_numpy()
+    half = len(values) // 2
+    left = batch_sketches(values[:half], keys[:half])
+    right = batch_sketches(values[half:], keys[half:])
+    qs = np.array([0.1, 0.5, 0.9])
+    for key, sketch in left.items():
+        before = sketch.copy()
+        sketch.merge(right[key])
+        group = values[(keys == key) & ~np.isnan(values)]
+        assert sketch.count == len(group)
+        assert rank_error(group, sketch.quantiles(qs), qs) < 0.02
+        # Copies are not changed by merging into the original
+        assert before.count == np.count_nonzero(~np.isnan(values[:half][keys[:half] == key]))
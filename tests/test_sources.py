@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import sources
+from aggregates import StrokeCube
+from casestore import CaseStore
+from sources import DataSource, SqlSource
+
+
+def test_sources_missing_a_method_cannot_be_created():
+    class NoRead(DataSource):
+        def version(self, name):
+            return '1'
+
+    with pytest.raises(TypeError, match='_read'):
+        NoRead()
+
+
+@pytest.fixture
+def database(tmp_path, stroke_rows):
+    # Tables holding valid rows and rows the schema rejects
+    import sqlite3
+
+    from synthetic import cases_chunk
+
+    stroke = stroke_rows.drop(columns='bmi_outlier').astype(
+        {column: object for column in stroke_rows.columns if isinstance(stroke_rows[column].dtype, pd.CategoricalDtype)})
+    stroke = stroke.astype({'age': 'float64', 'avg_glucose_level': 'float64', 'bmi': 'float64'})
+    stroke.loc[0, 'age'] = -5
+    stroke.loc[1, 'gender'] = 'Alien'
+    stroke.loc[2, 'hypertension'] = None
+    stroke.loc[3, 'bmi'] = 500
+    stroke.loc[4:30, 'smoking_status'] = None
+    cases = cases_chunk(np.random.default_rng(0), 0, 500).rename(columns={'BANDAR ': 'BANDAR'})
+    cases.loc[0, 'year'] = 1800
+    cases.loc[1, 'case'] = -1
+    path = tmp_path / 'stroke.db'
+    with sqlite3.connect(path) as connection:
+        stroke.to_sql('stroke', connection, index=False)
+        cases.to_sql('cases', connection, index=False)
+    return SqlSource('sqlite:///%s' % path)
+
+
+def test_grouped_stroke_counts_match_the_cleaned_rows(database):
+    rows = database.load('stroke')
+    assert len(rows) == 3000 - 4
+    expected = StrokeCube.from_frame(rows).cells.sort_index()
+    counts = database.stroke_counts().cells.sort_index()
+    pd.testing.assert_frame_equal(counts, expected)
+
+
+def test_grouped_case_totals_match_the_cleaned_rows(database):
+    rows = database.load('cases')
+    assert len(rows) == 500 - 2
+    grouped = database.case_store()
+    expected = CaseStore.from_frame(rows)
+    assert grouped.state_totals == expected.state_totals
+    assert grouped.city_totals == expected.city_totals
+
+
+def test_sql_condition_refuses_ranges():
+    with pytest.raises(ValueError):
+        sources.sql_condition('survey', sources._quote)
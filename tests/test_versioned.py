@@ -0,0 +1,63 @@
+from versioned import VersionedValue
+
+
+class Dataset:
+    # A list of rows that can be appended to or replaced, with a version per
+    # change and the rows added since each version
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.version = 0
+        self.appended = {}
+
+    def append(self, rows):
+        self.appended = {v: added + list(rows) for v, added in self.appended.items()}
+        self.appended[self.version] = list(rows)
+        self.rows += rows
+        self.version += 1
+
+    def replace(self, rows):
+        self.rows = list(rows)
+        self.appended = {}
+        self.version += 1
+
+    def changes(self, since):
+        return self.version, self.appended.get(since) if since != self.version else []
+
+
+def test_appended_rows_update_the_value_like_a_rebuild():
+    dataset = Dataset([1, 2, 3])
+    calls = []
+
+    def build():
+        calls.append('build')
+        return dataset.version, sum(dataset.rows)
+
+    def append(version, total, rows):
+        calls.append('append')
+        return total + sum(rows)
+
+    value = VersionedValue(build, appended=dataset.changes, append=append)
+    assert value.get() == (0, 6)
+    assert value.get() == (0, 6)
+    dataset.append([4, 5])
+    assert value.get() == (1, sum(dataset.rows))
+    dataset.replace([10, 20])
+    assert value.get() == (2, 30)
+    assert calls == ['build', 'append', 'build']
+
+
+def test_value_is_rebuilt_when_the_version_moves():
+    state = {'version': 'a', 'builds': 0}
+
+    def build():
+        state['builds'] += 1
+        return state['version'], state['version'].upper()
+
+    value = VersionedValue(build, version=lambda: state['version'])
+    assert value.current is None
+    assert value.get() == ('a', 'A')
+    assert value.get() == ('a', 'A')
+    state['version'] = 'b'
+    assert value.get() == ('b', 'B')
+    assert value.current == ('b', 'B')
+    assert state['builds'] == 2
@@ -0,0 +1,50 @@
+import threading
+
+
+class VersionedValue:
+    # A value derived from a dataset (the stroke cube, the case store, the
+    # filter index, the risk model), shared by every session and kept for the
+    # dataset's current version. Readers never lock while the version has not
+    # moved; when it has, one session brings the value up to date while the
+    # others wait for it, and all of them then read the new value.
+    #
+    # build() returns (version, value) from scratch. version() returns the
+    # dataset's current version; the value is built again whenever it moves.
+    # Values that can take appended rows pass appended(since) instead, which
+    # returns (current version, rows added since `since`, or None when the
+    # dataset changed in any other way), and append(version, value, rows),
+    # which returns a new value with the rows added. The value itself is never
+    # changed, as sessions may still be reading it.
+
+    def __init__(self, build, version=None, appended=None, append=None):
+        self._build = build
+        self._version = version
+        self._appended = appended
+        self._append = append
+        # (version, value), or None before the first get()
+        self.current = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        # (version, value) for the current version of the dataset
+        while True:
+            current = self.current
+            if current is None:
+                rows = None
+            else:
+                if self._appended is not None:
+                    version, rows = self._appended(current[0])
+                else:
+                    version, rows = self._version(), None
+                if version == current[0]:
+                    return current
+            with self._lock:
+                if self.current is not current:
+                    # Another session updated the value in the meantime
+                    continue
+                if rows is not None:
+                    value = self._append(version, current[1], rows)
+                else:
+                    version, value = self._build()
+                self.current = (version, value)
+                return self.current
@@ -0,0 +1,72 @@
+import importlib
+import os
+import sys
+import time
+
+# Start the dashboards after warming this process up:
+#
+#   python warmup.py --server.port $PORT
+#
+# Before Streamlit opens its port, the app's modules are imported, the
+# datasets loaded (writing their columnar caches if needed), the stroke
+# aggregates, filter indexes and risk model built and every chart built and
+# encoded. The server then runs in this same process, so the first viewer
+# gets the ready charts instead of paying for all of that. How long each phase
+# took is printed as a startup report. Any arguments are passed on to
+# `streamlit run`.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+APP = os.path.join(ROOT, 'GroupProject.py')
+
+
+class Phases:
+    def __init__(self):
+        self.seconds = []
+
+    def time(self, name, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.seconds.append((name, time.perf_counter() - start))
+        return result
+
+
+def warm_up():
+    # Do everything the first rerun would otherwise do, and time each phase
+    phases = Phases()
+    phases.time('import:streamlit', importlib.import_module, 'streamlit')
+    data = phases.time('import:data', importlib.import_module, 'data')
+    sources = phases.time('import:sources', importlib.import_module, 'sources')
+    filters = phases.time('import:filters', importlib.import_module, 'filters')
+    snapshot = phases.time('import:charts', importlib.import_module, 'snapshot')
+    risk = phases.time('import:risk', importlib.import_module, 'risk')
+
+    source = sources.get_source()
+    phases.time('load:datasets', source.load_all, list(data.DATA_FILES))
+    phases.time('aggregate:stroke_cube', source.stroke_cube)
+    if filters.available():
+        phases.time('index:stroke_filters', filters.stroke_filter_index)
+    phases.time('fit:risk_model', risk.risk_model)
+    phases.time('build_and_encode:charts', snapshot.warm_up)
+    return phases.seconds
+
+
+def report(phases, total):
+    print('Startup took %.2fs before accepting viewers:' % total)
+    for name, seconds in phases:
+        print('  %-32s %8.3fs' % (name, seconds))
+    sys.stdout.flush()
+
+
+def main():
+    start = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    phases = warm_up()
+    report(phases, time.perf_counter() - start)
+
+    from streamlit.web import cli
+    sys.argv = ['streamlit', 'run', APP] + sys.argv[1:]
+    cli.main()
+
+
+if __name__ == '__main__':
+    main()